@@ -5,7 +5,7 @@ from lnbits.tasks import create_permanent_unique_task
 from loguru import logger
 
 from .crud import db
-from .tasks import wait_for_paid_invoices
+from .tasks import delete_expired_orders_periodically, refresh_exchange_rates, wait_for_paid_invoices
 from .views import webshop_generic_router
 from .views_api import webshop_api_router
 
@@ -35,6 +35,10 @@ def webshop_stop():
 def webshop_start():
     task = create_permanent_unique_task("ext_webshop", wait_for_paid_invoices)
     scheduled_tasks.append(task)
+    task = create_permanent_unique_task("ext_webshop_rates", refresh_exchange_rates)
+    scheduled_tasks.append(task)
+    task = create_permanent_unique_task("ext_webshop_expired_orders", delete_expired_orders_periodically)
+    scheduled_tasks.append(task)
 
 
 __all__ = [
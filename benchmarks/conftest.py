@@ -0,0 +1,18 @@
+import pytest
+import pytest_asyncio
+from lnbits.db import DB_TYPE, SQLITE, Database
+from lnbits.settings import settings
+
+from .. import crud
+
+
+@pytest_asyncio.fixture
+async def bench_db(tmp_path, monkeypatch):
+    """A throwaway SQLite extension database wired into `crud`."""
+    if DB_TYPE != SQLITE:
+        pytest.skip("benchmarks seed a local SQLite database")
+    monkeypatch.setattr(settings, "lnbits_data_folder", str(tmp_path))
+    database = Database("ext_webshop")
+    monkeypatch.setattr(crud, "db", database)
+    yield database
+    await database.engine.dispose()
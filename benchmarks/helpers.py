@@ -0,0 +1,116 @@
+# Description: Seeding and timing helpers shared by the benchmarks.
+
+import asyncio
+import os
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+
+from lnbits.db import Database
+
+
+def bench_size(name: str, default: int) -> int:
+    """Read a benchmark size from the environment, e.g. WEBSHOP_BENCH_ORDERS."""
+    return int(os.environ.get(f"WEBSHOP_BENCH_{name.upper()}", default))
+
+
+async def seed_shops(
+    db: Database,
+    users: int,
+    shops_per_user: int,
+    user_prefix: str = "user_",
+    first_shop: int = 0,
+) -> None:
+    await db.execute(
+        """
+        WITH RECURSIVE seq(n) AS (
+            SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < :count - 1
+        )
+        INSERT INTO webshop.shop
+            (id, user_id, name, description, primary_color, secondary_color, wallet,
+             created_at, updated_at)
+        SELECT 'shop_' || (:first_shop + n), :user_prefix || (n / :shops_per_user),
+            'Shop ' || n, '', '#000', '#fff', 'wallet_' || n, 1700000000 + n, 1700000000 + n
+        FROM seq
+        """,
+        {
+            "count": users * shops_per_user,
+            "shops_per_user": shops_per_user,
+            "user_prefix": user_prefix,
+            "first_shop": first_shop,
+        },
+    )
+
+
+async def seed_orders(db: Database, orders: int, shops: int) -> None:
+    await db.execute(
+        """
+        WITH RECURSIVE seq(n) AS (
+            SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < :count - 1
+        )
+        INSERT INTO webshop.client_data
+            (id, shop_id, product, quantity, email, shipped, paid, created_at, updated_at)
+        SELECT 'order_' || n, 'shop_' || (n % :shops), 'Product ' || (n % 97), 1 + n % 5,
+            'buyer' || n || '@example.com', n % 7 = 0, n % 3 = 0,
+            1700000000 + n, 1700000000 + n
+        FROM seq
+        """,
+        {"count": orders, "shops": shops},
+    )
+
+
+async def query_plan(db: Database, query: str, values: dict | None = None) -> list[str]:
+    rows: list[dict] = await db.fetchall(f"EXPLAIN QUERY PLAN {query}", values)
+    return [row["detail"] for row in rows]
+
+
+async def measure(func: Callable[[], Awaitable], repeat: int = 50) -> dict[str, float]:
+    """Await `func` `repeat` times and return latency percentiles in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return latency_summary(samples)
+
+
+async def drive(call: Callable[[int], Awaitable], requests: int, concurrency: int) -> dict[str, float]:
+    """
+    Await `call(n)` for n in range(requests), `concurrency` at a time.
+    Returns latency percentiles in milliseconds and the throughput.
+    """
+    samples: list[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(n: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await call(n)
+            samples.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(requests)))
+    return {**latency_summary(samples), "throughput": requests / (time.perf_counter() - start)}
+
+
+def latency_summary(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+
+    def percentile(pct: float) -> float:
+        index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+        return ordered[index]
+
+    return {
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "mean": statistics.fmean(ordered),
+    }
+
+
+def format_latency(label: str, summary: dict[str, float]) -> str:
+    return f"{label:<40} p50={summary['p50']:8.3f}ms p95={summary['p95']:8.3f}ms " f"p99={summary['p99']:8.3f}ms"
+
+
+def format_load(label: str, summary: dict[str, float]) -> str:
+    return f"{format_latency(label, summary)} {summary['throughput']:8.0f}/s"
@@ -0,0 +1,71 @@
+# Description: Shipping and deleting a batch of orders one request per order,
+# as the admin UI did, versus the bulk endpoints' set-based statements.
+#
+#   uv run pytest benchmarks/test_bulk_orders.py -s
+
+import time
+
+import pytest
+
+from .. import crud
+from ..models import ClientData
+from ..tests.helpers import run_migrations
+from .helpers import bench_size, seed_orders, seed_shops
+
+
+async def _ship_one_by_one(user_id: str, ids: list[str]) -> None:
+    """What api_update_client_data does for every order."""
+    for client_data_id in ids:
+        client_data = await crud.get_client_data_by_id(client_data_id)
+        assert client_data
+        assert await crud.get_shop(user_id, client_data.shop_id)
+        await crud.update_client_data(ClientData(**{**client_data.dict(), "shipped": True}))
+
+
+async def _delete_one_by_one(user_id: str, ids: list[str]) -> None:
+    """What api_delete_client_data does for every order."""
+    for client_data_id in ids:
+        client_data = await crud.get_client_data_by_id(client_data_id)
+        assert client_data
+        shop = await crud.get_shop(user_id, client_data.shop_id)
+        assert shop
+        await crud.delete_client_data(shop.id, client_data_id)
+
+
+async def _timed(label: str, func, *args) -> None:
+    start = time.perf_counter()
+    await func(*args)
+    print(f"{label:<40} {(time.perf_counter() - start) * 1000:9.1f}ms")
+
+
+async def _shipped(ids: list[str]) -> int:
+    rows: list[dict] = await crud.db.fetchall("SELECT id FROM webshop.client_data WHERE shipped = true")
+    return len({row["id"] for row in rows}.intersection(ids))
+
+
+@pytest.mark.asyncio
+async def test_bulk_orders(bench_db):
+    orders = bench_size("orders", 10_000)
+    batch = bench_size("batch", 300)
+
+    await run_migrations(bench_db)
+    # user_0 owns shop_0..shop_4, user_1 owns shop_5..shop_9
+    await seed_shops(bench_db, 2, 5)
+    await seed_orders(bench_db, orders, 10)
+    crud.shop_cache.clear()
+    await bench_db.execute("UPDATE webshop.client_data SET shipped = false")
+
+    own = [f"order_{n}" for n in range(orders) if n % 10 < 5]
+    foreign = [f"order_{n}" for n in range(orders) if n % 10 >= 5]
+    print(f"\n{batch} of {orders} orders")
+
+    await _timed("ship, one request per order", _ship_one_by_one, "user_0", own[:batch])
+    await _timed("ship, bulk", crud.update_client_data_shipped, "user_0", own[batch : 2 * batch], True)
+    assert await _shipped(own[: 2 * batch]) == 2 * batch
+
+    assert await crud.update_client_data_shipped("user_0", foreign[:batch], True) == 0
+    assert await _shipped(foreign[:batch]) == 0
+
+    await _timed("delete, one request per order", _delete_one_by_one, "user_0", own[:batch])
+    await _timed("delete, bulk", crud.delete_client_data_bulk, "user_0", own[batch : 2 * batch])
+    assert await crud.delete_client_data_bulk("user_0", own[: 2 * batch] + foreign[:batch]) == 0
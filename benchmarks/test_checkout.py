@@ -0,0 +1,99 @@
+# Description: Checkout latency with a stubbed invoice backend, inserting the
+# order and creating the invoice one after the other versus concurrently.
+#
+#   uv run pytest benchmarks/test_checkout.py -s
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from .. import crud, pricing, services
+from ..models import CreateClientData, CreateClientDataItem
+from ..tests.helpers import run_migrations
+from .helpers import bench_size, format_latency, latency_summary, seed_shops
+
+# simulated funding source round trip in seconds
+INVOICE_LATENCY = bench_size("invoice_latency_ms", 20) / 1000
+
+
+async def _stub_invoice(**kwargs):
+    await asyncio.sleep(INVOICE_LATENCY)
+    return SimpleNamespace(bolt11="lnbc1stub", checking_id=kwargs["extra"]["client_data_id"])
+
+
+async def _inventory(inventory_id: str) -> list[dict]:
+    return [{"id": "mug", "name": "Mug", "price": 1500, "is_active": True}]
+
+
+async def _failing_invoice(**kwargs):
+    await asyncio.sleep(INVOICE_LATENCY)
+    raise ValueError("funding source unavailable")
+
+
+async def _sequential_checkout(shop_id: str, data: CreateClientData):
+    """The checkout as it was: order row first, invoice afterwards."""
+    shop = await crud.get_shop_by_id(shop_id)
+    assert shop
+    client_data = await crud.create_client_data(shop_id, data)
+    return await services.create_invoice(
+        wallet_id=shop.wallet,
+        amount=services.client_data_amount(data),
+        currency="sat",
+        memo=f"Webshop order {client_data.id}",
+        extra={"tag": "webshop", "client_data_id": client_data.id},
+    )
+
+
+def _order() -> CreateClientData:
+    return CreateClientData(
+        product="Bench order",
+        quantity=2,
+        items=[CreateClientDataItem(item_id="mug", name="Mug", quantity=2, price=1500)],
+    )
+
+
+async def _run(checkout, checkouts: int, concurrency: int) -> list[float]:
+    samples: list[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(n: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await checkout(f"shop_{n % 10}", _order())
+            samples.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one(n) for n in range(checkouts)))
+    return samples
+
+
+async def _order_count(db) -> int:
+    row = await db.fetchone("SELECT COUNT(*) AS count FROM webshop.client_data")
+    return row["count"]
+
+
+@pytest.mark.asyncio
+async def test_checkout_latency(bench_db, monkeypatch):
+    checkouts = bench_size("checkouts", 500)
+    concurrency = bench_size("concurrency", 5)
+
+    await run_migrations(bench_db)
+    await seed_shops(bench_db, 1, 10)
+    await bench_db.execute("UPDATE webshop.shop SET inventory_id = 'inventory'")
+    crud.shop_cache.clear()
+    pricing.price_indexes.clear()
+    monkeypatch.setattr(pricing, "fetch_inventory_items", _inventory)
+    monkeypatch.setattr(services, "create_invoice", _stub_invoice)
+    print(f"\n{checkouts} checkouts, {concurrency} concurrent, invoice latency {INVOICE_LATENCY * 1000:.0f}ms")
+
+    sequential = await _run(_sequential_checkout, checkouts, concurrency)
+    print(format_latency("order then invoice", latency_summary(sequential)))
+    concurrent = await _run(services.payment_request_for_client_data, checkouts, concurrency)
+    print(format_latency("order and invoice concurrently", latency_summary(concurrent)))
+
+    monkeypatch.setattr(services, "create_invoice", _failing_invoice)
+    before = await _order_count(bench_db)
+    with pytest.raises(ValueError):
+        await services.payment_request_for_client_data("shop_0", _order())
+    assert await _order_count(bench_db) == before
@@ -0,0 +1,65 @@
+# Description: Admin order listing with the set-based shop filter versus the
+# former per-shop OR clause, for users owning 1, 50 and 500 shops.
+#
+#   uv run pytest benchmarks/test_client_data_listing.py -s
+
+import pytest
+from lnbits.db import Filters, Page
+
+from .. import crud
+from ..models import ClientData, ClientDataFilters
+from ..tests.helpers import run_migrations
+from .helpers import bench_size, format_latency, measure, seed_orders, seed_shops
+
+SHOPS_PER_USER = [1, 50, 500]
+
+
+async def _legacy_client_data_page(user_id: str, filters: Filters) -> Page[ClientData]:
+    """The listing as it was: a shop id round trip, then one OR term per shop."""
+    shop_ids = await crud.get_shop_ids_by_user(user_id)
+    values = {}
+    id_clause = []
+    for i, item_id in enumerate(shop_ids):
+        id_clause.append(f"shop_id = :shop_id__{i}")
+        values[f"shop_id__{i}"] = item_id
+    return await crud.db.fetch_page(
+        "SELECT * FROM webshop.client_data",
+        where=[f"({' OR '.join(id_clause)})"],
+        values=values,
+        filters=filters,
+        model=ClientData,
+    )
+
+
+def _filters() -> Filters:
+    return Filters(limit=10, sortby="updated_at", direction="desc", model=ClientDataFilters)
+
+
+@pytest.mark.asyncio
+async def test_client_data_listing(bench_db):
+    orders = bench_size("orders", 100_000)
+
+    await run_migrations(bench_db)
+    first_shop = 0
+    for shops in SHOPS_PER_USER:
+        await seed_shops(bench_db, 1, shops, user_prefix=f"owner{shops}_", first_shop=first_shop)
+        first_shop += shops
+    await seed_orders(bench_db, orders, first_shop)
+    print(f"\nseeded {first_shop} shops and {orders} orders")
+
+    for shops in SHOPS_PER_USER:
+        user_id = f"owner{shops}_0"
+
+        async def legacy(user_id=user_id):
+            return await _legacy_client_data_page(user_id, _filters())
+
+        async def set_based(user_id=user_id):
+            return await crud.get_client_data_paginated(user_id=user_id, filters=_filters())
+
+        legacy_page = await legacy()
+        page = await set_based()
+        assert page.total == legacy_page.total
+        assert [row.id for row in page.data] == [row.id for row in legacy_page.data]
+
+        print(format_latency(f"{shops:>3} shops, OR clause", await measure(legacy, repeat=20)))
+        print(format_latency(f"{shops:>3} shops, sub-select", await measure(set_based, repeat=20)))
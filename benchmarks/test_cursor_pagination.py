@@ -0,0 +1,68 @@
+# Description: Deep pages of the admin order listing, OFFSET paging with its
+# COUNT(*) on every page versus keyset cursors counting once.
+#
+#   uv run pytest benchmarks/test_cursor_pagination.py -s
+
+import pytest
+from lnbits.db import Filters
+
+from .. import crud
+from ..helpers import encode_cursor
+from ..models import ClientDataFilters
+from ..tests.helpers import run_migrations
+from .helpers import bench_size, format_latency, measure, seed_orders, seed_shops
+
+PAGE_SIZE = 50
+
+
+def _filters(offset: int | None = None) -> Filters:
+    return Filters(
+        limit=PAGE_SIZE,
+        offset=offset,
+        sortby="updated_at",
+        direction="desc",
+        model=ClientDataFilters,
+    )
+
+
+@pytest.mark.asyncio
+async def test_cursor_pagination(bench_db):
+    orders = bench_size("orders", 100_000)
+
+    await run_migrations(bench_db)
+    await seed_shops(bench_db, 1, 10)
+    await seed_orders(bench_db, orders, 10)
+    print(f"\nseeded {orders} orders, {PAGE_SIZE} per page")
+
+    # walking every cursor page yields every order once, in offset order
+    seen: list[str] = []
+    cursor = ""
+    while True:
+        page = await crud.get_client_data_cursor_page("user_0", _filters(), cursor=cursor)
+        seen.extend(row.id for row in page.data)
+        if not page.next_cursor:
+            break
+        cursor = page.next_cursor
+    assert len(seen) == len(set(seen)) == orders
+    offset_page = await crud.get_client_data_paginated("user_0", filters=_filters(offset=PAGE_SIZE))
+    assert [row.id for row in offset_page.data] == seen[PAGE_SIZE : 2 * PAGE_SIZE]
+
+    for depth in (0.01, 0.5, 0.99):
+        offset = int(orders * depth) // PAGE_SIZE * PAGE_SIZE
+        # the cursor is taken from the row before the page, small runs have none at shallow depths
+        if not 0 < offset < orders:
+            continue
+        first = await crud.db.fetchone(
+            "SELECT updated_at, id FROM webshop.client_data WHERE id = :id", {"id": seen[offset - 1]}
+        )
+        cursor = encode_cursor("updated_at", "desc", first["updated_at"], first["id"])
+
+        async def offset_paging(offset=offset):
+            return await crud.get_client_data_paginated("user_0", filters=_filters(offset=offset))
+
+        async def cursor_paging(cursor=cursor):
+            return await crud.get_client_data_cursor_page("user_0", _filters(), cursor=cursor)
+
+        assert [row.id for row in (await cursor_paging()).data] == [row.id for row in (await offset_paging()).data]
+        print(format_latency(f"offset {offset:>7} + count", await measure(offset_paging, repeat=10)))
+        print(format_latency(f"cursor at row {offset:>7}", await measure(cursor_paging, repeat=10)))
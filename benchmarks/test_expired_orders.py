@@ -0,0 +1,77 @@
+# Description: Deleting the unpaid orders of abandoned checkouts in chunks,
+# how long other queries wait meanwhile, and the shop stats staying in step.
+#
+#   uv run pytest benchmarks/test_expired_orders.py -s
+
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from .. import crud
+from ..tests.helpers import run_migrations
+from .helpers import bench_size, format_latency, latency_summary, seed_orders, seed_shops
+
+
+async def _count(db, where: str = "true") -> int:
+    row = await db.fetchone(f"SELECT COUNT(*) AS count FROM webshop.client_data WHERE {where}")
+    return row["count"]
+
+
+@pytest.mark.asyncio
+async def test_expired_orders(bench_db):
+    orders = bench_size("orders", 100_000)
+
+    await run_migrations(bench_db)
+    await seed_shops(bench_db, 1, 4)
+    # seeded orders are placed a second apart from 1700000000, a third of them paid
+    await seed_orders(bench_db, orders, 4)
+    # all of them invoiced at checkout
+    await bench_db.execute("UPDATE webshop.client_data SET amount_sat = 1000")
+    await bench_db.execute(
+        """
+        INSERT INTO webshop.order_items (id, client_data_id, shop_id, name, quantity, price)
+        SELECT 'item_' || id, id, shop_id, product, quantity, 1000 FROM webshop.client_data
+        """
+    )
+    await crud.rebuild_shop_stats()
+    unpaid = await _count(bench_db, "paid = false")
+    print(f"\n{orders} orders over 4 shops, {unpaid} unpaid")
+
+    # only the unpaid orders of the first half are old enough, shipped ones are kept
+    cutoff = datetime.fromtimestamp(1700000000 + orders // 2, timezone.utc)
+    expired = await _count(bench_db, f"paid = false AND shipped = false AND created_at < {1700000000 + orders // 2}")
+
+    waits: list[float] = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await crud.get_client_data_by_id("order_1")
+            waits.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0.001)
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    deleted = await crud.delete_expired_client_data(cutoff)
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+
+    assert deleted == expired
+    assert await _count(bench_db) == orders - expired
+    assert await _count(bench_db, "paid = true") == orders - unpaid
+    items = await bench_db.fetchone("SELECT COUNT(*) AS count FROM webshop.order_items")
+    assert items["count"] == orders - expired
+    print(f"deleted {deleted} expired orders in {elapsed * 1000:.0f}ms, {crud.EXPIRED_ORDERS_PER_DELETE} per chunk")
+    print(format_latency("concurrent order lookup", latency_summary(waits)))
+
+    # the stats were adjusted in step with the deletes
+    adjusted = [await crud.get_shop_stats(f"shop_{i}", days=100_000) for i in range(4)]
+    await crud.rebuild_shop_stats()
+    assert [await crud.get_shop_stats(f"shop_{i}", days=100_000) for i in range(4)] == adjusted
+    assert sum(stats.orders for stats in adjusted) == orders - expired
+
+    assert await crud.delete_expired_client_data(cutoff) == 0
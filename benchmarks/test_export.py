@@ -0,0 +1,60 @@
+# Description: Streaming order export, time and peak Python memory for
+# growing order counts. Peak memory should stay flat as the orders grow.
+#
+#   uv run pytest benchmarks/test_export.py -s
+
+import csv
+import io
+import json
+import time
+import tracemalloc
+
+import pytest
+
+from ..export import export_client_data
+from ..tests.helpers import run_migrations
+from .helpers import bench_size, seed_orders, seed_shops
+
+
+async def _export(user_id: str, fmt) -> tuple[int, int, float]:
+    """Consume an export, returning bytes, peak traced memory and seconds."""
+    size = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    async for chunk in export_client_data(user_id, fmt=fmt):
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, peak, elapsed
+
+
+@pytest.mark.asyncio
+async def test_export_memory(bench_db):
+    orders = bench_size("orders", 20_000)
+
+    await run_migrations(bench_db)
+    await seed_shops(bench_db, 1, 10)
+    await seed_orders(bench_db, orders, 10)
+    await bench_db.execute(
+        """
+        INSERT INTO webshop.order_items (id, client_data_id, shop_id, item_id, name, quantity, price)
+        SELECT 'item_' || id, id, shop_id, 'product', product, quantity, 1000 FROM webshop.client_data
+        """
+    )
+
+    chunks = [chunk async for chunk in export_client_data("user_0", fmt="csv")]
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert len(rows) == orders
+    assert len({row["id"] for row in rows}) == orders
+    assert rows[0]["items"].endswith("@ 1000.0")
+    last = [chunk async for chunk in export_client_data("user_0", fmt="ndjson")][-1]
+    assert json.loads(last.splitlines()[-1])["items"][0]["price"] == 1000
+
+    print()
+    for fmt in ("csv", "ndjson"):
+        size, peak, elapsed = await _export("user_0", fmt)
+        print(
+            f"{fmt:<7} {orders} orders: {size / 1e6:7.1f}MB in {elapsed:6.2f}s "
+            f"({orders / elapsed:8.0f} orders/s), peak memory {peak / 1e6:6.2f}MB"
+        )
@@ -0,0 +1,73 @@
+# Description: Query plans and latency of the order hot paths before and after m007.
+#
+#   uv run pytest benchmarks/test_indexes.py -s
+#   WEBSHOP_BENCH_ORDERS=500000 uv run pytest benchmarks/test_indexes.py -s
+
+import pytest
+
+from ..tests.helpers import run_migrations
+from .helpers import (
+    bench_size,
+    format_latency,
+    measure,
+    query_plan,
+    seed_orders,
+    seed_shops,
+)
+
+HOT_QUERIES: dict[str, tuple[str, dict]] = {
+    "shop ids by user": (
+        "SELECT DISTINCT id FROM webshop.shop WHERE user_id = :user_id",
+        {"user_id": "user_1"},
+    ),
+    "shop list by user": (
+        "SELECT * FROM webshop.shop WHERE user_id = :user_id ORDER BY updated_at desc LIMIT 10",
+        {"user_id": "user_1"},
+    ),
+    "orders by shop": (
+        "SELECT * FROM webshop.client_data WHERE shop_id = :shop_id ORDER BY updated_at desc LIMIT 10",
+        {"shop_id": "shop_7"},
+    ),
+    "orders count by shop": (
+        "SELECT COUNT(*) AS count FROM webshop.client_data WHERE shop_id = :shop_id",
+        {"shop_id": "shop_7"},
+    ),
+    "paid orders by shop": (
+        "SELECT * FROM webshop.client_data WHERE shop_id = :shop_id AND paid = :paid "
+        "ORDER BY created_at desc LIMIT 10",
+        {"shop_id": "shop_7", "paid": True},
+    ),
+}
+
+
+async def _report(db, label: str) -> dict[str, list[str]]:
+    plans = {}
+    print(f"\n--- {label} ---")
+    for name, (query, values) in HOT_QUERIES.items():
+        plans[name] = await query_plan(db, query, values)
+
+        async def run(query=query, values=values):
+            await db.fetchall(query, values)
+
+        print(format_latency(name, await measure(run, repeat=20)))
+        print(f"{'':<40} plan: {' | '.join(plans[name])}")
+    return plans
+
+
+@pytest.mark.asyncio
+async def test_order_indexes(bench_db):
+    orders = bench_size("orders", 100_000)
+    users = bench_size("users", 20)
+    shops_per_user = bench_size("shops_per_user", 5)
+
+    await run_migrations(bench_db, until=6)
+    await seed_shops(bench_db, users, shops_per_user)
+    await seed_orders(bench_db, orders, users * shops_per_user)
+    print(f"\nseeded {users * shops_per_user} shops and {orders} orders")
+
+    await _report(bench_db, "before m007 (primary keys only)")
+    await run_migrations(bench_db, after=6, until=7)
+    plans = await _report(bench_db, "after m007")
+
+    for name, plan in plans.items():
+        assert any("INDEX" in step for step in plan), f"{name} does not use an index"
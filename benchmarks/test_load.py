@@ -0,0 +1,170 @@
+# Description: Load test of the hot paths through the HTTP API: storefront
+# page, public checkout, order listing and invoice settlement. Runs offline,
+# the invoice backend and the invoice listener are stubbed.
+#
+#   uv run pytest benchmarks/test_load.py -s
+#   WEBSHOP_BENCH_REQUESTS=2000 WEBSHOP_BENCH_CONCURRENCY=50 uv run pytest benchmarks/test_load.py -s
+
+import asyncio
+import time
+from contextlib import suppress
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from lnbits.decorators import check_admin, check_user_exists
+from starlette.templating import Jinja2Templates
+
+from .. import crud, pricing, services, tasks, views, webshop_ext
+from ..tests.helpers import run_migrations
+from .helpers import bench_size, drive, format_load, seed_orders, seed_shops
+
+# simulated funding source round trip in seconds
+INVOICE_LATENCY = bench_size("invoice_latency_ms", 20) / 1000
+
+
+async def _stub_invoice(**kwargs):
+    await asyncio.sleep(INVOICE_LATENCY)
+    return SimpleNamespace(bolt11="lnbc1stub", checking_id=kwargs["extra"]["client_data_id"])
+
+
+async def _inventory(inventory_id: str) -> list[dict]:
+    return [{"id": "mug", "name": "Mug", "price": 1500, "is_active": True}]
+
+
+def _payment(client_data_id: str):
+    return SimpleNamespace(payment_hash=client_data_id, extra={"tag": "webshop", "client_data_id": client_data_id})
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(webshop_ext)
+    # the user of shop_0 to shop_9
+    app.dependency_overrides[check_user_exists] = lambda: SimpleNamespace(id="user_0")
+    app.dependency_overrides[check_admin] = lambda: SimpleNamespace(id="admin")
+
+    async def value_error(request: Request, exc: Exception) -> JSONResponse:
+        return JSONResponse({"detail": str(exc)}, status_code=400)
+
+    app.add_exception_handler(ValueError, value_error)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_load(bench_db, monkeypatch):
+    orders = bench_size("orders", 50_000)
+    requests = bench_size("requests", 500)
+    concurrency = bench_size("concurrency", 10)
+
+    await run_migrations(bench_db)
+    await seed_shops(bench_db, 10, 10)
+    await seed_orders(bench_db, orders, 100)
+    # the limits are not what is measured here
+    await bench_db.execute(
+        """
+        UPDATE webshop.shop
+        SET inventory_id = 'inventory', checkout_rate_limit = 1000000, checkout_concurrency = 1000
+        """
+    )
+    crud.shop_cache.clear()
+    pricing.price_indexes.clear()
+    views.page_cache.clear()
+    services.checkout_cache.clear()
+    monkeypatch.setattr(
+        views, "webshop_renderer", lambda: Jinja2Templates(directory=Path(views.__file__).parent / "templates")
+    )
+    monkeypatch.setattr(pricing, "fetch_inventory_items", _inventory)
+    monkeypatch.setattr(services, "create_invoice", _stub_invoice)
+    print(
+        f"\n{orders} orders over 100 shops, {requests} requests per path, {concurrency} concurrent, "
+        f"invoice latency {INVOICE_LATENCY * 1000:.0f}ms"
+    )
+
+    transport = httpx.ASGITransport(app=_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def expect(response_call, status: int = 200) -> httpx.Response:
+            response = await response_call
+            assert response.status_code == status, response.text
+            return response
+
+        async def public_page(n: int):
+            await expect(client.get(f"/webshop/shop_{n % 100}", headers={"Accept-Encoding": "gzip"}))
+
+        print(format_load("storefront page", await drive(public_page, requests, concurrency)))
+
+        placed: list[str] = []
+
+        async def checkout(n: int):
+            response = await expect(
+                client.put(
+                    f"/webshop/api/v1/client_data/public/shop_{n % 100}",
+                    json={
+                        "product": "Mug",
+                        "quantity": 1,
+                        "items": [{"item_id": "mug", "name": "Mug", "quantity": 1, "price": 1500}],
+                    },
+                )
+            )
+            placed.append(response.json()["client_data_id"])
+
+        print(format_load("public checkout", await drive(checkout, requests, concurrency)))
+
+        async def offset_page(n: int):
+            await expect(
+                client.get(f"/webshop/api/v1/client_data/paginated?limit=20&offset={n % 50 * 20}&sortby=updated_at")
+            )
+
+        async def cursor_page(n: int):
+            await expect(
+                client.get(
+                    "/webshop/api/v1/client_data/paginated?limit=20&sortby=updated_at&cursor=&include_total=false"
+                )
+            )
+
+        print(format_load("orders page, offset and total", await drive(offset_page, requests, concurrency)))
+        print(format_load("orders page, cursor", await drive(cursor_page, requests, concurrency)))
+
+        # every route above is in the scraped histograms
+        metrics = (await expect(client.get("/webshop/api/v1/metrics"))).text
+        for route in ("/{shop_id}", "/api/v1/client_data/public/{shop_id}", "/api/v1/client_data/paginated"):
+            assert f'route="/webshop{route}",status="200"' in metrics
+
+    # settlement of single invoices, as tasks.on_invoice_paid
+    single, batched = placed[: len(placed) // 2], placed[len(placed) // 2 :]
+
+    async def settle(n: int):
+        await tasks.on_invoice_paid(_payment(single[n]))
+
+    print(format_load("on_invoice_paid", await drive(settle, len(single), concurrency)))
+
+    # the settlement workers, fed through a stubbed invoice listener
+    queues: list[asyncio.Queue] = []
+    monkeypatch.setattr(tasks, "register_invoice_listener", lambda queue, name: queues.append(queue))
+    monkeypatch.setattr(tasks, "settlement_metrics", tasks.SettlementMetrics())
+    listener = asyncio.create_task(tasks.wait_for_paid_invoices())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    for client_data_id in batched:
+        queues[0].put_nowait(_payment(client_data_id))
+    while tasks.settlement_metrics.payments < len(batched):
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    listener.cancel()
+    with suppress(asyncio.CancelledError):
+        await listener
+    metrics = tasks.settlement_metrics.snapshot()
+    print(
+        f"{'settlement workers':<40} p50={metrics['latency_p50'] * 1000:8.3f}ms "
+        f"p95={metrics['latency_p95'] * 1000:8.3f}ms {len(batched) / elapsed:>18.0f}/s "
+        f"in {metrics['batches']} batches"
+    )
+
+    # seeded orders carry no amount, the ones placed here do
+    paid = await bench_db.fetchone(
+        "SELECT COUNT(*) AS count FROM webshop.client_data WHERE paid = true AND amount_sat IS NOT NULL"
+    )
+    assert paid["count"] == len(placed) == requests
@@ -0,0 +1,42 @@
+# Description: Bytes sent per storefront page view, with the page script and
+# styles served as separately cached static assets.
+#
+#   uv run pytest benchmarks/test_public_page_bytes.py -s
+
+import gzip
+from pathlib import Path
+
+from starlette.templating import Jinja2Templates
+
+from .. import views
+from ..models import Shop
+
+
+def test_public_page_bytes(monkeypatch):
+    monkeypatch.setattr(
+        views, "webshop_renderer", lambda: Jinja2Templates(directory=Path(views.__file__).parent / "templates")
+    )
+    shop = Shop(
+        id="shop_0",
+        user_id="user_0",
+        name="Bench shop",
+        description="A shop",
+        primary_color="#1c56ac",
+        secondary_color="#0bb6d5",
+        wallet="wallet_0",
+        inventory_id="inventory_0",
+    )
+    page = views.render_public_page(shop)
+    html = page.bodies["identity"]
+    assets = {path: (views.STATIC_DIR / path).read_bytes() for path in views.PUBLIC_PAGE_ASSETS}
+    inlined = html + b"".join(assets.values())
+
+    def sizes(body: bytes) -> str:
+        return f"{len(body):>8} bytes ({len(gzip.compress(body, compresslevel=9)):>6} gzip)"
+
+    print()
+    print(f"{'html per page view':<36}{sizes(html)}")
+    for path, body in assets.items():
+        print(f"{path + ' (cached once)':<36}{sizes(body)}")
+    print(f"{'first visit, html + assets':<36}{sizes(inlined)}")
+    assert len(html) < 16 * 1024
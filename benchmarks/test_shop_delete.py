@@ -0,0 +1,65 @@
+# Description: Deleting a large shop's orders in chunks, and how long other
+# queries wait for the database meanwhile. Also purges orphaned orders.
+#
+#   uv run pytest benchmarks/test_shop_delete.py -s
+
+import asyncio
+import time
+
+import pytest
+
+from .. import crud
+from ..tests.helpers import run_migrations
+from .helpers import bench_size, format_latency, latency_summary, seed_orders, seed_shops
+
+
+async def _count(db, table: str) -> int:
+    row = await db.fetchone(f"SELECT COUNT(*) AS count FROM webshop.{table}")
+    return row["count"]
+
+
+@pytest.mark.asyncio
+async def test_shop_delete(bench_db):
+    orders = bench_size("orders", 100_000)
+
+    await run_migrations(bench_db)
+    await seed_shops(bench_db, 1, 4)
+    await seed_orders(bench_db, orders, 4)
+    await bench_db.execute(
+        """
+        INSERT INTO webshop.order_items (id, client_data_id, shop_id, name, quantity, price)
+        SELECT 'item_' || id, id, shop_id, product, quantity, 1000 FROM webshop.client_data
+        """
+    )
+    print(f"\n{orders} orders over 4 shops")
+
+    # other requests keep reading while shop_0 is cleared
+    waits: list[float] = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await crud.get_client_data_by_id("order_1")
+            waits.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0.001)
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    deleted = await crud.delete_shop_client_data("shop_0")
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+
+    assert deleted == orders // 4
+    assert await _count(bench_db, "client_data") == orders - orders // 4
+    assert await _count(bench_db, "order_items") == orders - orders // 4
+    print(f"deleted {deleted} orders in {elapsed * 1000:.0f}ms, {crud.DELETE_CHUNK_SIZE} per statement")
+    print(format_latency("concurrent order lookup", latency_summary(waits)))
+
+    # shop_1 vanishes without its orders, the purge finds them
+    await bench_db.execute("DELETE FROM webshop.shop WHERE id = 'shop_1'")
+    purged = await crud.purge_orphaned_client_data()
+    assert purged == (orders // 4, orders // 4)
+    assert await crud.purge_orphaned_client_data() == (0, 0)
+    print(f"purged {purged[0]} orphaned orders and {purged[1]} items")
@@ -0,0 +1,76 @@
+# Description: Shop stats read from the summary tables against aggregating
+# the orders table, and the incremental rollups against a rebuild.
+#
+#   uv run pytest benchmarks/test_shop_stats.py -s
+
+import time
+
+import pytest
+
+from .. import crud
+from ..models import CreateClientData, CreateClientDataItem
+from ..tests.helpers import run_migrations
+from .helpers import bench_size, format_latency, measure, seed_orders, seed_shops
+
+
+@pytest.mark.asyncio
+async def test_shop_stats(bench_db):
+    orders = bench_size("orders", 100_000)
+
+    await run_migrations(bench_db)
+    await seed_shops(bench_db, 1, 4)
+    await seed_orders(bench_db, orders, 4)
+    await bench_db.execute(
+        """
+        INSERT INTO webshop.order_items (id, client_data_id, shop_id, name, quantity, price)
+        SELECT 'item_' || id, id, shop_id, product, quantity, 1000 FROM webshop.client_data
+        """
+    )
+    print(f"\n{orders} orders over 4 shops")
+
+    start = time.perf_counter()
+    assert await crud.rebuild_shop_stats() == 4
+    print(f"rebuilt the stats of every shop in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    async def scan():
+        await bench_db.fetchone(
+            """
+            SELECT COUNT(*), SUM(CASE WHEN paid THEN 1 ELSE 0 END), SUM(COALESCE(amount_sat, 0))
+            FROM webshop.client_data WHERE shop_id = 'shop_0'
+            """
+        )
+        await bench_db.fetchall(
+            """
+            SELECT name, SUM(order_items.quantity) AS quantity FROM webshop.order_items
+            JOIN webshop.client_data ON client_data.id = order_items.client_data_id
+            WHERE order_items.shop_id = 'shop_0' AND client_data.paid = true
+            GROUP BY name ORDER BY quantity DESC LIMIT 10
+            """
+        )
+
+    stats = await crud.get_shop_stats("shop_0")
+    assert stats.orders == orders // 4
+    assert len(stats.top_products) == crud.STATS_TOP_PRODUCTS
+    print(format_latency("aggregate the orders", await measure(scan, repeat=10)))
+    print(format_latency("read the summary tables", await measure(lambda: crud.get_shop_stats("shop_0"))))
+
+    # orders placed and paid through crud keep the summary tables in step with a rebuild
+    placed = []
+    for i in range(20):
+        data = CreateClientData(
+            product=f"Product {i % 3}",
+            quantity=1 + i % 2,
+            items=[CreateClientDataItem(name=f"Product {i % 3}", quantity=1 + i % 2, price=500)],
+        )
+        client_data = await crud.create_client_data("shop_1", data, amount=500 * (1 + i % 2), amount_sat=100)
+        placed.append(client_data.id)
+    assert await crud.update_client_data_paid(placed[0])
+    assert not await crud.update_client_data_paid(placed[0])
+    assert len(await crud.mark_client_data_paid(placed[:10])) == 9
+
+    incremental = await crud.get_shop_stats("shop_1")
+    await crud.rebuild_shop_stats("shop_1")
+    assert await crud.get_shop_stats("shop_1") == incremental
+    assert incremental.days[-1].orders == 20
+    assert incremental.days[-1].paid_orders == 10
+    assert incremental.days[-1].revenue_sat == 1000
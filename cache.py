@@ -0,0 +1,130 @@
+# Description: A bounded in-process cache for hot read paths.
+
+import asyncio
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from time import monotonic
+from typing import Any, NamedTuple
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    size: int
+    expiry: float
+
+
+class LRUCache:
+    """
+    Least-recently-used cache with a per entry time to live.
+    Bounded by number of entries and, optionally, by the summed `size` of the
+    entries (e.g. the length of a serialized body in bytes).
+    """
+
+    def __init__(self, max_entries: int = 1024, max_size: int | None = None, ttl: float = 60) -> None:
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Any, CacheEntry] = OrderedDict()
+        self._loading: dict[Any, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Any) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry.expiry > monotonic()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry.expiry <= monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def set(self, key: Any, value: Any, size: int = 1, ttl: float | None = None) -> None:
+        if key in self._entries:
+            self._remove(key)
+        if self.max_size is not None and size > self.max_size:
+            # would evict everything else and still not fit
+            return
+        expiry = monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = CacheEntry(value, size, expiry)
+        self.size += size
+        while len(self._entries) > self.max_entries or (self.max_size is not None and self.size > self.max_size):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        self._loading.pop(key, None)
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._remove(key)
+        return entry.value
+
+    def clear(self) -> None:
+        self._loading.clear()
+        self._entries.clear()
+        self.size = 0
+
+    async def get_or_load(
+        self,
+        key: Any,
+        loader: Callable[[], Awaitable[Any]],
+        sizeof: Callable[[Any], int] | None = None,
+    ) -> Any:
+        """
+        Return the cached value or await `loader` to fill it.
+        Concurrent misses for the same key share a single `loader` call.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        loading = self._loading.get(key)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            value = await loader()
+            # skip caching when the key was invalidated while loading
+            if value is not None and self._loading.get(key) is future:
+                self.set(key, value, size=sizeof(value) if sizeof else 1)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # mark retrieved, waiters (if any) re-raise it themselves
+            future.exception()
+            raise
+        finally:
+            if self._loading.get(key) is future:
+                self._loading.pop(key)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: Any) -> None:
+        entry = self._entries.pop(key)
+        self.size -= entry.size
@@ -1,38 +1,86 @@
-import json
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any
 
 # Description: This file contains the CRUD operations for talking to the database.
-from lnbits.db import Database, Filters, Page
+from lnbits.db import SQLITE, Connection, Database, Filters, Page, TModel, dict_to_model
 from lnbits.helpers import urlsafe_short_hash
-
-from .models import ClientData, ClientDataFilters, CreateClientData, CreateShop, Shop, ShopFilters
+from loguru import logger
+
+from .cache import LRUCache
+from .helpers import decode_cursor, encode_cursor, timestamp_to_datetime
+from .metrics import timed_query
+from .models import (
+    ClientData,
+    ClientDataFilters,
+    CreateClientData,
+    CreateClientDataItem,
+    CreateShop,
+    CursorPage,
+    DailyStats,
+    OrderItem,
+    ProductStats,
+    Shop,
+    ShopFilters,
+    ShopStats,
+)
 
 db = Database("ext_webshop")
 
+SHOP_CACHE_TTL = 300
+SHOP_CACHE_MAX_ENTRIES = 4096
+# rows per statement when deleting many orders, bounds how long one holds the database
+DELETE_CHUNK_SIZE = 1000
+# 7 bound values per row, stays below SQLite's default limit of 999 variables
+ORDER_ITEMS_PER_INSERT = 100
+# expired orders deleted per chunk, one bound value each
+EXPIRED_ORDERS_PER_DELETE = 500
+# at most 6 bound values per row
+STATS_ROWS_PER_UPSERT = 100
+# ids per statement of the bulk order updates, plus a couple of other bound values
+BULK_IDS_PER_STATEMENT = 500
+STATS_TOP_PRODUCTS = 10
+STATS_TABLES = ("shop_stats", "shop_daily_stats", "product_stats")
+
+# every stored column of an order but the legacy items column, which older
+# clients left double-encoded JSON in, the line items live in webshop.order_items
+CLIENT_DATA_COLUMNS = ", ".join(
+    name for name, field in ClientData.__fields__.items() if not field.field_info.extra.get("no_database")
+)
+
+# shops by id, invalidated by `update_shop` and `delete_shop`
+shop_cache = LRUCache(max_entries=SHOP_CACHE_MAX_ENTRIES, ttl=SHOP_CACHE_TTL)
+
 
 ########################### Shop ############################
+@timed_query
 async def create_shop(user_id: str, data: CreateShop) -> Shop:
     shop = Shop(**data.dict(), id=urlsafe_short_hash(), user_id=user_id)
     await db.insert("webshop.shop", shop)
     return shop
 
 
+@timed_query
 async def get_shop(
     user_id: str,
     shop_id: str,
 ) -> Shop | None:
-    return await db.fetchone(
-        """
-            SELECT * FROM webshop.shop
-            WHERE id = :id AND user_id = :user_id
-        """,
-        {"id": shop_id, "user_id": user_id},
-        Shop,
-    )
+    shop = await get_shop_by_id(shop_id)
+    if not shop or shop.user_id != user_id:
+        return None
+    return shop
 
 
+@timed_query
 async def get_shop_by_id(
     shop_id: str,
 ) -> Shop | None:
+    shop = await shop_cache.get_or_load(shop_id, lambda: _fetch_shop_by_id(shop_id))
+    # hand out copies so callers can not alter the cached instance
+    return shop.copy() if shop else None
+
+
+async def _fetch_shop_by_id(shop_id: str) -> Shop | None:
     return await db.fetchone(
         """
             SELECT * FROM webshop.shop
@@ -43,6 +91,7 @@ async def get_shop_by_id(
     )
 
 
+@timed_query
 async def get_shop_ids_by_user(
     user_id: str,
 ) -> list[str]:
@@ -57,6 +106,13 @@ async def get_shop_ids_by_user(
     return [row["id"] for row in rows]
 
 
+@timed_query
+async def get_shop_currencies() -> list[str]:
+    rows: list[dict] = await db.fetchall("SELECT DISTINCT currency FROM webshop.shop")
+    return [row["currency"] for row in rows if row["currency"]]
+
+
+@timed_query
 async def get_shop_paginated(
     user_id: str | None = None,
     filters: Filters[ShopFilters] | None = None,
@@ -76,11 +132,33 @@ async def get_shop_paginated(
     )
 
 
+@timed_query
+async def get_shop_cursor_page(
+    user_id: str,
+    filters: Filters[ShopFilters],
+    cursor: str = "",
+    include_total: bool = False,
+) -> CursorPage[Shop]:
+    return await _fetch_cursor_page(
+        "webshop.shop",
+        where=["user_id = :user_id"],
+        values={"user_id": user_id},
+        filters=filters,
+        model=Shop,
+        cursor=cursor,
+        include_total=include_total,
+    )
+
+
+@timed_query
 async def update_shop(data: Shop) -> Shop:
+    data.updated_at = datetime.now(timezone.utc)
     await db.update("webshop.shop", data)
+    shop_cache.pop(data.id)
     return data
 
 
+@timed_query
 async def delete_shop(user_id: str, shop_id: str) -> None:
     await db.execute(
         """
@@ -89,28 +167,196 @@ async def delete_shop(user_id: str, shop_id: str) -> None:
         """,
         {"id": shop_id, "user_id": user_id},
     )
+    shop_cache.pop(shop_id)
+
+
+@timed_query
+async def delete_shop_client_data(shop_id: str) -> int:
+    """
+    Delete every order of a shop with its items. Returns the number of
+    orders deleted.
+    """
+    await _delete_in_chunks("webshop.order_items", "shop_id = :shop_id", {"shop_id": shop_id})
+    deleted = await _delete_in_chunks("webshop.client_data", "shop_id = :shop_id", {"shop_id": shop_id})
+    await delete_shop_stats(shop_id)
+    return deleted
+
+
+@timed_query
+async def purge_orphaned_client_data() -> tuple[int, int]:
+    """
+    Delete the orders, and their items, whose shop no longer exists.
+    Returns the number of orders and of items deleted.
+    """
+    items = await _delete_in_chunks(
+        "webshop.order_items",
+        "NOT EXISTS (SELECT 1 FROM webshop.shop WHERE shop.id = candidate.shop_id)"
+        " OR NOT EXISTS (SELECT 1 FROM webshop.client_data WHERE client_data.id = candidate.client_data_id)",
+    )
+    orders = await _delete_in_chunks(
+        "webshop.client_data",
+        "NOT EXISTS (SELECT 1 FROM webshop.shop WHERE shop.id = candidate.shop_id)",
+    )
+    for table in STATS_TABLES:
+        await db.execute(
+            f"""
+                DELETE FROM webshop.{table}
+                WHERE NOT EXISTS (SELECT 1 FROM webshop.shop WHERE shop.id = {table}.shop_id)
+            """
+        )
+    return orders, items
+
+
+@timed_query
+async def delete_expired_client_data(before: datetime) -> int:
+    """
+    Delete the unpaid, unshipped checkout orders placed before `before`,
+    with their items, and take them out of the shop stats. Orders added by
+    the merchant have no invoice and are kept. Works EXPIRED_ORDERS_PER_DELETE orders
+    at a time and yields the event loop between chunks. Returns the number
+    of orders deleted.
+    """
+    deleted = 0
+    while True:
+        async with db.connect() as conn:
+            orders: list[dict] = await conn.fetchall(
+                f"""
+                    SELECT id FROM webshop.client_data
+                    WHERE paid = false AND shipped = false AND amount_sat IS NOT NULL
+                        AND created_at < {db.timestamp_placeholder("before")}
+                    LIMIT :chunk_size
+                """,
+                {"before": int(before.timestamp()), "chunk_size": EXPIRED_ORDERS_PER_DELETE},
+            )
+            if orders:
+                await _remove_from_stats(conn, [order["id"] for order in orders])
+                values = {f"id__{i}": order["id"] for i, order in enumerate(orders)}
+                id_list = ", ".join(f":{key}" for key in values)
+                await conn.execute(f"DELETE FROM webshop.order_items WHERE client_data_id IN ({id_list})", values)
+                await conn.execute(f"DELETE FROM webshop.client_data WHERE id IN ({id_list})", values)
+        deleted += len(orders)
+        if len(orders) < EXPIRED_ORDERS_PER_DELETE:
+            return deleted
+        await asyncio.sleep(0)
+
+
+async def _delete_in_chunks(table: str, where: str, values: dict | None = None) -> int:
+    """
+    Delete the rows of `table` matching `where`, with the table aliased as
+    `candidate`, DELETE_CHUNK_SIZE at a time. Each chunk is its own statement
+    and the event loop is yielded after it, so other requests get the
+    database between chunks. Returns the number of rows deleted.
+    """
+    deleted = 0
+    while True:
+        result = await db.execute(
+            f"""
+                DELETE FROM {table} WHERE id IN (
+                    SELECT candidate.id FROM {table} AS candidate WHERE {where} LIMIT :chunk_size
+                )
+            """,
+            {**(values or {}), "chunk_size": DELETE_CHUNK_SIZE},
+        )
+        deleted += result.rowcount
+        if result.rowcount < DELETE_CHUNK_SIZE:
+            return deleted
+        await asyncio.sleep(0)
 
 
 ################################# Client Data ###########################
 
 
-async def create_client_data(shop_id: str, data: CreateClientData) -> ClientData:
-    payload = data.dict()
-    # store items as JSON string to avoid insertion issues
-    if payload.get("items") is not None:
-        payload["items"] = json.dumps(payload["items"])
-    client_data = ClientData(**payload, id=urlsafe_short_hash(), shop_id=shop_id)
-    await db.insert("webshop.client_data", client_data)
+@timed_query
+async def create_client_data(
+    shop_id: str,
+    data: CreateClientData,
+    client_data_id: str | None = None,
+    currency: str | None = None,
+    amount: float | None = None,
+    amount_sat: int | None = None,
+) -> ClientData:
+    client_data = ClientData(
+        **data.dict(exclude={"items"}),
+        id=client_data_id or urlsafe_short_hash(),
+        shop_id=shop_id,
+        currency=currency,
+        amount=amount,
+        amount_sat=amount_sat,
+    )
+    async with db.connect() as conn:
+        await conn.insert("webshop.client_data", client_data)
+        await _insert_order_items(conn, client_data, data.items or [])
+        await _add_to_stats(conn, "shop_stats", ("shop_id",), [{"shop_id": shop_id, "orders": 1}])
+        await _add_to_stats(
+            conn,
+            "shop_daily_stats",
+            ("shop_id", "day"),
+            [{"shop_id": shop_id, "day": _stats_day(client_data.created_at), "orders": 1}],
+        )
     return client_data
 
 
+async def _insert_order_items(conn: Connection, client_data: ClientData, items: list[CreateClientDataItem]) -> None:
+    """Insert the line items of an order, ORDER_ITEMS_PER_INSERT rows per statement."""
+    for start in range(0, len(items), ORDER_ITEMS_PER_INSERT):
+        rows = []
+        values: dict = {"client_data_id": client_data.id, "shop_id": client_data.shop_id}
+        for i, item in enumerate(items[start : start + ORDER_ITEMS_PER_INSERT]):
+            rows.append(
+                f"(:id__{i}, :client_data_id, :shop_id, :item_id__{i}, :name__{i}, :quantity__{i}, :price__{i})"
+            )
+            values[f"id__{i}"] = urlsafe_short_hash()
+            values[f"item_id__{i}"] = item.item_id
+            values[f"name__{i}"] = item.name
+            values[f"quantity__{i}"] = item.quantity
+            values[f"price__{i}"] = item.price
+        await conn.execute(
+            f"""
+                INSERT INTO webshop.order_items
+                    (id, client_data_id, shop_id, item_id, name, quantity, price)
+                VALUES {", ".join(rows)}
+            """,
+            values,
+        )
+
+
+@timed_query
+async def get_order_item_rows(client_data_ids: list[str]) -> list[dict]:
+    """Raw line items of a chunk of orders, e.g. for an export."""
+    if not client_data_ids:
+        return []
+    values = {f"id__{i}": client_data_id for i, client_data_id in enumerate(client_data_ids)}
+    return await db.fetchall(
+        f"""
+            SELECT client_data_id, item_id, name, quantity, price FROM webshop.order_items
+            WHERE client_data_id IN ({", ".join(f":{key}" for key in values)})
+            ORDER BY name
+        """,
+        values,
+    )
+
+
+@timed_query
+async def get_order_items(client_data_id: str) -> list[OrderItem]:
+    return await db.fetchall(
+        """
+            SELECT * FROM webshop.order_items
+            WHERE client_data_id = :client_data_id
+            ORDER BY name
+        """,
+        {"client_data_id": client_data_id},
+        OrderItem,
+    )
+
+
+@timed_query
 async def get_client_data(
     shop_id: str,
     client_data_id: str,
 ) -> ClientData | None:
     return await db.fetchone(
-        """
-            SELECT * FROM webshop.client_data
+        f"""
+            SELECT {CLIENT_DATA_COLUMNS} FROM webshop.client_data
             WHERE id = :id AND shop_id = :shop_id
         """,
         {"id": client_data_id, "shop_id": shop_id},
@@ -118,12 +364,13 @@ async def get_client_data(
     )
 
 
+@timed_query
 async def get_client_data_by_id(
     client_data_id: str,
 ) -> ClientData | None:
     return await db.fetchone(
-        """
-            SELECT * FROM webshop.client_data
+        f"""
+            SELECT {CLIENT_DATA_COLUMNS} FROM webshop.client_data
             WHERE id = :id
         """,
         {"id": client_data_id},
@@ -131,47 +378,527 @@ async def get_client_data_by_id(
     )
 
 
+@timed_query
+async def get_client_data_by_ids(client_data_ids: list[str]) -> list[ClientData]:
+    if not client_data_ids:
+        return []
+    values = {f"id__{i}": client_data_id for i, client_data_id in enumerate(client_data_ids)}
+    return await db.fetchall(
+        f"""
+            SELECT {CLIENT_DATA_COLUMNS} FROM webshop.client_data
+            WHERE id IN ({", ".join(f":{key}" for key in values)})
+        """,
+        values,
+        ClientData,
+    )
+
+
+@timed_query
 async def get_client_data_paginated(
-    shop_ids: list[str] | None = None,
+    user_id: str,
+    shop_id: str | None = None,
     filters: Filters[ClientDataFilters] | None = None,
 ) -> Page[ClientData]:
+    # one bound parameter no matter how many shops the user owns
+    where = ["shop_id IN (SELECT id FROM webshop.shop WHERE user_id = :user_id)"]
+    values = {"user_id": user_id}
+    if shop_id:
+        where.append("shop_id = :shop_id")
+        values["shop_id"] = shop_id
 
-    if not shop_ids:
-        return Page(data=[], total=0)
+    return await db.fetch_page(
+        f"SELECT {CLIENT_DATA_COLUMNS} FROM webshop.client_data",
+        where=where,
+        values=values,
+        filters=filters,
+        model=ClientData,
+    )
 
-    where = []
-    values = {}
-    id_clause = []
-    for i, item_id in enumerate(shop_ids):
-        # shop_ids are not user input, but DB entries, so this is safe
-        shop_id = f"shop_id__{i}"
-        id_clause.append(f"shop_id = :{shop_id}")
-        values[shop_id] = item_id
-    or_clause = " OR ".join(id_clause)
-    where.append(f"({or_clause})")
 
-    return await db.fetch_page(
-        "SELECT * FROM webshop.client_data",
+@timed_query
+async def get_client_data_cursor_page(
+    user_id: str,
+    filters: Filters[ClientDataFilters],
+    shop_id: str | None = None,
+    cursor: str = "",
+    include_total: bool = False,
+) -> CursorPage[ClientData]:
+    values = {"user_id": user_id}
+    if shop_id:
+        where = ["shop_id IN (SELECT id FROM webshop.shop WHERE user_id = :user_id)", "shop_id = :shop_id"]
+        values["shop_id"] = shop_id
+    elif db.type == SQLITE:
+        # the unary + keeps SQLite from sorting every order of the user via
+        # the shop_id index, it walks the (sortby, id) index instead
+        where = ["+shop_id IN (SELECT id FROM webshop.shop WHERE user_id = :user_id)"]
+    else:
+        where = ["shop_id IN (SELECT id FROM webshop.shop WHERE user_id = :user_id)"]
+    return await _fetch_cursor_page(
+        "webshop.client_data",
         where=where,
         values=values,
         filters=filters,
         model=ClientData,
+        cursor=cursor,
+        include_total=include_total,
+        columns=CLIENT_DATA_COLUMNS,
+    )
+
+
+@timed_query
+async def update_client_data_shipped(user_id: str, client_data_ids: list[str], shipped: bool) -> int:
+    """
+    Set `shipped` on the orders among `client_data_ids` that belong to the
+    user's shops, BULK_IDS_PER_STATEMENT orders per statement. Returns the
+    number of orders updated.
+    """
+    updated = 0
+    for start in range(0, len(client_data_ids), BULK_IDS_PER_STATEMENT):
+        chunk = client_data_ids[start : start + BULK_IDS_PER_STATEMENT]
+        values: dict = {f"id__{i}": client_data_id for i, client_data_id in enumerate(chunk)}
+        result = await db.execute(
+            f"""
+                UPDATE webshop.client_data
+                SET shipped = :shipped, updated_at = {db.timestamp_now}
+                WHERE id IN ({", ".join(f":{key}" for key in values)})
+                AND shop_id IN (SELECT id FROM webshop.shop WHERE user_id = :user_id)
+            """,
+            {**values, "shipped": shipped, "user_id": user_id},
+        )
+        updated += result.rowcount
+    return updated
+
+
+@timed_query
+async def delete_client_data_bulk(user_id: str, client_data_ids: list[str]) -> int:
+    """
+    Delete the orders among `client_data_ids` that belong to the user's
+    shops, with their items, BULK_IDS_PER_STATEMENT orders per statement.
+    Returns the number of orders deleted.
+    """
+    deleted = 0
+    async with db.connect() as conn:
+        for start in range(0, len(client_data_ids), BULK_IDS_PER_STATEMENT):
+            chunk = client_data_ids[start : start + BULK_IDS_PER_STATEMENT]
+            values: dict = {f"id__{i}": client_data_id for i, client_data_id in enumerate(chunk)}
+            ids = ", ".join(f":{key}" for key in values)
+            values["user_id"] = user_id
+            owned: list[dict] = await conn.fetchall(
+                f"""
+                    SELECT id FROM webshop.client_data
+                    WHERE id IN ({ids})
+                    AND shop_id IN (SELECT id FROM webshop.shop WHERE user_id = :user_id)
+                """,
+                values,
+            )
+            await _remove_from_stats(conn, [row["id"] for row in owned])
+            await conn.execute(
+                f"""
+                    DELETE FROM webshop.order_items
+                    WHERE client_data_id IN ({ids})
+                    AND shop_id IN (SELECT id FROM webshop.shop WHERE user_id = :user_id)
+                """,
+                values,
+            )
+            result = await conn.execute(
+                f"""
+                    DELETE FROM webshop.client_data
+                    WHERE id IN ({ids})
+                    AND shop_id IN (SELECT id FROM webshop.shop WHERE user_id = :user_id)
+                """,
+                values,
+            )
+            deleted += result.rowcount
+    return deleted
+
+
+@timed_query
+async def get_client_data_rows(
+    shop_id: str,
+    after: tuple[Any, str] | None = None,
+    limit: int = 1000,
+) -> list[dict]:
+    """
+    Raw order rows of a shop in (created_at, id) order, starting after the
+    `after` key of the previous chunk. Skips the models to keep exports cheap.
+    """
+    where = ["shop_id = :shop_id"]
+    values: dict = {"shop_id": shop_id, "limit": limit}
+    if after:
+        where.append(_keyset_clause("created_at", ">", *after, values))
+    return await db.fetchall(
+        f"""
+            SELECT {CLIENT_DATA_COLUMNS} FROM webshop.client_data
+            WHERE {" AND ".join(where)}
+            ORDER BY created_at, id
+            LIMIT :limit
+        """,
+        values,
     )
 
 
+@timed_query
 async def update_client_data(data: ClientData) -> ClientData:
     await db.update("webshop.client_data", data)
     return data
 
 
+@timed_query
+async def update_client_data_paid(client_data_id: str) -> bool:
+    """Mark an order paid unless it already is. True if this call changed the row."""
+    async with db.connect() as conn:
+        result = await conn.execute(
+            f"""
+                UPDATE webshop.client_data
+                SET paid = true, updated_at = {db.timestamp_now}
+                WHERE id = :id AND paid = false
+            """,
+            {"id": client_data_id},
+        )
+        if result.rowcount != 1:
+            return False
+        await _add_paid_to_stats(conn, [client_data_id])
+    return True
+
+
+@timed_query
+async def mark_client_data_paid(client_data_ids: list[str]) -> list[str]:
+    """
+    Flip the unpaid orders among `client_data_ids` to paid with one UPDATE.
+    Returns the ids that changed; paid or unknown ids are skipped.
+    """
+    if not client_data_ids:
+        return []
+    values = {f"id__{i}": client_data_id for i, client_data_id in enumerate(client_data_ids)}
+    id_list = ", ".join(f":{key}" for key in values)
+    async with db.connect() as conn:
+        # execute commits the UPDATE on its own, before the stats are credited, and
+        # returns the ids it flipped, not a separate read a concurrent writer could overtake
+        result = await conn.execute(
+            f"""
+                UPDATE webshop.client_data
+                SET paid = true, updated_at = {db.timestamp_now}
+                WHERE id IN ({id_list}) AND paid = false
+                RETURNING id
+            """,
+            values,
+        )
+        paid_ids = [row["id"] for row in result.mappings().all()]
+        if paid_ids:
+            await _add_paid_to_stats(conn, paid_ids)
+    return paid_ids
+
+
+@timed_query
 async def delete_client_data(shop_id: str, client_data_id: str) -> None:
-    await db.execute(
+    async with db.connect() as conn:
+        order = await conn.fetchone(
+            "SELECT id FROM webshop.client_data WHERE id = :id AND shop_id = :shop_id",
+            {"id": client_data_id, "shop_id": shop_id},
+        )
+        if not order:
+            return
+        await _remove_from_stats(conn, [client_data_id])
+        await conn.execute(
+            """
+                DELETE FROM webshop.order_items
+                WHERE client_data_id = :id AND shop_id = :shop_id
+            """,
+            {"id": client_data_id, "shop_id": shop_id},
+        )
+        await conn.execute(
+            """
+                DELETE FROM webshop.client_data
+                WHERE id = :id AND shop_id = :shop_id
+            """,
+            {"id": client_data_id, "shop_id": shop_id},
+        )
+
+
+# Order items
+
+
+################################ Stats ################################
+
+
+@timed_query
+async def get_shop_stats(shop_id: str, days: int = 30) -> ShopStats:
+    """
+    The totals, the last `days` days and the best selling products of a
+    shop, read from the summary tables instead of the orders.
+    """
+    values: dict = {"shop_id": shop_id}
+    totals: dict | None = await db.fetchone("SELECT * FROM webshop.shop_stats WHERE shop_id = :shop_id", values)
+    stats = ShopStats(**dict(totals)) if totals else ShopStats(shop_id=shop_id)
+    if stats.orders:
+        stats.paid_ratio = stats.paid_orders / stats.orders
+
+    values["since"] = _stats_day(datetime.now(timezone.utc) - timedelta(days=days - 1))
+    stats.days = await db.fetchall(
         """
-            DELETE FROM webshop.client_data
-            WHERE id = :id AND shop_id = :shop_id
+            SELECT day, orders, paid_orders, revenue, revenue_sat FROM webshop.shop_daily_stats
+            WHERE shop_id = :shop_id AND day >= :since
+            ORDER BY day
         """,
-        {"id": client_data_id, "shop_id": shop_id},
+        values,
+        DailyStats,
+    )
+    stats.top_products = await db.fetchall(
+        """
+            SELECT name, quantity, revenue FROM webshop.product_stats
+            WHERE shop_id = :shop_id
+            ORDER BY quantity DESC, name
+            LIMIT :limit
+        """,
+        {"shop_id": shop_id, "limit": STATS_TOP_PRODUCTS},
+        ProductStats,
+    )
+    return stats
+
+
+@timed_query
+async def rebuild_shop_stats(shop_id: str | None = None) -> int:
+    """
+    Recompute the summary tables from the orders, of one shop or of all of
+    them. For backfills and to repair drifted counters.
+    Returns the number of shops with stats.
+    """
+    if db.type == SQLITE:
+        day = "strftime('%Y-%m-%d', created_at, 'unixepoch')"
+    else:
+        day = "to_char(created_at, 'YYYY-MM-DD')"
+    where = "WHERE shop_id = :shop_id" if shop_id else ""
+    values = {"shop_id": shop_id} if shop_id else {}
+    async with db.connect() as conn:
+        for table in STATS_TABLES:
+            await conn.execute(f"DELETE FROM webshop.{table} {where}", values)
+        await conn.execute(
+            f"""
+                INSERT INTO webshop.shop_daily_stats (shop_id, day, orders, paid_orders, revenue, revenue_sat)
+                SELECT shop_id, {day}, COUNT(*),
+                    SUM(CASE WHEN paid THEN 1 ELSE 0 END),
+                    SUM(CASE WHEN paid THEN COALESCE(amount, 0) ELSE 0 END),
+                    SUM(CASE WHEN paid THEN COALESCE(amount_sat, 0) ELSE 0 END)
+                FROM webshop.client_data {where}
+                GROUP BY shop_id, {day}
+            """,
+            values,
+        )
+        result = await conn.execute(
+            f"""
+                INSERT INTO webshop.shop_stats (shop_id, orders, paid_orders, revenue, revenue_sat)
+                SELECT shop_id, SUM(orders), SUM(paid_orders), SUM(revenue), SUM(revenue_sat)
+                FROM webshop.shop_daily_stats {where}
+                GROUP BY shop_id
+            """,
+            values,
+        )
+        await conn.execute(
+            f"""
+                INSERT INTO webshop.product_stats (shop_id, name, quantity, revenue)
+                SELECT order_items.shop_id, order_items.name, SUM(order_items.quantity),
+                    SUM(order_items.quantity * COALESCE(order_items.price, 0))
+                FROM webshop.order_items
+                JOIN webshop.client_data ON client_data.id = order_items.client_data_id
+                WHERE client_data.paid = true {"AND order_items.shop_id = :shop_id" if shop_id else ""}
+                GROUP BY order_items.shop_id, order_items.name
+            """,
+            values,
+        )
+    return result.rowcount
+
+
+@timed_query
+async def delete_shop_stats(shop_id: str) -> None:
+    async with db.connect() as conn:
+        for table in STATS_TABLES:
+            await conn.execute(f"DELETE FROM webshop.{table} WHERE shop_id = :shop_id", {"shop_id": shop_id})
+
+
+async def _add_paid_to_stats(conn: Connection, client_data_ids: list[str]) -> None:
+    """
+    Count orders that were just marked paid, and their items, in the summary
+    tables. The orders are paid already, a failure here is only logged, so
+    settlement goes on, and `rebuild_shop_stats` recounts them.
+    """
+    try:
+        await _update_stats(conn, client_data_ids, placed=0, paid=1)
+    except Exception as exc:
+        logger.error(f"Could not count paid orders {', '.join(client_data_ids)} in the shop stats: {exc}")
+
+
+async def _remove_from_stats(conn: Connection, client_data_ids: list[str]) -> None:
+    """Uncount orders about to be deleted, and the items of the paid ones, from the summary tables."""
+    await _update_stats(conn, client_data_ids, placed=-1, paid=-1)
+
+
+async def _update_stats(conn: Connection, client_data_ids: list[str], placed: int, paid: int) -> None:
+    """
+    Add `placed` to the order counts for each of the orders, and `paid` to
+    the paid counts, revenue and products for each of them that is paid.
+    """
+    if not client_data_ids:
+        return
+    values = {f"id__{i}": client_data_id for i, client_data_id in enumerate(client_data_ids)}
+    id_list = ", ".join(f":{key}" for key in values)
+    orders: list[dict] = await conn.fetchall(
+        f"SELECT shop_id, created_at, paid, amount, amount_sat FROM webshop.client_data WHERE id IN ({id_list})",
+        values,
+    )
+    items: list[dict] = await conn.fetchall(
+        f"""
+            SELECT order_items.shop_id, order_items.name, order_items.quantity, order_items.price
+            FROM webshop.order_items
+            JOIN webshop.client_data ON client_data.id = order_items.client_data_id
+            WHERE order_items.client_data_id IN ({id_list}) AND client_data.paid = true
+        """,
+        values,
+    )
+
+    shops: dict[str, dict] = {}
+    days: dict[tuple[str, str], dict] = {}
+    for order in orders:
+        shop_id, day = order["shop_id"], _stats_day(order["created_at"])
+        counters = {"orders": 0, "paid_orders": 0, "revenue": 0, "revenue_sat": 0}
+        for row in (
+            shops.setdefault(shop_id, {"shop_id": shop_id, **counters}),
+            days.setdefault((shop_id, day), {"shop_id": shop_id, "day": day, **counters}),
+        ):
+            row["orders"] += placed
+            if order["paid"]:
+                row["paid_orders"] += paid
+                row["revenue"] += paid * (order["amount"] or 0)
+                row["revenue_sat"] += paid * (order["amount_sat"] or 0)
+    products: dict[tuple[str, str], dict] = {}
+    for item in items:
+        product = products.setdefault(
+            (item["shop_id"], item["name"]),
+            {"shop_id": item["shop_id"], "name": item["name"], "quantity": 0, "revenue": 0},
+        )
+        product["quantity"] += paid * item["quantity"]
+        product["revenue"] += paid * item["quantity"] * (item["price"] or 0)
+
+    await _add_to_stats(conn, "shop_stats", ("shop_id",), list(shops.values()))
+    await _add_to_stats(conn, "shop_daily_stats", ("shop_id", "day"), list(days.values()))
+    await _add_to_stats(conn, "product_stats", ("shop_id", "name"), list(products.values()))
+    if placed < 0 and shops:
+        # drop the rows left empty, which a rebuild would not have
+        shop_values = {f"shop__{i}": shop_id for i, shop_id in enumerate(shops)}
+        shop_list = ", ".join(f":{key}" for key in shop_values)
+        for table, counter in (("shop_stats", "orders"), ("shop_daily_stats", "orders"), ("product_stats", "quantity")):
+            await conn.execute(
+                f"DELETE FROM webshop.{table} WHERE shop_id IN ({shop_list}) AND {counter} <= 0",
+                shop_values,
+            )
+
+
+async def _add_to_stats(conn: Connection, table: str, keys: tuple[str, ...], rows: list[dict]) -> None:
+    """
+    Add the counters of `rows` onto the rows of a summary table with the
+    same `keys`, inserting the missing ones. Keys must be unique in `rows`.
+    """
+    if not rows:
+        return
+    columns = list(rows[0])
+    counters = ", ".join(f"{column} = {table}.{column} + excluded.{column}" for column in columns if column not in keys)
+    for start in range(0, len(rows), STATS_ROWS_PER_UPSERT):
+        placeholders = []
+        values: dict = {}
+        for i, row in enumerate(rows[start : start + STATS_ROWS_PER_UPSERT]):
+            placeholders.append(f"({', '.join(f':{column}__{i}' for column in columns)})")
+            values.update({f"{column}__{i}": row[column] for column in columns})
+        await conn.execute(
+            f"""
+                INSERT INTO webshop.{table} ({", ".join(columns)})
+                VALUES {", ".join(placeholders)}
+                ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {counters}
+            """,
+            values,
+        )
+
+
+def _stats_day(value: Any) -> str:
+    # stats are bucketed by the UTC day the order was placed on
+    return timestamp_to_datetime(value).strftime("%Y-%m-%d")
+
+
+######################### Keyset pagination ##########################
+
+CURSOR_SORT_FIELDS = ("created_at", "updated_at")
+
+
+async def _fetch_cursor_page(
+    table: str,
+    where: list[str],
+    values: dict,
+    filters: Filters,
+    model: type[TModel],
+    cursor: str = "",
+    include_total: bool = False,
+    columns: str = "*",
+) -> CursorPage[TModel]:
+    """
+    A page of `table` following the page the cursor was handed out with.
+    The cost of a page does not grow with its depth, unlike an OFFSET, and
+    the total is only counted when asked for.
+    """
+    sortby = filters.sortby or "created_at"
+    if sortby not in CURSOR_SORT_FIELDS:
+        raise ValueError(f"Cursor pagination sorts by one of {', '.join(CURSOR_SORT_FIELDS)}.")
+    direction = filters.direction or "asc"
+    limit = min(filters.limit or 1000, 1000)
+
+    total = None
+    if include_total:
+        count: dict = await db.fetchone(
+            f"SELECT COUNT(*) AS count FROM {table} {filters.where(list(where))}",
+            filters.values(dict(values)),
+        )
+        total = int(count["count"])
+
+    where, values = list(where), dict(values)
+    if cursor:
+        key = decode_cursor(cursor)
+        if len(key) != 4 or key[:2] != [sortby, direction]:
+            raise ValueError("Invalid cursor.")
+        where.append(_keyset_clause(sortby, ">" if direction == "asc" else "<", key[2], key[3], values))
+    rows: list[dict] = await db.fetchall(
+        f"""
+            SELECT {columns} FROM {table}
+            {filters.where(where)}
+            ORDER BY {sortby} {direction}, id {direction}
+            LIMIT {limit + 1}
+        """,
+        filters.values(values),
     )
 
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sortby, direction, rows[-1][sortby], rows[-1]["id"])
+    return CursorPage(
+        data=[dict_to_model(row, model) for row in rows],
+        total=total,
+        next_cursor=next_cursor,
+    )
 
-# Order items
+
+def _keyset_clause(column: str, op: str, value: Any, row_id: Any, values: dict) -> str:
+    """
+    Condition for the rows after the (`column`, id) key of a previous row.
+    The row value comparison is a range scan on a (.., column) index.
+    """
+    if db.type == SQLITE:
+        if not isinstance(value, (int, float)) or not isinstance(row_id, str):
+            raise ValueError("Invalid cursor.")
+        placeholder = ":keyset_value"
+    else:
+        # postgres hands out naive UTC timestamps, compared as exact text
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        if not isinstance(value, str) or not isinstance(row_id, str):
+            raise ValueError("Invalid cursor.")
+        placeholder = "CAST(:keyset_value AS TIMESTAMP)"
+    values["keyset_value"] = value
+    values["keyset_id"] = row_id
+    return f"({column}, id) {op} ({placeholder}, :keyset_id)"
@@ -0,0 +1,153 @@
+# Description: Order events pushed to the shop owners' dashboards over SSE.
+
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from itertools import count
+from secrets import token_hex
+from typing import NamedTuple
+
+# events kept for dashboards that reconnect with a Last-Event-ID
+EVENT_BUFFER_SIZE = 1000
+# events waiting for one slow dashboard before it is told to refetch
+SUBSCRIBER_QUEUE_SIZE = 100
+# seconds between comments that keep idle connections open through proxies
+EVENT_KEEPALIVE = 15
+# longest a storefront waits on one order status request
+ORDER_STATUS_MAX_WAIT = 30
+# orders storefronts may wait on at once, further viewers are told to retry later
+MAX_WATCHED_ORDERS = 10_000
+
+
+class OrderEvent(NamedTuple):
+    id: str
+    user_id: str
+    type: str
+    data: str
+
+    def encode(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {self.data}\n\n"
+
+
+# tells a dashboard that it missed events and should reload its page once
+RESET_EVENT = "event: reset\ndata: {}\n\n"
+
+
+class OrderEventBroker:
+    """
+    Fans order events out to the subscribed dashboards of their user and
+    keeps the last EVENT_BUFFER_SIZE of them for reconnects. Event ids carry
+    a token of this process, ids of an earlier run are answered with a reset.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE) -> None:
+        self.token = token_hex(4)
+        self._sequence = count(1)
+        self._buffer: deque[tuple[int, OrderEvent]] = deque(maxlen=buffer_size)
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+
+    def publish(self, user_id: str, event_type: str, data: str) -> OrderEvent:
+        """Send an event with a JSON `data` payload to the dashboards of the user."""
+        sequence = next(self._sequence)
+        event = OrderEvent(f"{self.token}-{sequence}", user_id, event_type, data)
+        self._buffer.append((sequence, event))
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait(event.encode())
+            except asyncio.QueueFull:
+                # drop the backlog, the dashboard reloads instead of replaying it
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESET_EVENT)
+        return event
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[user_id]
+
+    def replay(self, user_id: str, last_event_id: str) -> list[str] | None:
+        """
+        The encoded events of the user after `last_event_id`, or None when
+        they can not all be replayed and the dashboard has to reload.
+        """
+        token, _, sequence = last_event_id.partition("-")
+        if token != self.token or not sequence.isdigit():
+            return None
+        after = int(sequence)
+        if self._buffer and self._buffer[0][0] > after + 1:
+            return None
+        return [event.encode() for seq, event in self._buffer if seq > after and event.user_id == user_id]
+
+    async def stream(self, user_id: str, last_event_id: str | None = None) -> AsyncIterator[str]:
+        queue = self.subscribe(user_id)
+        try:
+            if last_event_id:
+                missed = self.replay(user_id, last_event_id)
+                for message in [RESET_EVENT] if missed is None else missed:
+                    yield message
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(user_id, queue)
+
+
+order_events = OrderEventBroker()
+
+
+class OrderWaiter:
+    def __init__(self) -> None:
+        self.paid: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.viewers = 0
+
+
+class OrderWaiters:
+    """
+    Storefronts waiting for their orders to be paid. Every viewer of an
+    order shares one future, resolved by the settlement path, and the
+    entry is dropped when the last viewer stops waiting.
+    """
+
+    def __init__(self, max_orders: int = MAX_WATCHED_ORDERS) -> None:
+        self.max_orders = max_orders
+        self._waiters: dict[str, OrderWaiter] = {}
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+    def is_full(self, client_data_id: str) -> bool:
+        return client_data_id not in self._waiters and len(self._waiters) >= self.max_orders
+
+    @asynccontextmanager
+    async def watch(self, client_data_id: str) -> AsyncIterator[asyncio.Future]:
+        waiter = self._waiters.get(client_data_id)
+        if waiter is None:
+            waiter = self._waiters[client_data_id] = OrderWaiter()
+        waiter.viewers += 1
+        try:
+            yield waiter.paid
+        finally:
+            waiter.viewers -= 1
+            if not waiter.viewers and self._waiters.get(client_data_id) is waiter:
+                del self._waiters[client_data_id]
+
+    def resolve(self, client_data_ids: list[str]) -> None:
+        for client_data_id in client_data_ids:
+            waiter = self._waiters.pop(client_data_id, None)
+            if waiter and not waiter.paid.done():
+                waiter.paid.set_result(True)
+
+
+order_waiters = OrderWaiters()
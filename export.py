@@ -0,0 +1,99 @@
+# Description: Streaming export of a user's orders as CSV or NDJSON.
+
+import csv
+import io
+import json
+from collections.abc import AsyncIterator
+from typing import Literal
+
+from .crud import get_client_data_rows, get_order_item_rows, get_shop_ids_by_user
+from .helpers import timestamp_to_datetime
+
+ExportFormat = Literal["csv", "ndjson"]
+
+# orders per database round trip, bounds the memory of an export
+EXPORT_CHUNK_SIZE = 500
+
+EXPORT_FIELDS = [
+    "id",
+    "shop_id",
+    "product",
+    "quantity",
+    "address",
+    "email",
+    "number",
+    "shipped",
+    "paid",
+    "currency",
+    "amount",
+    "amount_sat",
+    "created_at",
+    "updated_at",
+]
+
+
+async def export_client_data(
+    user_id: str,
+    shop_id: str | None = None,
+    fmt: ExportFormat = "csv",
+) -> AsyncIterator[str]:
+    """
+    Yield the orders of the user shop by shop and chunk by chunk, with their
+    items inline. Chunks are read with keyset pagination, so the database
+    connection is released between chunks and memory stays flat for any
+    number of orders.
+    """
+    if fmt == "csv":
+        yield _csv_line([*EXPORT_FIELDS, "items"])
+    for export_shop_id in [shop_id] if shop_id else await get_shop_ids_by_user(user_id):
+        async for chunk in _export_shop(export_shop_id, fmt):
+            yield chunk
+
+
+async def _export_shop(shop_id: str, fmt: ExportFormat) -> AsyncIterator[str]:
+    after = None
+    while True:
+        rows = await get_client_data_rows(shop_id, after=after, limit=EXPORT_CHUNK_SIZE)
+        if not rows:
+            return
+        items: dict[str, list[dict]] = {}
+        for row_item in await get_order_item_rows([row["id"] for row in rows]):
+            item = dict(row_item)
+            items.setdefault(item.pop("client_data_id"), []).append(item)
+
+        chunk = io.StringIO()
+        for row in rows:
+            record = {field: _export_value(field, row.get(field)) for field in EXPORT_FIELDS}
+            row_items = items.get(row["id"], [])
+            if fmt == "csv":
+                chunk.write(_csv_line([*record.values(), _items_text(row_items)]))
+            else:
+                chunk.write(json.dumps({**record, "items": row_items}, separators=(",", ":")) + "\n")
+        yield chunk.getvalue()
+
+        if len(rows) < EXPORT_CHUNK_SIZE:
+            return
+        after = (rows[-1]["created_at"], rows[-1]["id"])
+
+
+def _export_value(field: str, value):
+    if value is None:
+        return None
+    if field in ("created_at", "updated_at"):
+        return timestamp_to_datetime(value).isoformat()
+    if field in ("shipped", "paid"):
+        return bool(value)
+    return value
+
+
+def _csv_line(values: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def _items_text(items: list[dict]) -> str:
+    return "; ".join(
+        f"{item['quantity']} x {item['name']}" + (f" @ {item['price']}" if item["price"] is not None else "")
+        for item in items
+    )
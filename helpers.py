@@ -1,8 +1,73 @@
 # Description: A place for helper functions.
 
+import json
 import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any
 
 
 def is_valid_email_address(email: str) -> bool:
     email_regex = r"[A-Za-z0-9\._%+-]+@[A-Za-z0-9\.-]+\.[A-Za-z]{2,63}"
     return re.fullmatch(email_regex, email) is not None
+
+
+def is_not_modified(
+    if_none_match: str | None, etag: str, if_modified_since: str | None = None, last_modified: float | None = None
+) -> bool:
+    """Evaluate conditional request headers, `If-None-Match` taking precedence."""
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in tags or "*" in tags
+    if if_modified_since and last_modified is not None:
+        try:
+            return parsedate_to_datetime(if_modified_since).timestamp() >= last_modified
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def accepted_encodings(accept_encoding: str | None) -> set[str]:
+    """Content codings of an `Accept-Encoding` header, without those refused by q=0."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        try:
+            quality = float(params.strip().removeprefix("q=")) if params.strip() else 1.0
+        except ValueError:
+            quality = 1.0
+        if quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def encode_cursor(*key: Any) -> str:
+    """Opaque pagination cursor holding the sort key of the last row of a page."""
+    raw = json.dumps(
+        [value.isoformat() if isinstance(value, datetime) else value for value in key],
+        separators=(",", ":"),
+    )
+    return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        key = json.loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError as exc:
+        raise ValueError("Invalid cursor.") from exc
+    if not isinstance(key, list):
+        raise ValueError("Invalid cursor.")
+    return key
+
+
+def timestamp_to_datetime(value: Any) -> datetime:
+    """A raw timestamp column as an aware UTC datetime."""
+    if isinstance(value, datetime):
+        # postgres returns naive UTC timestamps
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    # SQLite stores seconds since the epoch
+    return datetime.fromtimestamp(float(value), timezone.utc)
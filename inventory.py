@@ -0,0 +1,113 @@
+# Description: Server side access to the items of a linked Inventory extension.
+
+import json
+from datetime import datetime, timezone
+
+import httpx
+from lnbits.settings import settings
+
+# the inventory API caps a page at 1000 rows
+INVENTORY_PAGE_SIZE = 1000
+INVENTORY_TIMEOUT = 10
+
+
+async def fetch_inventory_items(inventory_id: str) -> list[dict]:
+    """
+    Fetch every active item of an inventory, following the pagination
+    instead of stopping at the first page.
+    """
+    url = f"{settings.lnbits_baseurl.rstrip('/')}/inventory/api/v1/items/{inventory_id}/paginated"
+    items: list[dict] = []
+    async with httpx.AsyncClient(timeout=INVENTORY_TIMEOUT) as client:
+        while True:
+            response = await client.get(
+                url,
+                params={
+                    "limit": INVENTORY_PAGE_SIZE,
+                    "offset": len(items),
+                    "sortby": "created_at",
+                    "direction": "desc",
+                    "is_active": True,
+                },
+            )
+            response.raise_for_status()
+            page = response.json()
+            data = [item for item in page.get("data") or [] if item]
+            items.extend(data)
+            if len(data) < INVENTORY_PAGE_SIZE or len(items) >= int(page.get("total") or 0):
+                return items
+
+
+async def fetch_inventory_changes(inventory_id: str, since: float) -> list[dict]:
+    """
+    Fetch the items of an inventory updated at or after the `since` timestamp,
+    newest first. Inactive items are included so deactivations are seen too.
+    """
+    url = f"{settings.lnbits_baseurl.rstrip('/')}/inventory/api/v1/items/{inventory_id}/paginated"
+    items: list[dict] = []
+    offset = 0
+    async with httpx.AsyncClient(timeout=INVENTORY_TIMEOUT) as client:
+        while True:
+            response = await client.get(
+                url,
+                params={
+                    "limit": INVENTORY_PAGE_SIZE,
+                    "offset": offset,
+                    "sortby": "updated_at",
+                    "direction": "desc",
+                },
+            )
+            response.raise_for_status()
+            page = response.json()
+            data = [item for item in page.get("data") or [] if item]
+            offset += len(data)
+            for item in data:
+                if item_updated_at(item) < since:
+                    return items
+                items.append(item)
+            if len(data) < INVENTORY_PAGE_SIZE or offset >= int(page.get("total") or 0):
+                return items
+
+
+def item_updated_at(item: dict) -> float:
+    """Last update of an inventory item as a unix timestamp, 0 when unknown."""
+    raw = item.get("updated_at") or item.get("created_at")
+    if isinstance(raw, (int, float)):
+        return float(raw)
+    if isinstance(raw, str):
+        try:
+            updated_at = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+        except ValueError:
+            return 0.0
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return updated_at.timestamp()
+    return 0.0
+
+
+def item_tags(item: dict) -> list[str]:
+    """Lower case tags of an inventory item, stored as a list, JSON or CSV."""
+    raw = item.get("tags")
+    if not raw:
+        return []
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError:
+            raw = raw.split(",")
+    if not isinstance(raw, list):
+        raw = [raw]
+    return [str(tag).strip().lower() for tag in raw if str(tag).strip()]
+
+
+def parse_allowed_tags(allowed_tags: str | None) -> set[str]:
+    """The shop's comma separated allowed tags, empty when every item is shown."""
+    return {tag.strip().lower() for tag in (allowed_tags or "").split(",") if tag.strip()}
+
+
+def filter_items_by_tags(items: list[dict], allowed_tags: str | None) -> list[dict]:
+    """Keep the items that carry at least one of the shop's allowed tags."""
+    allowed = parse_allowed_tags(allowed_tags)
+    if not allowed:
+        return items
+    return [item for item in items if allowed.intersection(item_tags(item))]
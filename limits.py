@@ -0,0 +1,99 @@
+# Description: Admission control for the public checkout.
+
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from math import ceil
+from time import monotonic
+
+from .cache import LRUCache
+from .models import CheckoutCounters, Shop
+
+# defaults for shops without their own limits
+CHECKOUT_RATE_LIMIT = 10  # checkouts per minute per client address
+CHECKOUT_CONCURRENCY = 20  # checkouts of one shop in flight
+# checkouts of all shops in flight, what the database and funding source see at most
+CHECKOUT_MAX_CONCURRENCY = 100
+# client buckets kept, an evicted bucket is simply full again
+CHECKOUT_MAX_CLIENTS = 100_000
+
+
+class CheckoutRejectedError(Exception):
+    """A checkout turned away before it did any work; retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float) -> None:
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, capacity: float, per_second: float, now: float) -> float:
+        """Take a token. Returns 0 on success, else the seconds until one is available."""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * per_second)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / per_second
+
+
+class CheckoutAdmission:
+    """
+    Token buckets per shop and client address, refilling at the shop's
+    rate limit per minute, and caps on the checkouts in flight per shop
+    and overall. Requests over a limit are rejected at once, not queued.
+    """
+
+    def __init__(self) -> None:
+        # a bucket unused for a minute has refilled, so it can be dropped
+        self.buckets = LRUCache(max_entries=CHECKOUT_MAX_CLIENTS, ttl=60)
+        self.counters: dict[str, CheckoutCounters] = {}
+        self.in_flight = 0
+
+    def shop_counters(self, shop_id: str) -> CheckoutCounters:
+        return self.counters.get(shop_id) or CheckoutCounters()
+
+    def totals(self) -> CheckoutCounters:
+        totals = CheckoutCounters()
+        for counters in self.counters.values():
+            totals.admitted += counters.admitted
+            totals.rate_limited += counters.rate_limited
+            totals.overloaded += counters.overloaded
+            totals.in_flight += counters.in_flight
+        return totals
+
+    @asynccontextmanager
+    async def admit(self, shop: Shop, client: str | None) -> AsyncIterator[None]:
+        """Hold a checkout slot of the shop, `client` None skips the rate limit."""
+        counters = self.counters.setdefault(shop.id, CheckoutCounters())
+        # before the rate limit, a checkout turned away as overloaded costs the client no token
+        concurrency = shop.checkout_concurrency or CHECKOUT_CONCURRENCY
+        if counters.in_flight >= concurrency or self.in_flight >= CHECKOUT_MAX_CONCURRENCY:
+            counters.overloaded += 1
+            raise CheckoutRejectedError("The shop is busy, try again shortly.", 1)
+        if client is not None:
+            rate = shop.checkout_rate_limit or CHECKOUT_RATE_LIMIT
+            now = monotonic()
+            bucket = self.buckets.get((shop.id, client)) or TokenBucket(rate, now)
+            wait = bucket.take(rate, rate / 60, now)
+            self.buckets.set((shop.id, client), bucket)
+            if wait:
+                counters.rate_limited += 1
+                raise CheckoutRejectedError("Too many checkouts, try again later.", ceil(wait))
+
+        counters.admitted += 1
+        counters.in_flight += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            counters.in_flight -= 1
+            self.in_flight -= 1
+
+
+checkout_admission = CheckoutAdmission()
@@ -0,0 +1,261 @@
+# Description: In-process latency histograms and counters, rendered in the
+# Prometheus text format.
+
+from bisect import bisect_left
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+from typing import Any, ParamSpec, TypeVar
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set(self, value: float, *labels: Any) -> None:
+        """Mirror a value kept elsewhere, e.g. the hits of a cache, at scrape time."""
+        self.values[labels] = value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram:
+    """Bucketed observations per label set; observing is a bisect and two additions."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # per label set: the count of each bucket plus +Inf, and the sum
+        self.values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: Any, count: int = 1) -> None:
+        counts, total = self.values.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+        counts[bisect_left(self.buckets, value)] += count
+        total[0] += value * count
+
+    @contextmanager
+    def time(self, *labels: Any) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, *labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts, strict=True):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total[0]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+request_duration = Histogram(
+    "webshop_http_request_duration_seconds",
+    "Time to produce the response of a webshop route.",
+    ("method", "route", "status"),
+)
+query_duration = Histogram(
+    "webshop_query_duration_seconds",
+    "Time spent in a crud function.",
+    ("function",),
+)
+query_rows = Histogram(
+    "webshop_query_rows",
+    "Rows returned by a crud function.",
+    ("function",),
+    ROW_BUCKETS,
+)
+query_errors = Counter(
+    "webshop_query_errors_total",
+    "Crud calls that raised.",
+    ("function",),
+)
+operation_duration = Histogram(
+    "webshop_operation_duration_seconds",
+    "Time spent in a step of a hot path, e.g. create_invoice or render_public_page.",
+    ("operation",),
+)
+settlement_duration = Histogram(
+    "webshop_settlement_duration_seconds",
+    "Time from dequeuing a paid invoice to its order being marked paid.",
+)
+
+# set from the state of the settlement workers, admission control and caches when scraped
+settlement_queue_depth = Gauge(
+    "webshop_settlement_queue_depth",
+    "Paid invoices waiting for a settlement worker.",
+)
+settlement_payments = Counter(
+    "webshop_settlement_payments_total",
+    "Paid invoices settled by the settlement workers.",
+)
+settlement_errors = Counter(
+    "webshop_settlement_errors_total",
+    "Settlement batches that failed.",
+)
+checkouts = Counter(
+    "webshop_checkouts_total",
+    "Public checkouts by admission outcome.",
+    ("outcome",),
+)
+checkouts_in_flight = Gauge(
+    "webshop_checkouts_in_flight",
+    "Public checkouts being processed.",
+)
+stock_reservations_held = Gauge(
+    "webshop_stock_reservations",
+    "Unpaid checkouts holding stock.",
+)
+cache_entries = Gauge(
+    "webshop_cache_entries",
+    "Entries held by an in-process cache.",
+    ("cache",),
+)
+cache_requests = Counter(
+    "webshop_cache_requests_total",
+    "Lookups of an in-process cache by result.",
+    ("cache", "result"),
+)
+
+METRICS: list[Histogram | Counter] = [
+    request_duration,
+    query_duration,
+    query_rows,
+    query_errors,
+    operation_duration,
+    settlement_duration,
+    settlement_queue_depth,
+    settlement_payments,
+    settlement_errors,
+    checkouts,
+    checkouts_in_flight,
+    stock_reservations_held,
+    cache_entries,
+    cache_requests,
+]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def timed(operation: str, awaitable: Awaitable[T]) -> T:
+    """Await `awaitable`, recording its latency as `operation`."""
+    with operation_duration.time(operation):
+        return await awaitable
+
+
+def _row_count(result: Any) -> int | None:
+    if isinstance(result, list):
+        return len(result)
+    data = getattr(result, "data", None)
+    if isinstance(data, list):
+        return len(data)
+    return None
+
+
+def timed_query(func: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+    """Record the latency, errors and returned rows of an async crud function."""
+    name = func.__name__
+
+    @wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        start = perf_counter()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            query_errors.inc(name)
+            raise
+        finally:
+            query_duration.observe(perf_counter() - start, name)
+        rows = _row_count(result)
+        if rows is not None:
+            query_rows.observe(rows, name)
+        return result
+
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """
+    Route class recording the latency of each route by its path template.
+    Streamed bodies are timed until the response starts.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def timed_handler(request: Request) -> Response:
+            start = perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as exc:
+                status = exc.status_code
+                raise
+            except ValueError:
+                # lnbits answers these with a 400
+                status = 400
+                raise
+            finally:
+                request_duration.observe(perf_counter() - start, request.method, path, status)
+
+        return timed_handler
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-from lnbits.db import Database
+import json
+
+from lnbits.db import SQLITE, Database
+from lnbits.helpers import urlsafe_short_hash
 
 
 async def m002_shop(db: Database):
@@ -52,3 +55,231 @@ async def m006_create_client_data(db: Database):
         );
         """
     )
+
+
+async def m007_order_indexes(db: Database):
+    """
+    Indexes for the order and shop hot paths.
+    Matches the filters and sorts exposed by ShopFilters and ClientDataFilters.
+    """
+    indexes = [
+        ("shop_user_id_updated_at_idx", "shop", "user_id, updated_at"),
+        ("shop_user_id_created_at_idx", "shop", "user_id, created_at"),
+        ("client_data_shop_id_updated_at_idx", "client_data", "shop_id, updated_at"),
+        ("client_data_shop_id_created_at_idx", "client_data", "shop_id, created_at"),
+        ("client_data_shop_id_paid_idx", "client_data", "shop_id, paid"),
+    ]
+    for name, table, columns in indexes:
+        await db.execute(_create_index(db, name, table, columns))
+
+
+async def m008_order_items(db: Database):
+    """
+    Line items of an order, formerly a JSON string in client_data.items.
+    Existing orders are backfilled, the legacy column is left untouched.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE webshop.order_items (
+            id TEXT PRIMARY KEY,
+            client_data_id TEXT NOT NULL,
+            shop_id TEXT NOT NULL,
+            item_id TEXT,
+            name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            price DOUBLE PRECISION,
+            created_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now}
+        );
+        """
+    )
+    await db.execute(_create_index(db, "order_items_client_data_id_idx", "order_items", "client_data_id"))
+    await db.execute(_create_index(db, "order_items_shop_id_name_idx", "order_items", "shop_id, name"))
+
+    rows: list[dict] = await db.fetchall(
+        "SELECT id, shop_id, items, created_at FROM webshop.client_data WHERE items IS NOT NULL"
+    )
+    await _backfill_order_items(db, rows)
+
+
+async def m009_client_data_amount(db: Database):
+    """
+    The quoted amount of an order in the shop currency and in sats.
+    """
+    await db.execute("ALTER TABLE webshop.client_data ADD COLUMN currency TEXT")
+    await db.execute("ALTER TABLE webshop.client_data ADD COLUMN amount DOUBLE PRECISION")
+    await db.execute(f"ALTER TABLE webshop.client_data ADD COLUMN amount_sat {db.big_int}")
+
+
+async def m010_client_data_keyset_indexes(db: Database):
+    """
+    Indexes matching the order of keyset (cursor) paginated order listings.
+    """
+    indexes = [
+        ("client_data_created_at_id_idx", "client_data", "created_at, id"),
+        ("client_data_updated_at_id_idx", "client_data", "updated_at, id"),
+    ]
+    for name, table, columns in indexes:
+        await db.execute(_create_index(db, name, table, columns))
+
+
+async def m011_shop_stats(db: Database):
+    """
+    Per-shop and per-day order rollups and per-product sales, kept up to
+    date as orders are placed and paid.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE webshop.shop_stats (
+            shop_id TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL DEFAULT 0,
+            paid_orders INTEGER NOT NULL DEFAULT 0,
+            revenue DOUBLE PRECISION NOT NULL DEFAULT 0,
+            revenue_sat {db.big_int} NOT NULL DEFAULT 0
+        );
+    """
+    )
+    await db.execute(
+        f"""
+        CREATE TABLE webshop.shop_daily_stats (
+            shop_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            paid_orders INTEGER NOT NULL DEFAULT 0,
+            revenue DOUBLE PRECISION NOT NULL DEFAULT 0,
+            revenue_sat {db.big_int} NOT NULL DEFAULT 0,
+            PRIMARY KEY (shop_id, day)
+        );
+    """
+    )
+    await db.execute(
+        """
+        CREATE TABLE webshop.product_stats (
+            shop_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (shop_id, name)
+        );
+    """
+    )
+    await db.execute(_create_index(db, "product_stats_shop_id_quantity_idx", "product_stats", "shop_id, quantity"))
+
+    # backfill from the existing orders
+    if db.type == SQLITE:
+        day = "strftime('%Y-%m-%d', created_at, 'unixepoch')"
+    else:
+        day = "to_char(created_at, 'YYYY-MM-DD')"
+    await db.execute(
+        f"""
+        INSERT INTO webshop.shop_daily_stats (shop_id, day, orders, paid_orders, revenue, revenue_sat)
+        SELECT shop_id, {day}, COUNT(*),
+            SUM(CASE WHEN paid THEN 1 ELSE 0 END),
+            SUM(CASE WHEN paid THEN COALESCE(amount, 0) ELSE 0 END),
+            SUM(CASE WHEN paid THEN COALESCE(amount_sat, 0) ELSE 0 END)
+        FROM webshop.client_data
+        GROUP BY shop_id, {day}
+        """
+    )
+    await db.execute(
+        """
+        INSERT INTO webshop.shop_stats (shop_id, orders, paid_orders, revenue, revenue_sat)
+        SELECT shop_id, SUM(orders), SUM(paid_orders), SUM(revenue), SUM(revenue_sat)
+        FROM webshop.shop_daily_stats
+        GROUP BY shop_id
+        """
+    )
+    await _backfill_product_stats(db)
+
+
+async def m012_shop_checkout_limits(db: Database):
+    """
+    Per-shop checkout rate limit and concurrency, NULL for the defaults.
+    """
+    await db.execute("ALTER TABLE webshop.shop ADD COLUMN checkout_rate_limit INTEGER")
+    await db.execute("ALTER TABLE webshop.shop ADD COLUMN checkout_concurrency INTEGER")
+
+
+async def m013_client_data_unpaid_index(db: Database):
+    """
+    Partial index over the unpaid orders, so the reaper of expired orders
+    does not step over the paid ones.
+    """
+    await db.execute(
+        _create_index(db, "client_data_unpaid_created_at_idx", "client_data", "created_at", where="paid = false")
+    )
+
+
+async def m014_order_items_double_encoded(db: Database):
+    """
+    Backfill the line items m008 skipped, of orders whose legacy items were
+    JSON encoded twice by older clients, and count them in the product stats.
+    """
+    rows: list[dict] = await db.fetchall(
+        """
+        SELECT id, shop_id, items, created_at FROM webshop.client_data
+        WHERE items IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM webshop.order_items WHERE order_items.client_data_id = client_data.id
+        )
+        """
+    )
+    if await _backfill_order_items(db, rows):
+        await db.execute("DELETE FROM webshop.product_stats")
+        await _backfill_product_stats(db)
+
+
+async def _backfill_order_items(db: Database, rows: list[dict]) -> int:
+    """Insert the line items held in the legacy items column of `rows`, returns how many."""
+    inserted = 0
+    for row in rows:
+        items = row["items"]
+        try:
+            # older clients sent the items as a string, which got encoded once more
+            while isinstance(items, str):
+                items = json.loads(items)
+        except (TypeError, ValueError):
+            continue
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict) or not item.get("name"):
+                continue
+            await db.execute(
+                f"""
+                INSERT INTO webshop.order_items
+                    (id, client_data_id, shop_id, item_id, name, quantity, price, created_at)
+                VALUES (:id, :client_data_id, :shop_id, :item_id, :name, :quantity, :price,
+                    {db.timestamp_placeholder("created_at")})
+                """,
+                {
+                    "id": urlsafe_short_hash(),
+                    "client_data_id": row["id"],
+                    "shop_id": row["shop_id"],
+                    "item_id": item.get("item_id") or item.get("id"),
+                    "name": item["name"],
+                    "quantity": int(item.get("quantity") or 1),
+                    "price": item.get("price"),
+                    "created_at": row["created_at"],
+                },
+            )
+            inserted += 1
+    return inserted
+
+
+async def _backfill_product_stats(db: Database) -> None:
+    await db.execute(
+        """
+        INSERT INTO webshop.product_stats (shop_id, name, quantity, revenue)
+        SELECT order_items.shop_id, order_items.name, SUM(order_items.quantity),
+            SUM(order_items.quantity * COALESCE(order_items.price, 0))
+        FROM webshop.order_items
+        JOIN webshop.client_data ON client_data.id = order_items.client_data_id
+        WHERE client_data.paid = true
+        GROUP BY order_items.shop_id, order_items.name
+        """
+    )
+
+
+def _create_index(db: Database, name: str, table: str, columns: str, where: str = "") -> str:
+    # SQLite qualifies the index name with the schema, postgres the table name
+    condition = f" WHERE {where}" if where else ""
+    if db.type == SQLITE:
+        return f"CREATE INDEX IF NOT EXISTS webshop.{name} ON {table} ({columns}){condition}"
+    return f"CREATE INDEX IF NOT EXISTS {name} ON webshop.{table} ({columns}){condition}"
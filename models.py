@@ -1,9 +1,21 @@
 from __future__ import annotations
 
+import json
 from datetime import datetime, timezone
+from typing import Generic, TypeVar
 
 from lnbits.db import FilterModel
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, validator
+
+T = TypeVar("T")
+
+
+class CursorPage(BaseModel, Generic[T]):
+    data: list[T]
+    # only counted on request, the count is what makes every page slow
+    total: int | None = None
+    # None on the last page
+    next_cursor: str | None = None
 
 
 ########################### Shop ############################
@@ -19,6 +31,9 @@ class CreateShop(BaseModel):
     allowed_tags: str | None = None
     allow_bitcoin: bool = True
     allow_fiat: bool = True
+    # checkouts per minute per client address and checkouts in flight, None for the defaults
+    checkout_rate_limit: int | None = Field(default=None, ge=1)
+    checkout_concurrency: int | None = Field(default=None, ge=1)
 
 
 class Shop(BaseModel):
@@ -35,6 +50,8 @@ class Shop(BaseModel):
     allowed_tags: str | None = None
     allow_bitcoin: bool = True
     allow_fiat: bool = True
+    checkout_rate_limit: int | None = None
+    checkout_concurrency: int | None = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -81,6 +98,7 @@ class ShopFilters(FilterModel):
 
 ########################### Orders (Client Data) ############################
 class CreateClientDataItem(BaseModel):
+    item_id: str | None = None
     name: str
     quantity: int = Field(ge=1)
     price: float | None = None
@@ -93,19 +111,44 @@ class CreateClientData(BaseModel):
     email: EmailStr | None = None
     number: str | None = None
     shipped: bool = False
-    items: list[CreateClientDataItem] | str | None = None
+    items: list[CreateClientDataItem] | None = None
+
+    @validator("items", pre=True)
+    def items_from_json(cls, value):
+        # clients from before webshop.order_items send the items as a JSON string
+        if isinstance(value, str):
+            try:
+                return json.loads(value) if value.strip() else None
+            except ValueError as exc:
+                raise ValueError("items must be a list or its JSON encoding") from exc
+        return value
 
 
 class ClientData(CreateClientData):
     id: str
     shop_id: str
-    # stored as serialized json string in DB
-    items: str | None = None
+    # line items live in webshop.order_items, the legacy items column is not read
+    items: list[CreateClientDataItem] | None = Field(default=None, no_database=True)
+    # quoted at checkout, so the order never needs converting again
+    currency: str | None = None
+    amount: float | None = None
+    amount_sat: int | None = None
     paid: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class OrderItem(BaseModel):
+    id: str
+    client_data_id: str
+    shop_id: str
+    item_id: str | None = None
+    name: str
+    quantity: int
+    price: float | None = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
 class ClientDataFilters(FilterModel):
     __search_fields__ = [
         "product",
@@ -123,6 +166,7 @@ class ClientDataFilters(FilterModel):
         "number",
         "shipped",
         "paid",
+        "amount_sat",
         "created_at",
         "updated_at",
     ]
@@ -135,10 +179,78 @@ class ClientDataFilters(FilterModel):
     number: str | None
     shipped: bool | None
     paid: bool | None
+    amount_sat: int | None
     created_at: datetime | None
     updated_at: datetime | None
 
 
+class BulkUpdateClientData(BaseModel):
+    ids: list[str] = Field(min_items=1, max_items=1000)
+    shipped: bool
+
+
+class BulkDeleteClientData(BaseModel):
+    ids: list[str] = Field(min_items=1, max_items=1000)
+
+
+class BulkClientDataResult(BaseModel):
+    # orders changed, ids of other users' orders are skipped
+    count: int
+
+
+class PurgeResult(BaseModel):
+    client_data: int
+    order_items: int
+
+
+class DailyStats(BaseModel):
+    # orders placed on this UTC day, paid_orders and revenue count those of them that were paid
+    day: str
+    orders: int = 0
+    paid_orders: int = 0
+    revenue: float = 0
+    revenue_sat: int = 0
+
+
+class ProductStats(BaseModel):
+    name: str
+    quantity: int = 0
+    revenue: float = 0
+
+
+class CheckoutCounters(BaseModel):
+    # since the last restart, rejected checkouts got a 429
+    admitted: int = 0
+    rate_limited: int = 0
+    overloaded: int = 0
+    in_flight: int = 0
+
+
+class ShopStats(BaseModel):
+    shop_id: str
+    orders: int = 0
+    paid_orders: int = 0
+    paid_ratio: float = 0
+    revenue: float = 0
+    revenue_sat: int = 0
+    days: list[DailyStats] = []
+    top_products: list[ProductStats] = []
+    checkouts: CheckoutCounters = CheckoutCounters()
+
+
+class RebuildStatsResult(BaseModel):
+    shops: int
+
+
+class ExpiredOrdersResult(BaseModel):
+    client_data: int
+
+
+class ClientDataStatus(BaseModel):
+    id: str
+    paid: bool
+
+
 class ClientDataPaymentRequest(BaseModel):
     client_data_id: str
     payment_request: str | None = None
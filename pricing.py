@@ -0,0 +1,144 @@
+# Description: Server side pricing of orders from an in-memory index of the
+# linked inventory, so the browser's prices are never trusted.
+
+import asyncio
+from time import monotonic
+from typing import NamedTuple
+
+from loguru import logger
+
+from .cache import LRUCache
+from .inventory import (
+    fetch_inventory_changes,
+    fetch_inventory_items,
+    item_tags,
+    item_updated_at,
+    parse_allowed_tags,
+)
+from .models import CreateClientDataItem, Shop
+
+# seconds before an index is brought up to date with the changed items
+PRICE_INDEX_REFRESH = 30
+# seconds before an index is dropped and rebuilt in full, which also catches deletions
+PRICE_INDEX_REBUILD = 600
+# unknown item ids trigger a refresh at most this often (seconds)
+PRICE_INDEX_MIN_REFRESH = 2
+# prices that could not be confirmed for this long (seconds) reject the order
+PRICE_MAX_AGE = 300
+
+
+class PriceEntry(NamedTuple):
+    name: str
+    price: float
+    tags: list[str]
+    # None for items whose stock is not tracked
+    stock: int | None = None
+
+
+class PricedOrder(NamedTuple):
+    items: list[CreateClientDataItem]
+    # per item id, the stock figure the order was priced with, None if untracked
+    stock: dict[str, int | None]
+
+
+class PriceIndex:
+    """Prices and stock of the active items of one inventory, keyed by item id."""
+
+    def __init__(self, inventory_id: str) -> None:
+        self.inventory_id = inventory_id
+        self.prices: dict[str, PriceEntry] = {}
+        # newest item update seen, changes are fetched from here on
+        self.watermark = 0.0
+        self.refreshed_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def age(self) -> float:
+        if self.refreshed_at is None:
+            return float("inf")
+        return monotonic() - self.refreshed_at
+
+    async def refresh(self) -> None:
+        """
+        Load the whole inventory once, afterwards only the items changed since
+        the last refresh. Concurrent callers share one refresh.
+        """
+        requested = monotonic()
+        async with self._lock:
+            if self.refreshed_at is not None and self.refreshed_at >= requested:
+                return
+            started = monotonic()
+            if self.refreshed_at is None:
+                self.apply(await fetch_inventory_items(self.inventory_id))
+            else:
+                self.apply(await fetch_inventory_changes(self.inventory_id, self.watermark))
+            self.refreshed_at = started
+
+    def apply(self, items: list[dict]) -> None:
+        for item in items:
+            item_id = item.get("id")
+            if not item_id:
+                continue
+            self.watermark = max(self.watermark, item_updated_at(item))
+            try:
+                price = float(item["price"])
+            except (KeyError, TypeError, ValueError):
+                price = None
+            if item.get("is_active") is False or price is None:
+                self.prices.pop(item_id, None)
+                continue
+            try:
+                stock = int(item["quantity_in_stock"])
+            except (KeyError, TypeError, ValueError):
+                stock = None
+            self.prices[item_id] = PriceEntry(
+                name=item.get("name") or item_id, price=price, tags=item_tags(item), stock=stock
+            )
+
+
+price_indexes = LRUCache(max_entries=1024, ttl=PRICE_INDEX_REBUILD)
+
+
+def get_price_index(inventory_id: str) -> PriceIndex:
+    index = price_indexes.get(inventory_id)
+    if index is None:
+        index = PriceIndex(inventory_id)
+        price_indexes.set(inventory_id, index)
+    return index
+
+
+async def price_order_items(shop: Shop, items: list[CreateClientDataItem]) -> PricedOrder:
+    """
+    The order's items with the names and prices of the shop's inventory, and
+    the stock of those items read from the same index entries. Raises
+    ValueError for unknown items, items the shop does not sell, prices that
+    changed since the cart was filled or that cannot be confirmed.
+    """
+    if not shop.inventory_id:
+        raise ValueError("This shop has no inventory to price orders from.")
+    if not items:
+        raise ValueError("The order has no items.")
+
+    index = get_price_index(shop.inventory_id)
+    unknown = any(item.item_id not in index.prices for item in items)
+    if index.age > PRICE_INDEX_REFRESH or (unknown and index.age > PRICE_INDEX_MIN_REFRESH):
+        try:
+            await index.refresh()
+        except Exception as exc:
+            logger.warning(f"Could not refresh prices of inventory {shop.inventory_id}: {exc}")
+    if index.age > PRICE_MAX_AGE:
+        raise ValueError("Prices are currently unavailable, please try again later.")
+
+    allowed = parse_allowed_tags(shop.allowed_tags)
+    priced = []
+    stock: dict[str, int | None] = {}
+    for item in items:
+        item_id = item.item_id or ""
+        entry = index.prices.get(item_id)
+        if entry is None or (allowed and not allowed.intersection(entry.tags)):
+            raise ValueError(f"{item.name} is not available.")
+        if item.price is not None and abs(item.price - entry.price) > 1e-9:
+            raise ValueError(f"The price of {entry.name} has changed, please review your cart.")
+        priced.append(item.copy(update={"name": entry.name, "price": entry.price}))
+        stock[item_id] = entry.stock
+    return PricedOrder(priced, stock)
@@ -0,0 +1,45 @@
+# Description: Bitcoin prices of the fiat currencies shops sell in, cached so
+# bursts of checkouts share one exchange rate lookup.
+
+from lnbits.utils.exchange_rates import btc_price
+from loguru import logger
+
+from .cache import LRUCache
+
+# seconds a fetched price is used for quotes
+RATE_CACHE_TTL = 60
+# seconds between background refreshes of the currencies in use, below the TTL
+# so checkouts of active shops do not wait for a lookup
+RATE_REFRESH_INTERVAL = 45
+
+# BTC price per currency code
+rate_cache = LRUCache(max_entries=256, ttl=RATE_CACHE_TTL)
+
+
+async def get_btc_price(currency: str) -> float:
+    """Price of one bitcoin in `currency`, concurrent misses share one lookup."""
+    currency = currency.upper()
+    return await rate_cache.get_or_load(currency, lambda: _fetch_btc_price(currency))
+
+
+async def fiat_amount_as_sats(amount: float, currency: str) -> int:
+    if currency.lower() == "sat":
+        return round(amount)
+    price = await get_btc_price(currency)
+    return round(amount * 100_000_000 / price)
+
+
+async def refresh_rates(currencies: list[str]) -> None:
+    """Fetch the current price of `currencies` ahead of the checkouts needing them."""
+    for currency in {currency.upper() for currency in currencies if currency.lower() != "sat"}:
+        try:
+            rate_cache.set(currency, await _fetch_btc_price(currency))
+        except Exception as exc:
+            logger.warning(f"Could not refresh the {currency} exchange rate: {exc}")
+
+
+async def _fetch_btc_price(currency: str) -> float:
+    price = await btc_price(currency)
+    if not price > 0:
+        raise ValueError(f"Could not get exchange rate for {currency}.")
+    return price
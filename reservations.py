@@ -0,0 +1,119 @@
+# Description: In-memory ledger of the stock held by checkouts that are
+# waiting for their invoice to be paid.
+
+from collections import OrderedDict
+from collections.abc import Mapping
+from time import monotonic
+from typing import NamedTuple
+
+from .models import CreateClientDataItem
+
+# seconds a hold outlives the invoice, for a settlement still in the queue
+RESERVATION_GRACE = 60
+
+
+class Reservation(NamedTuple):
+    inventory_id: str
+    # per item id, the quantity held and the stock figure it was held against
+    quantities: dict[str, int]
+    stock: dict[str, int]
+    expires_at: float
+
+
+class StockReservations:
+    """
+    Quantities per inventory item held by unpaid checkouts, and sold by
+    paid ones since the inventory last reported the item's stock.
+
+    Reserving checks and takes the quantities of an order without awaiting
+    anything, so concurrent checkouts can never hold more than the stock,
+    at constant cost per line item. Every hold lives for the same time, so
+    the expired ones are always at the front of `holds`.
+    """
+
+    def __init__(self) -> None:
+        self.holds: OrderedDict[str, Reservation] = OrderedDict()
+        self.held: dict[tuple[str, str], int] = {}
+        # per item, the stock figure the sales were made against and the units sold
+        self.sold: dict[tuple[str, str], tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.holds)
+
+    def available(self, inventory_id: str, item_id: str, stock: int) -> int:
+        key = (inventory_id, item_id)
+        sold_against, sold = self.sold.get(key, (stock, 0))
+        # a different stock figure means the inventory was updated since the sales
+        if sold_against != stock:
+            self.sold.pop(key)
+            sold = 0
+        return stock - self.held.get(key, 0) - sold
+
+    def reserve(
+        self,
+        client_data_id: str,
+        inventory_id: str,
+        items: list[CreateClientDataItem],
+        stock: Mapping[str, int | None],
+        ttl: float,
+    ) -> None:
+        """
+        Hold the quantities of an order's items for `ttl` seconds. Items
+        without a stock figure are not tracked. Raises ValueError, holding
+        nothing, when an item has not enough stock left.
+        """
+        self.expire()
+        quantities: dict[str, int] = {}
+        figures: dict[str, int] = {}
+        for item in items:
+            item_stock = stock.get(item.item_id) if item.item_id else None
+            if item.item_id and item_stock is not None:
+                quantities[item.item_id] = quantities.get(item.item_id, 0) + item.quantity
+                figures[item.item_id] = item_stock
+        for item in items:
+            if item.item_id in quantities:
+                if quantities[item.item_id] > self.available(inventory_id, item.item_id, figures[item.item_id]):
+                    raise ValueError(f"{item.name} is out of stock.")
+        if not quantities:
+            return
+        for item_id, quantity in quantities.items():
+            key = (inventory_id, item_id)
+            self.held[key] = self.held.get(key, 0) + quantity
+        self.holds[client_data_id] = Reservation(
+            inventory_id, quantities, figures, monotonic() + ttl + RESERVATION_GRACE
+        )
+
+    def release(self, client_data_id: str) -> Reservation | None:
+        """Give the held quantities of an order back, e.g. when its checkout failed."""
+        reservation = self.holds.pop(client_data_id, None)
+        if reservation is None:
+            return None
+        for item_id, quantity in reservation.quantities.items():
+            key = (reservation.inventory_id, item_id)
+            self.held[key] -= quantity
+            if not self.held[key]:
+                del self.held[key]
+        return reservation
+
+    def commit(self, client_data_ids: list[str]) -> None:
+        """Turn the holds of paid orders into sales."""
+        for client_data_id in client_data_ids:
+            reservation = self.release(client_data_id)
+            if reservation is None:
+                continue
+            for item_id, quantity in reservation.quantities.items():
+                key = (reservation.inventory_id, item_id)
+                stock = reservation.stock[item_id]
+                sold_against, sold = self.sold.get(key, (stock, 0))
+                self.sold[key] = (stock, (sold if sold_against == stock else 0) + quantity)
+
+    def expire(self) -> None:
+        now = monotonic()
+        while self.holds:
+            client_data_id, reservation = next(iter(self.holds.items()))
+            if reservation.expires_at > now:
+                return
+            self.release(client_data_id)
+
+
+stock_reservations = StockReservations()
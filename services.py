@@ -1,79 +1,208 @@
+import asyncio
 import json
+from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+from typing import NamedTuple
 
 from lnbits.core.models import Payment
 from lnbits.core.services import create_invoice
+from lnbits.helpers import urlsafe_short_hash
+from lnbits.settings import settings
 from loguru import logger
 
+from .cache import LRUCache
 from .crud import (
     create_client_data,
+    delete_client_data,
+    delete_expired_client_data,
     get_client_data_by_id,
+    get_client_data_by_ids,
     get_shop_by_id,
-    update_client_data,
+    mark_client_data_paid,
+    update_client_data_paid,
 )
+from .events import order_events, order_waiters
+from .inventory import fetch_inventory_items, filter_items_by_tags
+from .limits import checkout_admission
+from .metrics import timed
 from .models import (
+    ClientData,
     ClientDataPaymentRequest,  #
     CreateClientData,
+    Shop,
 )
+from .pricing import price_order_items
+from .rates import fiat_amount_as_sats
+from .reservations import stock_reservations
+
+CATALOG_CACHE_TTL = 60
+CATALOG_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# how long a checkout can be replayed with the same Idempotency-Key
+IDEMPOTENCY_TTL = 600
+IDEMPOTENCY_MAX_ENTRIES = 10_000
+# seconds after which the unpaid order of an abandoned checkout is deleted
+UNPAID_ORDER_MAX_AGE = 24 * 3600
+
+
+class ShopCatalog(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: datetime
+
+
+# serialized catalogs, evicted least recently used first once over the byte budget
+catalog_cache = LRUCache(max_size=CATALOG_CACHE_MAX_BYTES, ttl=CATALOG_CACHE_TTL)
+# checkouts by (shop id, Idempotency-Key), with the fingerprint of their request
+checkout_cache = LRUCache(max_entries=IDEMPOTENCY_MAX_ENTRIES, ttl=IDEMPOTENCY_TTL)
+
+
+class IdempotentCheckout(NamedTuple):
+    fingerprint: str
+    payment_request: ClientDataPaymentRequest
+
+
+async def get_shop_catalog(shop: Shop) -> ShopCatalog:
+    """
+    The shop's visible inventory items as a ready to send JSON body.
+    Concurrent requests for a cold shop share one inventory fetch.
+    """
+    if not shop.inventory_id:
+        raise ValueError("No inventory linked to this shop.")
+    inventory_id = shop.inventory_id
+
+    async def _load() -> ShopCatalog:
+        try:
+            items = await timed("fetch_inventory_items", fetch_inventory_items(inventory_id))
+        except Exception as exc:
+            logger.warning(f"Could not load inventory {inventory_id}: {exc}")
+            raise ValueError("Could not load products from inventory.") from exc
+        items = filter_items_by_tags(items, shop.allowed_tags)
+        body = json.dumps(items, separators=(",", ":")).encode()
+        return ShopCatalog(
+            body=body,
+            etag=f'"{sha256(body).hexdigest()[:32]}"',
+            last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+        )
+
+    return await catalog_cache.get_or_load(shop.id, _load, sizeof=lambda catalog: len(catalog.body))
+
+
+def invalidate_shop_catalog(shop_id: str) -> None:
+    catalog_cache.pop(shop_id)
+
+
+def client_data_amount(data: CreateClientData) -> float:
+    """Invoice amount of an order in the shop currency: the sum of price * quantity."""
+    return sum((item.price or 0.0) * item.quantity for item in data.items or [])
 
 
 async def payment_request_for_client_data(
     shop_id: str,
     data: CreateClientData,
+    client: str | None = None,
 ) -> ClientDataPaymentRequest:
-
+    """
+    Create the invoice and the order row for a checkout, priced from the
+    shop's inventory rather than the prices sent by the browser.
+    Both are written concurrently under a pre-generated order id; if either
+    fails the order row is removed again, so no unpayable orders are left.
+    Checkouts over the shop's limits, rate limited per `client` address,
+    raise CheckoutRejectedError before doing any work.
+    """
     shop = await get_shop_by_id(shop_id)
     if not shop:
         raise ValueError("Invalid shop ID.")
+    async with checkout_admission.admit(shop, client):
+        return await _checkout(shop, data)
 
-    client_data = await create_client_data(shop_id, data)
-    # Calculate invoice amount in the shop currency (defaults to sat)
-    amount: float = 0.0
-    currency = getattr(shop, "currency", None) or "sat"
 
-    raw_items = data.items
-    if isinstance(raw_items, str):
-        raw_items = json.loads(raw_items)
-    if raw_items:
+async def _checkout(shop: Shop, data: CreateClientData) -> ClientDataPaymentRequest:
+    shop_id = shop.id
+    priced = await timed("price_order_items", price_order_items(shop, data.items or []))
+    data = data.copy(update={"items": priced.items})
+    amount = client_data_amount(data)
+    if amount <= 0:
+        raise ValueError("Order amount must be greater than zero.")
+    currency = getattr(shop, "currency", None) or "sat"
+    # quoted here from the cached rate instead of by create_invoice per order
+    amount_sat = await timed("fiat_amount_as_sats", fiat_amount_as_sats(amount, currency))
+    if amount_sat <= 0:
+        raise ValueError("Order amount must be at least one sat.")
 
-        def _to_float(value, default=0.0):
-            try:
-                return float(value)
-            except Exception:
-                return float(default)
-
-        for entry in raw_items:
-            as_dict = entry.dict() if hasattr(entry, "dict") else entry
-            if isinstance(as_dict, dict):
-                price_val = as_dict.get("price")
-                qty_val = as_dict.get("quantity")
-            else:
-                price_val = getattr(entry, "price", None)
-                qty_val = getattr(entry, "quantity", None)
-            price = _to_float(price_val, 0.0)
-            qty = _to_float(qty_val, 1.0)
-            amount += price * qty
-
-    amount = float(amount or 0.0)
-
-    invoice = await create_invoice(
-        wallet_id=shop.wallet,
-        amount=amount,
-        currency=currency,
-        memo=f"Webshop order {client_data.id} for {data.product}",
-        extra={"tag": "webshop", "client_data_id": client_data.id},
+    client_data_id = urlsafe_short_hash()
+    extra: dict = {"tag": "webshop", "client_data_id": client_data_id}
+    if currency.lower() != "sat":
+        extra.update(fiat_currency=currency, fiat_amount=round(amount, 3))
+    # held for the invoice lifetime, against the stock the order was priced with,
+    # since the index may have been evicted or refreshed while quoting the rate
+    stock_reservations.reserve(
+        client_data_id, shop.inventory_id or "", priced.items, priced.stock, settings.lightning_invoice_expiry
     )
-    client_data_resp = ClientDataPaymentRequest(
-        client_data_id=client_data.id,
+    client_data, invoice = await asyncio.gather(
+        create_client_data(
+            shop_id,
+            data,
+            client_data_id=client_data_id,
+            currency=currency,
+            amount=amount,
+            amount_sat=amount_sat,
+        ),
+        timed(
+            "create_invoice",
+            create_invoice(
+                wallet_id=shop.wallet,
+                amount=amount_sat,
+                currency="sat",
+                memo=f"Webshop order {client_data_id} for {data.product}",
+                extra=extra,
+            ),
+        ),
+        return_exceptions=True,
+    )
+    for result in (invoice, client_data):
+        if isinstance(result, BaseException):
+            # an invoice without its order is never handed out and simply expires
+            stock_reservations.release(client_data_id)
+            await delete_client_data(shop_id, client_data_id)
+            raise result
+
+    if isinstance(client_data, ClientData):
+        order_events.publish(shop.user_id, "created", client_data.json(exclude={"items"}))
+    return ClientDataPaymentRequest(
+        client_data_id=client_data_id,
         payment_request=getattr(invoice, "bolt11", None),
         payment_hash=getattr(invoice, "checking_id", None),
     )
-    return client_data_resp
+
+
+async def idempotent_payment_request_for_client_data(
+    shop_id: str,
+    data: CreateClientData,
+    idempotency_key: str,
+    client: str | None = None,
+) -> ClientDataPaymentRequest:
+    """
+    `payment_request_for_client_data` once per idempotency key: retries,
+    also concurrent ones, get the first payment request back without
+    another order or invoice. Reusing a key for another order is an error.
+    """
+    fingerprint = sha256(data.json(sort_keys=True).encode()).hexdigest()
+
+    async def _checkout() -> IdempotentCheckout:
+        return IdempotentCheckout(fingerprint, await payment_request_for_client_data(shop_id, data, client))
+
+    checkout = await checkout_cache.get_or_load((shop_id, idempotency_key), _checkout)
+    if checkout.fingerprint != fingerprint:
+        raise ValueError("Idempotency-Key was already used for a different order.")
+    return checkout.payment_request
 
 
 async def payment_received_for_client_data(payment: Payment) -> bool:
     """
     Mark an order as paid when invoice is settled.
     Expect payment.extra to carry {"tag": "webshop", "client_data_id": "..."}.
+    Returns True only for the event that flipped the order, so duplicate
+    invoice events are no-ops.
     """
     try:
         if payment.extra.get("tag") != "webshop":
@@ -81,15 +210,88 @@ async def payment_received_for_client_data(payment: Payment) -> bool:
         client_data_id = payment.extra.get("client_data_id")
         if not client_data_id:
             return False
-        client_data = await get_client_data_by_id(client_data_id)
-        if not client_data:
+        if not await update_client_data_paid(client_data_id):
             return False
-        if client_data.paid:
-            return True
-        client_data.paid = True
-        await update_client_data(client_data)
         logger.info(f"Order {client_data_id} marked paid.")
+        await client_data_paid([client_data_id])
         return True
     except Exception as exc:  # pragma: no cover
         logger.error(f"Error marking order paid: {exc}")
         return False
+
+
+async def payments_received_for_client_data(payments: list[Payment]) -> list[str]:
+    """
+    Mark the orders of a batch of settled invoices as paid in one statement.
+    Returns the ids of the orders that were newly marked paid.
+    """
+    client_data_ids = list(
+        dict.fromkeys(
+            payment.extra["client_data_id"]
+            for payment in payments
+            if payment.extra.get("tag") == "webshop" and payment.extra.get("client_data_id")
+        )
+    )
+    paid_ids = await mark_client_data_paid(client_data_ids)
+    if paid_ids:
+        logger.info(f"Orders {', '.join(paid_ids)} marked paid.")
+        await client_data_paid(paid_ids)
+    return paid_ids
+
+
+async def client_data_paid(client_data_ids: list[str]) -> None:
+    """
+    Follow-ups of orders newly marked paid, shared by both settlement paths.
+    The orders are paid already, so a failing follow-up is logged for its
+    order and the others still run, settling again would skip them all.
+    """
+    for client_data_id in client_data_ids:
+        for follow_up in (stock_reservations.commit, order_waiters.resolve):
+            try:
+                follow_up([client_data_id])
+            except Exception as exc:
+                logger.error(f"Error following up on paid order {client_data_id}: {exc}")
+    try:
+        paid = await get_client_data_by_ids(client_data_ids)
+    except Exception as exc:
+        logger.error(f"Error reading paid orders {', '.join(client_data_ids)}: {exc}")
+        return
+    for client_data in paid:
+        try:
+            await publish_order_event("paid", client_data)
+        except Exception as exc:
+            logger.error(f"Error publishing paid order {client_data.id}: {exc}")
+
+
+async def wait_for_client_data_paid(client_data_id: str, timeout: float) -> bool | None:
+    """
+    Whether an order is paid, waiting up to `timeout` seconds for it to be.
+    None if there is no such order.
+    """
+    async with order_waiters.watch(client_data_id) as paid:
+        # watch before reading, so a settlement in between is not missed
+        client_data = await get_client_data_by_id(client_data_id)
+        if not client_data:
+            return None
+        if client_data.paid or timeout <= 0:
+            return client_data.paid
+        try:
+            return await asyncio.wait_for(asyncio.shield(paid), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+
+async def publish_order_event(event_type: str, client_data: ClientData) -> None:
+    """Push an order to the dashboards of the shop owner."""
+    shop = await get_shop_by_id(client_data.shop_id)
+    if shop:
+        order_events.publish(shop.user_id, event_type, client_data.json(exclude={"items"}))
+
+
+async def delete_expired_orders(max_age: int = UNPAID_ORDER_MAX_AGE) -> int:
+    """
+    Delete the unpaid checkout orders placed more than `max_age` seconds ago.
+    Orders are kept at least as long as their invoice can still be paid.
+    """
+    max_age = max(max_age, settings.lightning_invoice_expiry)
+    return await delete_expired_client_data(datetime.now(timezone.utc) - timedelta(seconds=max_age))
@@ -103,9 +103,13 @@ window.app = Vue.createApp({
       },
 
       clientDataList: [],
+      // keyset cursors of the visited order pages, reset when the order changes
+      clientDataCursors: {key: null, pages: {}, total: null},
+      orderEvents: null,
       clientDataTable: {
         search: '',
         loading: false,
+        selected: [],
         columns: [
           {
             name: 'product',
@@ -142,6 +146,13 @@ window.app = Vue.createApp({
             field: 'number',
             sortable: true
           },
+          {
+            name: 'amount_sat',
+            align: 'right',
+            label: 'Sats',
+            field: 'amount_sat',
+            sortable: true
+          },
           {
             name: 'paid',
             align: 'center',
@@ -178,6 +189,12 @@ window.app = Vue.createApp({
         data: {},
         items: [],
         itemsLoading: false
+      },
+      shopStatsDialog: {
+        show: false,
+        shop: {},
+        stats: null,
+        loading: false
       }
     }
   },
@@ -271,6 +288,9 @@ window.app = Vue.createApp({
         if (Array.isArray(data.allowed_tags)) {
           data.allowed_tags = data.allowed_tags.join(',')
         }
+        for (const limit of ['checkout_rate_limit', 'checkout_concurrency']) {
+          if (!data[limit]) data[limit] = null
+        }
         const method = data.id ? 'PUT' : 'POST'
         const entry = data.id ? `/${data.id}` : ''
         await LNbits.api.request(
@@ -370,25 +390,79 @@ window.app = Vue.createApp({
           this.clientDataTable,
           props
         )
+        const {page, rowsPerPage, sortBy, descending} =
+          this.clientDataTable.pagination
+        const key = [sortBy, descending, rowsPerPage, params.get('search')]
+          .map(String)
+          .join('|')
+        const cursors = this.clientDataCursors
+        if (!props || cursors.key !== key) {
+          Object.assign(cursors, {key, pages: {1: ''}, total: null})
+        }
+        // pages reached with next/previous follow a cursor, jumps fall back to offsets
+        const cursor = cursors.pages[page]
+        const keyset =
+          cursor !== undefined && ['created_at', 'updated_at'].includes(sortBy)
+        if (keyset) {
+          params.set('cursor', cursor)
+          params.set('include_total', cursors.total === null)
+        }
         const {data} = await LNbits.api.request(
           'GET',
           `/webshop/api/v1/client_data/paginated?${params}`,
           null
         )
         this.clientDataList = data.data
-        this.clientDataTable.pagination.rowsNumber = data.total
+        if (keyset) {
+          if (data.next_cursor) cursors.pages[page + 1] = data.next_cursor
+          if (data.total !== null) cursors.total = data.total
+          this.clientDataTable.pagination.rowsNumber = cursors.total
+        } else {
+          this.clientDataTable.pagination.rowsNumber = data.total
+        }
       } catch (error) {
         LNbits.utils.notifyApiError(error)
       } finally {
         this.clientDataTable.loading = false
       }
     },
-    async exportClientDataCSV() {
-      await LNbits.utils.exportCSV(
-        this.clientDataTable.columns,
-        this.clientDataList,
-        'orders_' + new Date().toISOString().slice(0, 10) + '.csv'
-      )
+    exportClientDataCSV() {
+      // streamed by the server, covers every order and not only this page
+      window.location.href = '/webshop/api/v1/client_data/export?format=csv'
+    },
+    async bulkShipClientData(shipped) {
+      try {
+        const ids = this.clientDataTable.selected.map(row => row.id)
+        await LNbits.api.request(
+          'PATCH',
+          '/webshop/api/v1/client_data/bulk',
+          null,
+          {ids, shipped}
+        )
+        this.clientDataTable.selected = []
+        this.getClientData()
+      } catch (error) {
+        LNbits.utils.notifyApiError(error)
+      }
+    },
+    async bulkDeleteClientData() {
+      const ids = this.clientDataTable.selected.map(row => row.id)
+      await LNbits.utils
+        .confirmDialog(`Are you sure you want to delete ${ids.length} orders?`)
+        .onOk(async () => {
+          try {
+            await LNbits.api.request(
+              'DELETE',
+              '/webshop/api/v1/client_data/bulk',
+              null,
+              {ids}
+            )
+            this.clientDataTable.selected = []
+            this.getClientData()
+          } catch (error) {
+            LNbits.utils.notifyApiError(error)
+          }
+        })
     },
     async toggleShipped(row) {
       const payload = {
@@ -421,18 +495,31 @@ window.app = Vue.createApp({
     showOrderRow(_, row) {
       this.showOrderDetails(row)
     },
+    showShopStats(shop) {
+      this.shopStatsDialog.shop = shop
+      this.shopStatsDialog.stats = null
+      this.shopStatsDialog.show = true
+      this.fetchShopStats('GET', `/webshop/api/v1/shop/${shop.id}/stats`)
+    },
+    rebuildShopStats() {
+      this.fetchShopStats(
+        'POST',
+        `/webshop/api/v1/shop/${this.shopStatsDialog.shop.id}/stats/rebuild`
+      )
+    },
+    async fetchShopStats(method, url) {
+      this.shopStatsDialog.loading = true
+      try {
+        const {data} = await LNbits.api.request(method, url, null)
+        this.shopStatsDialog.stats = data
+      } catch (error) {
+        LNbits.utils.notifyApiError(error)
+      } finally {
+        this.shopStatsDialog.loading = false
+      }
+    },
     async fetchOrderItems(id) {
       try {
-        // Try to use items stored on the row first
-        const row = this.clientDataList.find(r => r.id === id)
-        if (row && row.items) {
-          try {
-            this.clientDataDialog.items = JSON.parse(row.items) || []
-            return
-          } catch (e) {
-            /* fall through to API */
-          }
-        }
         const {data} = await LNbits.api.request(
           'GET',
           `/webshop/api/v1/client_data/${id}/items`,
@@ -445,11 +532,52 @@ window.app = Vue.createApp({
       } finally {
         this.clientDataDialog.itemsLoading = false
       }
+    },
+    subscribeOrderEvents() {
+      // the browser reconnects on its own and resumes with Last-Event-ID
+      this.orderEvents = new EventSource('/webshop/api/v1/client_data/events')
+      this.orderEvents.addEventListener('created', event =>
+        this.applyOrderEvent(JSON.parse(event.data), true)
+      )
+      this.orderEvents.addEventListener('paid', event =>
+        this.applyOrderEvent(JSON.parse(event.data), false)
+      )
+      this.orderEvents.addEventListener('reset', () => this.getClientData())
+    },
+    applyOrderEvent(order, created) {
+      const {page, sortBy, descending, rowsPerPage} =
+        this.clientDataTable.pagination
+      if (created) {
+        this.clientDataTable.pagination.rowsNumber += 1
+        if (this.clientDataCursors.total !== null) {
+          this.clientDataCursors.total += 1
+        }
+      }
+      // new and just paid orders sort first in the default, newest first, view
+      const onTop =
+        page === 1 &&
+        descending &&
+        !this.clientDataTable.search &&
+        (sortBy === 'updated_at' || (created && sortBy === 'created_at'))
+      if (onTop) {
+        const rows = this.clientDataList.filter(row => row.id !== order.id)
+        this.clientDataList = [order, ...rows].slice(0, rowsPerPage)
+        // the cursors of later pages no longer line up with the first page
+        this.clientDataCursors.pages = {1: ''}
+      } else {
+        this.clientDataList = this.clientDataList.map(row =>
+          row.id === order.id ? order : row
+        )
+      }
     }
   },
   async created() {
     await this.fetchInventoryId()
     this.getShop()
     this.getClientData()
+    this.subscribeOrderEvents()
+  },
+  beforeUnmount() {
+    if (this.orderEvents) this.orderEvents.close()
   }
 })
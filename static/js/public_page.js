@@ -0,0 +1,839 @@
+// Storefront script for templates/webshop/public_page.html.
+// Expects SHOP_DATA and SHOP_ID to be defined by the page.
+
+const PLACEHOLDER_IMG = 'https://dummyimage.com/900x700/f3f4f6/9ca3af.png&text=No+Image';
+
+
+(() => {
+  const state = {
+    shop: SHOP_DATA || {},
+    inventoryId:
+      (SHOP_DATA && SHOP_DATA.inventory_id) ||
+      new URLSearchParams(window.location.search).get('inventory_id') ||
+      '',
+    products: [],
+    filtered: [],
+    tags: ['__all'],
+    search: '',
+    selectedTag: '__all',
+    loading: false,
+    error: '',
+    cart: [],
+    focusedItem: null,
+    modalImages: [],
+    modalIndex: 0,
+    page: 1,
+    pageSize: 20,
+    checkoutStep: 0,
+    checkoutDetails: {
+      address: '',
+      email: '',
+      number: ''
+    },
+    checkoutMethod: '',
+    invoice: null,
+    invoiceWatch: null,
+    checkoutNonce: randomToken()
+  };
+
+  const els = {
+    grid: document.getElementById('grid'),
+    search: document.getElementById('search'),
+    error: document.getElementById('error'),
+    empty: document.getElementById('empty'),
+    loader: document.getElementById('loader'),
+    tagList: document.getElementById('tag-list'),
+    cartCount: document.getElementById('cart-count'),
+    openCart: document.getElementById('open-cart'),
+    cartModal: document.getElementById('cart-modal'),
+    productModal: document.getElementById('product-modal'),
+    toast: document.getElementById('toast'),
+    pagination: document.getElementById('pagination'),
+    modalImage: document.getElementById('modal-image'),
+    modalPrice: document.getElementById('modal-price'),
+    modalTitle: document.getElementById('modal-title'),
+    modalDescription: document.getElementById('modal-description'),
+    modalTags: document.getElementById('modal-tags'),
+    modalStock: document.getElementById('modal-stock'),
+    modalAdd: document.getElementById('modal-add'),
+    modalPrev: document.getElementById('modal-prev'),
+    modalNext: document.getElementById('modal-next'),
+    modalIndicator: document.getElementById('modal-indicator'),
+    cartItems: document.getElementById('cart-items'),
+    cartSummary: document.getElementById('cart-summary'),
+    cartTotal: document.getElementById('cart-total'),
+    cartTotalDetails: document.getElementById('cart-total-details'),
+    checkoutTabs: document.getElementById('checkout-tabs'),
+    paneCart: document.getElementById('pane-cart'),
+    paneDetails: document.getElementById('pane-details'),
+    panePayment: document.getElementById('pane-payment'),
+    checkoutNext: document.getElementById('checkout-next'),
+    detailsNext: document.getElementById('details-next'),
+    detailsBack: document.getElementById('details-back'),
+    paymentBack: document.getElementById('payment-back'),
+    payButton: document.getElementById('pay-button'),
+    detailAddress: document.getElementById('detail-address'),
+    detailEmail: document.getElementById('detail-email'),
+    detailNumber: document.getElementById('detail-number'),
+    methodBitcoin: document.getElementById('method-bitcoin'),
+    methodFiat: document.getElementById('method-fiat'),
+    paymentStatus: document.getElementById('payment-status'),
+    invoiceQr: document.getElementById('invoice-qr-img'),
+    cartTotalPayval: document.getElementById('cart-total-payval')
+  };
+
+  function setTheme() {
+    const root = document.documentElement.style;
+    if (state.shop.primary_color) root.setProperty('--primary', state.shop.primary_color);
+    if (state.shop.secondary_color) root.setProperty('--secondary', state.shop.secondary_color);
+  }
+
+  function renderInvoice() {
+    if (!state.invoice) return;
+    const text = state.invoice.request || '';
+    if (els.invoiceQr && text) {
+      els.invoiceQr.src = `/api/v1/qrcode/${encodeURIComponent(text)}`;
+      els.invoiceQr.alt = 'Payment QR';
+    }
+  }
+
+  function randomToken() {
+    return Math.random().toString(36).slice(2) + Date.now().toString(36);
+  }
+
+  // FNV-1a, identical checkout payloads map to the same idempotency key
+  function payloadHash(text) {
+    let hash = 0x811c9dc5;
+    for (let i = 0; i < text.length; i++) {
+      hash ^= text.charCodeAt(i);
+      hash = Math.imul(hash, 0x01000193);
+    }
+    return (hash >>> 0).toString(16);
+  }
+
+  function markInvoicePaid() {
+    stopInvoiceWatcher();
+    state.invoice.paid = true;
+    // the next checkout is a new order even with the same cart
+    state.checkoutNonce = randomToken();
+    if (els.paymentStatus) els.paymentStatus.textContent = 'Payment received!';
+    toast('Payment received');
+    closeModal('cart');
+    state.cart = [];
+    renderCart();
+    setCheckoutStep(0);
+  }
+
+  function stopInvoiceWatcher() {
+    if (!state.invoiceWatch) return;
+    state.invoiceWatch.controller.abort();
+    state.invoiceWatch = null;
+  }
+
+  async function startInvoiceWatcher() {
+    if (!state.invoice || !state.invoice.clientDataId) return;
+    stopInvoiceWatcher();
+    // a newer invoice replaces this token and ends the loop below
+    const watch = (state.invoiceWatch = {controller: new AbortController()});
+    const url = `/webshop/api/v1/client_data/${state.invoice.clientDataId}/status?wait=25`;
+    while (state.invoiceWatch === watch) {
+      try {
+        const response = await fetch(url, {signal: watch.controller.signal});
+        if (state.invoiceWatch !== watch) return;
+        // a deleted or expired order, or any other client error, is final
+        const {status} = response;
+        if (status >= 400 && status < 500 && status !== 408 && status !== 429) {
+          stopInvoiceWatcher();
+          if (status === 404 && els.paymentStatus) {
+            els.paymentStatus.textContent = 'This order is no longer available.';
+          }
+          return;
+        }
+        if (!response.ok) {
+          const retryAfter = Number(response.headers.get('Retry-After')) || 5;
+          await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+          continue;
+        }
+        const data = await response.json();
+        if (data.paid && state.invoiceWatch === watch) {
+          markInvoicePaid();
+        }
+      } catch (err) {
+        if (state.invoiceWatch !== watch) return;
+        await new Promise(resolve => setTimeout(resolve, 5000));
+      }
+    }
+  }
+
+  function toast(message) {
+    if (!els.toast) return;
+    els.toast.textContent = message;
+    els.toast.classList.add('is-visible');
+    setTimeout(() => els.toast.classList.remove('is-visible'), 2200);
+  }
+
+  function formatAmount(amount) {
+    const numeric = Number(amount) || 0;
+    return new Intl.NumberFormat(undefined, {
+      minimumFractionDigits: 0,
+      maximumFractionDigits: 2
+    }).format(numeric);
+  }
+
+  function cartTotalValue() {
+    return state.cart.reduce((sum, item) => sum + (Number(item.price) || 0) * item.quantity, 0);
+  }
+
+  function currencyLabel() {
+    return state.shop.currency || 'sat';
+  }
+
+  function priceLabel(item) {
+    return `${formatAmount(item.price)} ${currencyLabel()}`;
+  }
+
+  function stockLabel(item) {
+    const stock = item.quantity_in_stock;
+    if (stock === null || stock === undefined) return 'in stock';
+    return `${stock} in stock`;
+  }
+
+  function parseTags(raw) {
+    if (!raw) return [];
+    if (Array.isArray(raw)) return raw.map(t => normalizeTag(t, false)).filter(Boolean);
+    const str = String(raw).trim();
+    if (!str) return [];
+    try {
+      const parsed = JSON.parse(str);
+      if (Array.isArray(parsed)) return parsed.map(t => normalizeTag(t, false)).filter(Boolean);
+    } catch (err) {/* ignore */}
+    return str
+      .split(',')
+      .map(t => normalizeTag(t, false))
+      .filter(Boolean);
+  }
+
+  function normalizeTag(tag, toLower = true) {
+    if (tag === undefined || tag === null) return '';
+    const trimmed = String(tag).trim();
+    return toLower ? trimmed.toLowerCase() : trimmed;
+  }
+
+  function parseImages(item) {
+    if (!item || !item.images) return [];
+
+    const toAssetUrl = id => {
+      if (!id) return '';
+      const val = String(id).trim();
+      if (!val) return '';
+      if (val.startsWith('http')) return val;
+      if (val.startsWith('/api/')) return val;
+      return `/api/v1/assets/${val}/binary`;
+    };
+
+    const append = list => list.map(toAssetUrl).filter(Boolean);
+
+    if (Array.isArray(item.images)) return append(item.images);
+
+    const raw = String(item.images).trim();
+    if (!raw) return [];
+
+    try {
+      const parsed = JSON.parse(raw);
+      if (Array.isArray(parsed)) return append(parsed);
+    } catch (err) {
+      /* ignore parse errors */
+    }
+
+    if (raw.includes('|||')) return append(raw.split('|||'));
+    if (raw.includes(',')) return append(raw.split(','));
+    if (raw.startsWith('data:')) return [raw];
+    return append([raw]);
+  }
+
+  function parseImage(item) {
+    const imgs = parseImages(item);
+    return imgs[0] || '';
+  }
+
+  function tagsFor(item) {
+    if (!item.__tags) {
+      item.__tags = parseTags(item.tags);
+      item.__tagsLower = item.__tags.map(t => normalizeTag(t));
+    }
+    return item.__tags;
+  }
+
+  function tagsLowerFor(item) {
+    if (!item.__tagsLower) tagsFor(item);
+    return item.__tagsLower || [];
+  }
+
+  function renderTags() {
+    if (!els.tagList) return;
+    els.tagList.innerHTML = '';
+    state.tags.forEach(tag => {
+      const btn = document.createElement('button');
+      btn.className = 'btn-chip';
+      btn.dataset.tag = tag;
+      btn.textContent = tag === '__all' ? 'All' : tag;
+      els.tagList.appendChild(btn);
+    });
+    updateTagActive();
+  }
+
+  function updateTagActive() {
+    if (!els.tagList) return;
+    const active = state.selectedTag.toLowerCase();
+    els.tagList.querySelectorAll('button[data-tag]').forEach(btn => {
+      btn.classList.toggle(
+        'is-active',
+        btn.dataset.tag.toLowerCase() === active
+      );
+    });
+  }
+
+  function filterProducts() {
+    const term = state.search.trim().toLowerCase();
+    const activeTag = normalizeTag(state.selectedTag);
+    const allowed = normalizeTag(state.shop.allowed_tags || '')
+      .split(',')
+      .map(t => t.trim())
+      .filter(Boolean);
+    state.filtered = state.products.filter(item => {
+      const itemTags = tagsLowerFor(item);
+      const matchesTag = activeTag === '__all' || itemTags.includes(activeTag);
+      const matchesAllowed = !allowed.length || itemTags.some(t => allowed.includes(t));
+      const haystack = `${item.name || ''} ${item.description || ''} ${item.tags || ''}`.toLowerCase();
+      const matchesSearch = !term || haystack.includes(term);
+      return matchesTag && matchesAllowed && matchesSearch;
+    });
+    state.page = 1;
+    renderProducts();
+    updateTagActive();
+  }
+
+  function renderProducts() {
+    if (!els.grid) return;
+    els.grid.innerHTML = '';
+    if (state.loading) {
+      els.loader.style.display = 'block';
+      els.empty.style.display = 'none';
+      return;
+    }
+    els.loader.style.display = 'none';
+    if (!state.filtered.length) {
+      els.empty.style.display = 'block';
+      if (els.pagination) els.pagination.style.display = 'none';
+      return;
+    }
+    els.empty.style.display = 'none';
+    const start = (state.page - 1) * state.pageSize;
+    const visible = state.filtered.slice(start, start + state.pageSize);
+    visible.forEach(item => {
+      const card = document.createElement('article');
+      card.className = 'product-card';
+      const imgUrl = parseImage(item);
+      const itemTags = tagsFor(item);
+      card.innerHTML = `
+        <div class="product-thumb" style="${imgUrl ? `background-image:url('${imgUrl}')` : ''}">
+          ${itemTags[0] ? `<div class="tag-label">${itemTags[0]}</div>` : ''}
+        </div>
+        <div class="product-body">
+          <div class="title">${item.name || 'Unnamed product'}</div>
+          <div class="description">${item.description || 'No description provided yet.'}</div>
+          <div class="meta">
+            <span class="price">${priceLabel(item)}</span>
+            <span class="stock">${stockLabel(item)}</span>
+          </div>
+        </div>
+        <div class="card-actions">
+          <button class="btn-ghost is-secondary" data-view>View</button>
+          <button class="btn-primary" data-add>Add</button>
+        </div>
+      `;
+      card.querySelector('[data-view]').onclick = e => {
+        e.stopPropagation();
+        openProductModal(item);
+      };
+      card.querySelector('[data-add]').onclick = e => {
+        e.stopPropagation();
+        addToCart(item);
+      };
+      card.onclick = e => {
+        if (e.target.dataset.add || e.target.dataset.view) return;
+        openProductModal(item);
+      };
+      els.grid.appendChild(card);
+    });
+    renderPagination();
+  }
+
+  function updateCounts() {
+    const totalVal = cartTotalValue();
+    const total = state.cart.reduce((sum, item) => sum + item.quantity, 0);
+    const totalLabel = `${total} item${total === 1 ? '' : 's'}`;
+    els.cartCount.textContent = total;
+    els.cartSummary.textContent = totalLabel;
+    els.cartTotal.textContent = `Total: ${formatAmount(
+      totalVal
+    )} ${currencyLabel()}`;
+    if (els.cartTotalDetails) {
+      els.cartTotalDetails.textContent = `Total: ${formatAmount(totalVal)} ${currencyLabel()}`;
+    }
+    updateCheckoutUI();
+  }
+
+  function renderCart() {
+    if (!els.cartItems) return;
+    els.cartItems.innerHTML = '';
+    if (!state.cart.length) {
+      els.cartItems.innerHTML = '<div class="empty" style="margin:8px 0;">Cart is empty. Add a product to get started.</div>';
+      updateCounts();
+      return;
+    }
+    state.cart.forEach(entry => {
+      const row = document.createElement('div');
+      row.className = 'cart-row';
+      row.innerHTML = `
+        <div>
+          <div class="title" style="margin:0 0 4px;font-size:15px;">${entry.name}</div>
+          <div class="stock">${priceLabel(entry)}</div>
+        </div>
+        <div class="qty">
+          <button class="qty-btn" data-dec>-</button>
+          <span>${entry.quantity}</span>
+          <button class="qty-btn" data-inc>+</button>
+        </div>
+      `;
+      row.querySelector('[data-dec]').onclick = () => updateQuantity(entry.id, -1);
+      row.querySelector('[data-inc]').onclick = () => updateQuantity(entry.id, 1);
+      els.cartItems.appendChild(row);
+    });
+    updateCounts();
+  }
+
+  function updateQuantity(id, delta) {
+    const entry = state.cart.find(i => i.id === id);
+    if (!entry) return;
+    const limit =
+      typeof entry.quantity_in_stock === 'number'
+        ? Math.max(entry.quantity_in_stock, 0)
+        : Infinity;
+    entry.quantity = Math.min(Math.max(entry.quantity + delta, 0), limit || 0);
+    if (entry.quantity <= 0) {
+      state.cart = state.cart.filter(i => i.id !== id);
+    }
+    renderCart();
+  }
+
+  function addToCart(item) {
+    const existing = state.cart.find(i => i.id === item.id);
+    const limit =
+      typeof item.quantity_in_stock === 'number'
+        ? Math.max(item.quantity_in_stock, 0)
+        : Infinity;
+    if (existing) {
+      if (existing.quantity >= limit) return;
+      existing.quantity += 1;
+    } else {
+      state.cart.push({
+        id: item.id,
+        name: item.name,
+        price: item.price,
+        quantity: limit === Infinity ? 1 : Math.min(1, limit),
+        quantity_in_stock: item.quantity_in_stock
+      });
+    }
+    renderCart();
+    toast('Added to cart');
+  }
+
+  function openProductModal(item) {
+    state.focusedItem = item;
+    const images = parseImages(item);
+    state.modalImages = images.length ? images : [PLACEHOLDER_IMG];
+    state.modalIndex = 0;
+    updateModalImage();
+    els.modalTitle.textContent = item.name || 'Untitled product';
+    els.modalDescription.textContent = item.description || 'No description provided yet.';
+    els.modalPrice.textContent = priceLabel(item);
+    els.modalStock.textContent = stockLabel(item);
+    els.modalTags.innerHTML = '';
+    parseTags(item.tags).forEach(tag => {
+      const span = document.createElement('span');
+      span.className = 'pill-outline';
+      span.textContent = tag;
+      els.modalTags.appendChild(span);
+    });
+    els.modalAdd.onclick = () => addToCart(item);
+    els.productModal.classList.add('is-visible');
+  }
+
+  function closeModal(which) {
+    if (which === 'product') els.productModal.classList.remove('is-visible');
+    if (which === 'cart') {
+      els.cartModal.classList.remove('is-visible');
+      stopInvoiceWatcher();
+    }
+  }
+
+  function updateModalImage() {
+    if (!els.modalImage) return;
+    const total = state.modalImages.length;
+    const current = Math.max(0, Math.min(state.modalIndex, total - 1));
+    state.modalIndex = current;
+    els.modalImage.src = state.modalImages[current] || PLACEHOLDER_IMG;
+    if (els.modalIndicator) {
+      els.modalIndicator.textContent = total > 1 ? `${current + 1} / ${total}` : '';
+    }
+    if (els.modalPrev) els.modalPrev.disabled = total <= 1;
+    if (els.modalNext) els.modalNext.disabled = total <= 1;
+  }
+
+  function changeModalImage(delta) {
+    if (!state.modalImages.length) return;
+    const total = state.modalImages.length;
+    state.modalIndex = (state.modalIndex + delta + total) % total;
+    updateModalImage();
+  }
+
+  function updateCheckoutUI() {
+    const tabs = els.checkoutTabs ? els.checkoutTabs.querySelectorAll('button[data-step]') : [];
+    tabs.forEach(btn => {
+      const step = Number(btn.dataset.step || 0);
+      btn.classList.toggle('is-active', step === state.checkoutStep);
+    });
+
+    if (els.paneCart) els.paneCart.style.display = state.checkoutStep === 0 ? 'flex' : 'none';
+    if (els.paneDetails) els.paneDetails.style.display = state.checkoutStep === 1 ? 'flex' : 'none';
+    if (els.panePayment) els.panePayment.style.display = state.checkoutStep === 2 ? 'flex' : 'none';
+
+    if (els.checkoutNext) {
+      els.checkoutNext.disabled = state.cart.length === 0;
+    }
+
+    const allowBitcoin = state.shop.allow_bitcoin !== false;
+    const allowFiat = state.shop.allow_fiat !== false;
+    if (els.methodBitcoin) {
+      els.methodBitcoin.style.display = allowBitcoin ? 'inline-flex' : 'none';
+      els.methodBitcoin.classList.toggle('is-active', state.checkoutMethod === 'bitcoin');
+    }
+    if (els.methodFiat) {
+      els.methodFiat.style.display = allowFiat ? 'inline-flex' : 'none';
+      els.methodFiat.classList.toggle('is-active', state.checkoutMethod === 'fiat');
+    }
+    if (!allowBitcoin && state.checkoutMethod === 'bitcoin') state.checkoutMethod = '';
+    if (!allowFiat && state.checkoutMethod === 'fiat') state.checkoutMethod = '';
+    if (!allowBitcoin && !allowFiat && els.paymentStatus) {
+      els.paymentStatus.textContent = 'No payment methods enabled for this shop.';
+    }
+
+    if (els.detailAddress) els.detailAddress.value = state.checkoutDetails.address || '';
+    if (els.detailEmail) els.detailEmail.value = state.checkoutDetails.email || '';
+    if (els.detailNumber) els.detailNumber.value = state.checkoutDetails.number || '';
+
+    const totalVal = cartTotalValue();
+    if (els.cartTotalPayval) {
+      els.cartTotalPayval.textContent = `${formatAmount(totalVal)} ${currencyLabel()}`;
+    }
+    if (els.payButton) {
+      els.payButton.disabled = !state.checkoutMethod || !state.cart.length;
+    }
+  }
+
+  function setCheckoutStep(step) {
+    state.checkoutStep = Math.max(0, Math.min(step, 2));
+    updateCheckoutUI();
+  }
+
+  async function submitCheckout() {
+    if (!state.checkoutMethod) {
+      toast('Select a payment method');
+      return;
+    }
+    if (!state.cart.length) {
+      toast('Cart is empty');
+      return;
+    }
+    if (els.paymentStatus) {
+      els.paymentStatus.textContent = 'Creating order...';
+    }
+    try {
+      const summaryName =
+        state.cart.length === 1
+          ? state.cart[0].name
+          : `${state.cart.length} items`;
+      const payload = {
+        product: summaryName,
+        quantity: state.cart.reduce((sum, item) => sum + item.quantity, 0),
+        address: state.checkoutDetails.address || null,
+        email: state.checkoutDetails.email || null,
+        number: state.checkoutDetails.number || null,
+        items: state.cart.map(entry => ({
+          item_id: entry.id,
+          name: entry.name,
+          quantity: entry.quantity,
+          price: entry.price
+        }))
+      };
+      const body = JSON.stringify(payload);
+      const response = await fetch(
+        `/webshop/api/v1/client_data/public/${SHOP_ID}`,
+        {
+          method: 'PUT',
+          headers: {
+            'Content-Type': 'application/json',
+            // retries and double clicks get the same invoice back
+            'Idempotency-Key': `${state.checkoutNonce}-${payloadHash(body)}`
+          },
+          body
+        }
+      );
+      if (!response.ok) {
+        const error = await response.json().catch(() => ({}));
+        throw new Error(error.detail || 'Unable to start checkout.');
+      }
+      const data = await response.json();
+      if (data.payment_request) {
+        state.invoice = {
+          request: data.payment_request,
+          hash: data.payment_hash,
+          clientDataId: data.client_data_id,
+          paid: false
+        }
+        renderInvoice();
+        startInvoiceWatcher();
+      }
+      if (els.paymentStatus) {
+        els.paymentStatus.textContent = data.payment_request
+          ? 'Awaiting payment...'
+          : 'Order captured.';
+      }
+      toast('Order captured. Complete payment to finish.');
+    } catch (err) {
+      console.error(err);
+      if (els.paymentStatus) {
+        els.paymentStatus.textContent = err.message || 'Unable to start checkout.';
+      }
+      toast('Could not start checkout');
+    }
+  }
+
+  function totalPages() {
+    return Math.max(1, Math.ceil(state.filtered.length / state.pageSize));
+  }
+
+  function setPage(page) {
+    const max = totalPages();
+    state.page = Math.min(Math.max(page, 1), max);
+    renderProducts();
+  }
+
+  function renderPagination() {
+    if (!els.pagination) return;
+    els.pagination.innerHTML = '';
+    const max = totalPages();
+    if (max <= 1) {
+      els.pagination.style.display = 'none';
+      return;
+    }
+    els.pagination.style.display = 'flex';
+
+    const createBtn = (label, page, disabled = false, isActive = false) => {
+      const btn = document.createElement('button');
+      btn.className = 'pager-btn' + (isActive ? ' is-active' : '');
+      btn.textContent = label;
+      btn.disabled = disabled;
+      btn.onclick = () => setPage(page);
+      els.pagination.appendChild(btn);
+    };
+
+    createBtn('‹', state.page - 1, state.page === 1, false);
+    for (let p = 1; p <= max; p++) {
+      createBtn(p, p, false, p === state.page);
+    }
+    createBtn('›', state.page + 1, state.page === max, false);
+  }
+
+  function showCart() {
+    els.cartModal.classList.add('is-visible');
+    state.checkoutStep = 0;
+    state.checkoutMethod = '';
+    updateCheckoutUI();
+  }
+
+  function attachEvents() {
+    els.search.addEventListener('input', e => {
+      state.search = e.target.value;
+      filterProducts();
+    });
+    if (els.tagList) {
+      els.tagList.addEventListener('click', e => {
+        const btn = e.target.closest('button[data-tag]');
+        if (!btn) return;
+        const tagValue = normalizeTag(btn.dataset.tag);
+        state.selectedTag = tagValue;
+        filterProducts();
+      });
+    }
+    els.openCart.onclick = showCart;
+    document.querySelectorAll('.modal-close').forEach(btn => {
+      btn.onclick = () => closeModal(btn.dataset.close);
+    });
+    window.addEventListener('keyup', e => {
+      if (e.key === 'Escape') {
+        closeModal('product');
+        closeModal('cart');
+      }
+    });
+    els.productModal.addEventListener('click', e => {
+      if (e.target === els.productModal) closeModal('product');
+    });
+    els.cartModal.addEventListener('click', e => {
+      if (e.target === els.cartModal) closeModal('cart');
+    });
+    if (els.modalPrev) {
+      els.modalPrev.addEventListener('click', () => changeModalImage(-1));
+    }
+    if (els.modalNext) {
+      els.modalNext.addEventListener('click', () => changeModalImage(1));
+    }
+    if (els.checkoutTabs) {
+      els.checkoutTabs.addEventListener('click', e => {
+        const btn = e.target.closest('button[data-step]');
+        if (!btn) return;
+        setCheckoutStep(Number(btn.dataset.step));
+      });
+    }
+    if (els.checkoutNext) {
+      els.checkoutNext.addEventListener('click', () => setCheckoutStep(1));
+    }
+    if (els.detailsBack) {
+      els.detailsBack.addEventListener('click', () => setCheckoutStep(0));
+    }
+    if (els.detailsNext) {
+      els.detailsNext.addEventListener('click', () => setCheckoutStep(2));
+    }
+    if (els.paymentBack) {
+      els.paymentBack.addEventListener('click', () => setCheckoutStep(1));
+    }
+    if (els.payButton) {
+      els.payButton.addEventListener('click', submitCheckout);
+    }
+    if (els.invoiceQr) {
+      els.invoiceQr.addEventListener('click', () => {
+        if (!state.invoice || !state.invoice.request) return;
+        navigator.clipboard
+          .writeText(state.invoice.request)
+          .then(() => toast('Invoice copied to clipboard'))
+          .catch(() => toast('Unable to copy invoice'));
+      });
+    }
+    if (els.detailAddress) {
+      els.detailAddress.addEventListener('input', e => {
+        state.checkoutDetails.address = e.target.value;
+      });
+    }
+    if (els.detailEmail) {
+      els.detailEmail.addEventListener('input', e => {
+        state.checkoutDetails.email = e.target.value;
+      });
+    }
+    if (els.detailNumber) {
+      els.detailNumber.addEventListener('input', e => {
+        state.checkoutDetails.number = e.target.value;
+      });
+    }
+    if (els.methodBitcoin) {
+      els.methodBitcoin.addEventListener('click', () => {
+        state.checkoutMethod = 'bitcoin';
+        updateCheckoutUI();
+      });
+    }
+    if (els.methodFiat) {
+      els.methodFiat.addEventListener('click', () => {
+        state.checkoutMethod = 'fiat';
+        updateCheckoutUI();
+      });
+    }
+  }
+
+  async function fetchProducts() {
+    if (!state.inventoryId) {
+      state.error = 'No inventory linked to this shop yet.';
+      renderErrors();
+      return;
+    }
+    state.loading = true;
+    renderProducts();
+    try {
+      const response = await fetch(`/webshop/api/v1/catalog/${SHOP_ID}`);
+      if (!response.ok) throw new Error('Unable to load products.');
+      const payload = await response.json();
+      state.products = Array.isArray(payload) ? payload.filter(Boolean) : [];
+      state.tags = ['__all'];
+      state.products.forEach(item => {
+        const itemTags = tagsFor(item);
+        const lower = tagsLowerFor(item);
+        lower.forEach(tag => {
+          if (tag && !state.tags.includes(tag)) state.tags.push(tag);
+        });
+      });
+      renderTags();
+      filterProducts();
+      openFromQuery();
+    } catch (err) {
+      console.error(err);
+      state.error = 'Could not load products from inventory.';
+      renderErrors();
+    } finally {
+      state.loading = false;
+      renderProducts();
+    }
+  }
+
+  function renderErrors() {
+    if (!els.error) return;
+    if (state.error) {
+      els.error.style.display = 'block';
+      els.error.textContent = state.error;
+    } else {
+      els.error.style.display = 'none';
+    }
+  }
+
+  function openFromQuery() {
+    const params = new URLSearchParams(window.location.search);
+    const itemId = params.get('item');
+    const tag = params.get('tag');
+    const search = params.get('q');
+    if (tag) {
+      state.selectedTag = normalizeTag(tag);
+      renderTags();
+      filterProducts();
+    }
+    if (search) {
+      state.search = search;
+      els.search.value = search;
+      filterProducts();
+    }
+    if (itemId) {
+      const match = state.products.find(p => p.id === itemId);
+      if (match) {
+        openProductModal(match);
+      }
+    }
+  }
+
+  function init() {
+    if (state.shop.allow_bitcoin === undefined) state.shop.allow_bitcoin = true;
+    if (state.shop.allow_fiat === undefined) state.shop.allow_fiat = true;
+    setTheme();
+    attachEvents();
+    renderCart();
+    fetchProducts();
+  }
+
+  init();
+})();
@@ -1,29 +1,138 @@
 import asyncio
+from collections import deque
+from time import monotonic
 
 from lnbits.core.models import Payment
 from lnbits.tasks import register_invoice_listener
 from loguru import logger
 
-from .services import payment_received_for_client_data
+from .crud import get_shop_currencies
+from .metrics import settlement_duration
+from .rates import RATE_REFRESH_INTERVAL, refresh_rates
+from .services import (
+    delete_expired_orders,
+    payment_received_for_client_data,
+    payments_received_for_client_data,
+)
 
 #######################################
 ########## RUN YOUR TASKS HERE ########
 #######################################
 
+# Settlement runs as a pool of workers, each draining the invoice queue into
+# micro-batches that are marked paid with a single UPDATE.
+SETTLEMENT_WORKERS = 4
+SETTLEMENT_BATCH_SIZE = 100
+# seconds a worker waits for more payments before settling a partial batch
+SETTLEMENT_BATCH_WINDOW = 0.05
+# seconds between sweeps for the unpaid orders of abandoned checkouts
+EXPIRED_ORDERS_INTERVAL = 3600
+
+
+class SettlementMetrics:
+    """Queue depth and settlement latency of the running settlement workers."""
+
+    def __init__(self, samples: int = 1024) -> None:
+        self.queue: asyncio.Queue | None = None
+        self.batches = 0
+        self.payments = 0
+        self.errors = 0
+        # seconds from dequeuing a payment to its order being marked paid
+        self.latencies: deque[float] = deque(maxlen=samples)
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize() if self.queue else 0
+
+    def observe(self, batch_size: int, latency: float) -> None:
+        self.batches += 1
+        self.payments += batch_size
+        self.latencies.extend([latency] * batch_size)
+        settlement_duration.observe(latency, count=batch_size)
+
+    def snapshot(self) -> dict[str, float]:
+        latencies = sorted(self.latencies)
+
+        def percentile(pct: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, round(pct / 100 * (len(latencies) - 1)))]
+
+        return {
+            "queue_depth": self.queue_depth,
+            "batches": self.batches,
+            "payments": self.payments,
+            "errors": self.errors,
+            "latency_p50": percentile(50),
+            "latency_p95": percentile(95),
+            "latency_max": latencies[-1] if latencies else 0.0,
+        }
+
+
+settlement_metrics = SettlementMetrics()
+
+
 # The usual task is to listen to invoices related to this extension
 
 
 async def wait_for_paid_invoices():
-    invoice_queue = asyncio.Queue()
+    invoice_queue: asyncio.Queue = asyncio.Queue()
     register_invoice_listener(invoice_queue, "ext_webshop")
+    settlement_metrics.queue = invoice_queue
+    workers = [asyncio.create_task(settlement_worker(invoice_queue)) for _ in range(SETTLEMENT_WORKERS)]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+
+async def settlement_worker(invoice_queue: asyncio.Queue) -> None:
     while True:
-        payment = await invoice_queue.get()
-        await on_invoice_paid(payment)
+        first = await invoice_queue.get()
+        started = monotonic()
+        batch = await fill_payment_batch(invoice_queue, [first])
+        await on_invoices_paid(batch)
+        settlement_metrics.observe(len(batch), monotonic() - started)
+
+
+async def fill_payment_batch(invoice_queue: asyncio.Queue, batch: list[Payment]) -> list[Payment]:
+    """Add queued payments to `batch` until it is full or the batch window closes."""
+    deadline = monotonic() + SETTLEMENT_BATCH_WINDOW
+    while len(batch) < SETTLEMENT_BATCH_SIZE:
+        if not invoice_queue.empty():
+            batch.append(invoice_queue.get_nowait())
+            continue
+        timeout = deadline - monotonic()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(invoice_queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
 
 
 # Do somethhing when an invoice related top this extension is paid
 
 
+async def on_invoices_paid(payments: list[Payment]) -> None:
+    payments = [payment for payment in payments if payment.extra.get("tag") == "webshop"]
+    if not payments:
+        return
+
+    logger.info(f"Invoices paid for webshop: {', '.join(payment.payment_hash for payment in payments)}")
+
+    try:
+        await payments_received_for_client_data(payments)
+    except Exception as e:
+        settlement_metrics.errors += 1
+        logger.error(f"Error processing payments for webshop, settling them one by one: {e}")
+        # a bad payment must not leave the rest of its batch unpaid, settled ones are skipped
+        for payment in payments:
+            await on_invoice_paid(payment)
+
+
 async def on_invoice_paid(payment: Payment) -> None:
     if payment.extra.get("tag") != "webshop":
         return
@@ -34,3 +143,25 @@ async def on_invoice_paid(payment: Payment) -> None:
         await payment_received_for_client_data(payment)
     except Exception as e:
         logger.error(f"Error processing payment for webshop: {e}")
+
+
+async def refresh_exchange_rates() -> None:
+    """Keep the exchange rates of the currencies shops sell in fresh."""
+    while True:
+        try:
+            await refresh_rates(await get_shop_currencies())
+        except Exception as e:
+            logger.error(f"Error refreshing exchange rates for webshop: {e}")
+        await asyncio.sleep(RATE_REFRESH_INTERVAL)
+
+
+async def delete_expired_orders_periodically() -> None:
+    """Delete the unpaid orders of abandoned checkouts once their invoices expired."""
+    while True:
+        try:
+            deleted = await delete_expired_orders()
+            if deleted:
+                logger.info(f"Deleted {deleted} expired unpaid webshop orders.")
+        except Exception as e:
+            logger.error(f"Error deleting expired webshop orders: {e}")
+        await asyncio.sleep(EXPIRED_ORDERS_INTERVAL)
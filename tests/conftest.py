@@ -0,0 +1,49 @@
+from collections.abc import Callable
+
+import pytest
+import pytest_asyncio
+from lnbits.db import DB_TYPE, SQLITE, Database
+from lnbits.settings import settings
+
+from .. import crud
+from ..models import Shop
+from .helpers import run_migrations
+
+
+@pytest.fixture
+def make_shop() -> Callable[..., Shop]:
+    """Factory of shops linked to the inventory "inventory", fields overridable."""
+
+    def _make_shop(**kwargs) -> Shop:
+        fields: dict = {
+            "id": "shop",
+            "user_id": "user",
+            "name": "Shop",
+            "description": "",
+            "primary_color": "#000",
+            "secondary_color": "#fff",
+            "wallet": "wallet",
+            "inventory_id": "inventory",
+        }
+        return Shop(**{**fields, **kwargs})
+
+    return _make_shop
+
+
+@pytest_asyncio.fixture
+async def empty_db(tmp_path, monkeypatch):
+    """A throwaway SQLite extension database wired into `crud`, not migrated."""
+    if DB_TYPE != SQLITE:
+        pytest.skip("tests use a local SQLite database")
+    monkeypatch.setattr(settings, "lnbits_data_folder", str(tmp_path))
+    database = Database("ext_webshop")
+    monkeypatch.setattr(crud, "db", database)
+    crud.shop_cache.clear()
+    yield database
+    await database.engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def db(empty_db):
+    await run_migrations(empty_db)
+    return empty_db
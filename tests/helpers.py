@@ -0,0 +1,21 @@
+# Description: Helpers shared by the tests and the benchmarks.
+
+import re
+
+from lnbits.db import Database
+
+from .. import migrations
+
+
+async def run_migrations(db: Database, until: int | None = None, after: int = 0) -> None:
+    """Run the extension's migrations newer than `after`, up to and including `until`."""
+    matcher = re.compile(r"^m(\d\d\d)_")
+    steps = []
+    for key, migrate in migrations.__dict__.items():
+        match = matcher.match(key)
+        if match:
+            steps.append((int(match.group(1)), migrate))
+    async with db.connect() as conn:
+        for version, migrate in sorted(steps, key=lambda step: step[0]):
+            if version > after and (until is None or version <= until):
+                await migrate(conn)
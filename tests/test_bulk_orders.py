@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from lnbits.decorators import check_user_exists
+
+from .. import crud, views_api
+from ..models import CreateClientData, CreateShop
+
+
+async def _shop(user_id: str) -> str:
+    shop = await crud.create_shop(
+        user_id,
+        CreateShop(name="Shop", description="", primary_color="#000", secondary_color="#fff", wallet="wallet"),
+    )
+    return shop.id
+
+
+async def _orders(shop_id: str, count: int) -> list[str]:
+    data = CreateClientData(product="Mug", quantity=1)
+    return [(await crud.create_client_data(shop_id, data)).id for _ in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_bulk_ship_and_delete_only_touch_the_users_orders(db, monkeypatch):
+    own = await _orders(await _shop("user"), 5)
+    foreign = await _orders(await _shop("someone_else"), 2)
+    # several statements per request
+    monkeypatch.setattr(crud, "BULK_IDS_PER_STATEMENT", 2)
+
+    app = FastAPI()
+    app.include_router(views_api.webshop_api_router)
+    app.dependency_overrides[check_user_exists] = lambda: SimpleNamespace(id="user")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://shop") as client:
+        ids = [*own, *foreign, "unknown"]
+        response = await client.patch("/api/v1/client_data/bulk", json={"ids": ids, "shipped": True})
+        assert response.status_code == 200
+        assert response.json() == {"count": len(own)}
+        shipped = {order.id: order.shipped for order in await crud.get_client_data_by_ids(ids)}
+        assert shipped == {**dict.fromkeys(own, True), **dict.fromkeys(foreign, False)}
+
+        response = await client.request("DELETE", "/api/v1/client_data/bulk", json={"ids": [*own[:3], *foreign]})
+        assert response.status_code == 200
+        assert response.json() == {"count": 3}
+        remaining = {order.id for order in await crud.get_client_data_by_ids(ids)}
+        assert remaining == {*own[3:], *foreign}
+
+        for body in ({"ids": []}, {"ids": [f"order_{i}" for i in range(1001)]}):
+            response = await client.request("DELETE", "/api/v1/client_data/bulk", json=body)
+            assert response.status_code == 422
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from ..cache import LRUCache
+
+
+def test_lru_evicts_least_recently_used_over_size_budget():
+    cache = LRUCache(max_size=10)
+    cache.set("a", "a", size=4)
+    cache.set("b", "b", size=4)
+    assert cache.get("a") == "a"
+    cache.set("c", "c", size=4)
+    assert "b" not in cache
+    assert cache.get("a") == "a"
+    assert cache.get("c") == "c"
+    assert cache.size == 8
+    assert cache.evictions == 1
+
+
+def test_lru_expired_entries_are_misses():
+    cache = LRUCache(ttl=0)
+    cache.set("a", "a")
+    assert cache.get("a") is None
+    assert cache.misses == 1
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_coalesces_concurrent_misses():
+    cache = LRUCache()
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "value"
+
+    results = await asyncio.gather(*[cache.get_or_load("key", loader) for _ in range(20)])
+    assert results == ["value"] * 20
+    assert calls == 1
+    assert await cache.get_or_load("key", loader) == "value"
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_pop_during_load_is_not_overwritten():
+    cache = LRUCache()
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        return "stale"
+
+    task = asyncio.create_task(cache.get_or_load("key", loader))
+    await asyncio.sleep(0)
+    cache.pop("key")
+    assert await task == "stale"
+    assert "key" not in cache
@@ -0,0 +1,69 @@
+from typing import Literal
+
+import pytest
+from lnbits.db import Filters
+
+from .. import crud
+from ..models import ClientDataFilters, CreateShop
+
+
+def _filters(direction: Literal["asc", "desc"], sortby: str = "created_at") -> Filters:
+    return Filters(limit=3, sortby=sortby, direction=direction, model=ClientDataFilters)
+
+
+async def _walk(direction: Literal["asc", "desc"]) -> tuple[list[list[str]], list[str]]:
+    """The ids of every cursor page, and the cursor each page was read with."""
+    pages: list[list[str]] = []
+    cursors = [""]
+    while True:
+        page = await crud.get_client_data_cursor_page("user", _filters(direction), cursor=cursors[-1])
+        pages.append([row.id for row in page.data])
+        if not page.next_cursor:
+            return pages, cursors
+        cursors.append(page.next_cursor)
+
+
+@pytest.mark.asyncio
+async def test_cursor_pages_are_stable_with_equal_timestamps(db):
+    shop = await crud.create_shop(
+        "user", CreateShop(name="Shop", description="", primary_color="#000", secondary_color="#fff", wallet="wallet")
+    )
+    for n in range(7):
+        await db.execute(
+            """
+            INSERT INTO webshop.client_data (id, shop_id, product, quantity, created_at, updated_at)
+            VALUES (:id, :shop_id, 'Mug', 1, 1700000000, 1700000000)
+            """,
+            {"id": f"order_{n}", "shop_id": shop.id},
+        )
+    ids = [f"order_{n}" for n in range(7)]
+
+    # ties on created_at are broken by id, every order is on exactly one page
+    pages, cursors = await _walk("asc")
+    assert pages == [ids[0:3], ids[3:6], ids[6:7]]
+    pages, cursors = await _walk("desc")
+    assert pages == [ids[6:3:-1], ids[3:0:-1], ids[0:1]]
+
+    # going back to a page re-reads it from its cursor, newer orders do not shift it
+    await db.execute(
+        """
+        INSERT INTO webshop.client_data (id, shop_id, product, quantity, created_at, updated_at)
+        VALUES ('order_9', :shop_id, 'Mug', 1, 1700000000, 1700000000)
+        """,
+        {"shop_id": shop.id},
+    )
+    page = await crud.get_client_data_cursor_page("user", _filters("desc"), cursor=cursors[1])
+    assert [row.id for row in page.data] == pages[1]
+
+    # orders of other users are never paged in, a cursor is bound to its sort
+    assert (await crud.get_client_data_cursor_page("someone_else", _filters("asc"))).data == []
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        await crud.get_client_data_cursor_page("user", _filters("asc"), cursor=cursors[1])
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        await crud.get_client_data_cursor_page("user", _filters("desc"), cursor="not a cursor")
+    with pytest.raises(ValueError, match="sorts by"):
+        await crud.get_client_data_cursor_page("user", _filters("asc", sortby="product"))
+
+    page = await crud.get_client_data_cursor_page("user", _filters("asc"), include_total=True)
+    assert page.total == 8
+    assert (await crud.get_client_data_cursor_page("user", _filters("asc"))).total is None
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from ..events import RESET_EVENT, OrderEventBroker, OrderWaiters
+
+
+@pytest.mark.asyncio
+async def test_stream_resumes_after_last_event_id():
+    broker = OrderEventBroker()
+    first = broker.publish("user_0", "created", '{"id": "a"}')
+    broker.publish("user_1", "created", '{"id": "b"}')
+    second = broker.publish("user_0", "paid", '{"id": "a"}')
+
+    stream = broker.stream("user_0", first.id)
+    assert await anext(stream) == second.encode()
+    third = broker.publish("user_0", "created", '{"id": "c"}')
+    assert await anext(stream) == third.encode()
+    await stream.aclose()
+    assert not broker._subscribers
+
+
+@pytest.mark.asyncio
+async def test_stream_resets_when_events_are_gone():
+    broker = OrderEventBroker(buffer_size=2)
+    first = broker.publish("user_0", "created", "{}")
+    for _ in range(3):
+        broker.publish("user_0", "paid", "{}")
+
+    for last_event_id in (first.id, "otherrun-1"):
+        stream = broker.stream("user_0", last_event_id)
+        assert await anext(stream) == RESET_EVENT
+        await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_viewers_of_an_order_share_one_waiter():
+    waiters = OrderWaiters(max_orders=1)
+
+    async def view():
+        async with waiters.watch("order_0") as paid:
+            return await paid
+
+    viewers = [asyncio.create_task(view()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert len(waiters) == 1
+    assert waiters.is_full("order_1") and not waiters.is_full("order_0")
+
+    waiters.resolve(["order_0"])
+    assert await asyncio.gather(*viewers) == [True] * 3
+    assert len(waiters) == 0
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from .. import crud
+from ..models import CreateClientData, CreateShop
+
+
+@pytest.mark.asyncio
+async def test_only_expired_checkout_orders_are_deleted(db):
+    shop = await crud.create_shop(
+        "user", CreateShop(name="Shop", description="", primary_color="#000", secondary_color="#fff", wallet="wallet")
+    )
+    data = CreateClientData(product="Mug", quantity=1)
+    checkout = await crud.create_client_data(shop.id, data, amount=10, amount_sat=20)
+    # added by the merchant through the admin API, there is no invoice to pay
+    manual = await crud.create_client_data(shop.id, data)
+    shipped = await crud.create_client_data(shop.id, data.copy(update={"shipped": True}), amount=10, amount_sat=20)
+    paid = await crud.create_client_data(shop.id, data, amount=10, amount_sat=20)
+    assert await crud.update_client_data_paid(paid.id)
+
+    later = datetime.now(timezone.utc) + timedelta(hours=1)
+    assert await crud.delete_expired_client_data(later) == 1
+    assert await crud.get_client_data_by_id(checkout.id) is None
+    for order in (manual, shipped, paid):
+        assert await crud.get_client_data_by_id(order.id)
+    assert await crud.delete_expired_client_data(later) == 0
@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from lnbits.decorators import check_user_exists
+
+from .. import crud, export, views_api
+from ..models import CreateClientData, CreateClientDataItem, CreateShop
+
+
+async def _shop(user_id: str) -> str:
+    shop = await crud.create_shop(
+        user_id,
+        CreateShop(name="Shop", description="", primary_color="#000", secondary_color="#fff", wallet="wallet"),
+    )
+    return shop.id
+
+
+@pytest.mark.asyncio
+async def test_export_streams_the_users_orders_with_their_items(db, monkeypatch):
+    own, other = await _shop("user"), await _shop("user")
+    foreign = await _shop("someone_else")
+    items = [
+        CreateClientDataItem(item_id="mug", name="Mug", quantity=2, price=1500),
+        CreateClientDataItem(name="Pin", quantity=1),
+    ]
+    data = CreateClientData(product="Mug", quantity=3, email="buyer@example.com", items=items)
+    orders = [await crud.create_client_data(own, data, currency="EUR", amount=30, amount_sat=3000) for _ in range(3)]
+    orders.append(await crud.create_client_data(other, CreateClientData(product="Cap", quantity=1)))
+    await crud.create_client_data(foreign, CreateClientData(product="Hat", quantity=1))
+    assert await crud.update_client_data_paid(orders[0].id)
+    # several chunks per shop
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 2)
+
+    app = FastAPI()
+    app.include_router(views_api.webshop_api_router)
+    app.dependency_overrides[check_user_exists] = lambda: SimpleNamespace(id="user")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://shop") as client:
+        response = await client.get("/api/v1/client_data/export", params={"format": "csv"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert sorted(row["id"] for row in rows) == sorted(order.id for order in orders)
+        by_id = {row["id"]: row for row in rows}
+        first = by_id[orders[0].id]
+        assert (first["shop_id"], first["email"], first["paid"], first["shipped"]) == (
+            own,
+            "buyer@example.com",
+            "True",
+            "False",
+        )
+        assert (first["currency"], first["amount"], first["amount_sat"]) == ("EUR", "30.0", "3000")
+        assert first["items"] == "2 x Mug @ 1500.0; 1 x Pin"
+        assert by_id[orders[3].id]["items"] == ""
+
+        response = await client.get("/api/v1/client_data/export", params={"format": "ndjson", "shop_id": own})
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert {line["id"] for line in lines} == {order.id for order in orders[:3]}
+        # in the keyset order the chunks are read in
+        keys = [(line["created_at"], line["id"]) for line in lines]
+        assert keys == sorted(keys)
+        assert lines[0]["items"][0] == {"item_id": "mug", "name": "Mug", "quantity": 2, "price": 1500}
+
+        response = await client.get("/api/v1/client_data/export", params={"shop_id": foreign})
+        assert response.status_code == 403
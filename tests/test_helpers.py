@@ -0,0 +1,28 @@
+from ..helpers import accepted_encodings, is_not_modified
+
+
+def test_is_not_modified_matches_strong_weak_and_listed_etags():
+    etag = '"abc"'
+    assert is_not_modified('"abc"', etag)
+    assert is_not_modified('W/"abc"', etag)
+    assert is_not_modified('"old", W/"abc" , "other"', etag)
+    assert is_not_modified("*", etag)
+    assert not is_not_modified('"abd"', etag)
+    assert not is_not_modified(None, etag)
+
+
+def test_is_not_modified_prefers_if_none_match_over_dates():
+    last_modified = 1_700_000_000.0
+    since = "Tue, 14 Nov 2023 22:13:20 GMT"
+    assert is_not_modified(None, '"abc"', since, last_modified)
+    assert not is_not_modified(None, '"abc"', since, last_modified + 1)
+    assert not is_not_modified(None, '"abc"', "not a date", last_modified)
+    # a mismatching ETag wins over a matching date
+    assert not is_not_modified('"old"', '"abc"', since, last_modified)
+
+
+def test_accepted_encodings_drops_codings_refused_by_q0():
+    assert accepted_encodings("gzip, deflate, br") == {"gzip", "deflate", "br"}
+    assert accepted_encodings("br;q=0, GZIP;q=0.5") == {"gzip"}
+    assert accepted_encodings("gzip;q=bogus") == {"gzip"}
+    assert accepted_encodings(None) == set()
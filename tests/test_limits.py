@@ -0,0 +1,79 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from .. import views_api
+from ..limits import CheckoutAdmission, CheckoutRejectedError
+from ..models import ClientDataPaymentRequest
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_is_per_client(make_shop):
+    admission = CheckoutAdmission()
+    shop = make_shop(checkout_rate_limit=2)
+    for _ in range(2):
+        async with admission.admit(shop, "1.2.3.4"):
+            pass
+
+    with pytest.raises(CheckoutRejectedError) as rejected:
+        async with admission.admit(shop, "1.2.3.4"):
+            pass
+    assert rejected.value.retry_after == 30
+    async with admission.admit(shop, "5.6.7.8"):
+        pass
+    assert admission.shop_counters("shop").rate_limited == 1
+
+
+@pytest.mark.asyncio
+async def test_checkouts_over_the_concurrency_are_rejected_not_queued(make_shop):
+    admission = CheckoutAdmission()
+    shop = make_shop(checkout_concurrency=1)
+    async with admission.admit(shop, None):
+        with pytest.raises(CheckoutRejectedError):
+            async with admission.admit(shop, None):
+                pass
+    async with admission.admit(shop, None):
+        pass
+    counters = admission.shop_counters("shop")
+    assert (counters.admitted, counters.overloaded, counters.in_flight) == (2, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_overloaded_checkouts_cost_no_rate_limit_token(make_shop):
+    admission = CheckoutAdmission()
+    shop = make_shop(checkout_rate_limit=1, checkout_concurrency=1)
+    async with admission.admit(shop, "5.6.7.8"):
+        with pytest.raises(CheckoutRejectedError, match="busy"):
+            async with admission.admit(shop, "1.2.3.4"):
+                pass
+    async with admission.admit(shop, "1.2.3.4"):
+        pass
+    assert admission.shop_counters("shop").rate_limited == 0
+
+
+@pytest.mark.asyncio
+async def test_buyers_behind_a_trusted_proxy_are_limited_by_their_own_address(monkeypatch):
+    clients: list[str | None] = []
+
+    async def payment_request_for_client_data(shop_id, data, client=None):
+        clients.append(client)
+        return ClientDataPaymentRequest(client_data_id="order", payment_request="lnbc1")
+
+    monkeypatch.setattr(views_api, "payment_request_for_client_data", payment_request_for_client_data)
+    app = FastAPI()
+    app.include_router(views_api.webshop_api_router)
+    body = {"product": "Mug", "quantity": 1}
+    url = "/api/v1/client_data/public/shop"
+
+    # how lnbits is served: uvicorn honours the forwarded headers of the proxies it trusts
+    proxied = ProxyHeadersMiddleware(app, trusted_hosts="127.0.0.1")
+    transport = httpx.ASGITransport(app=proxied, client=("127.0.0.1", 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://shop") as client:
+        for buyer in ("1.1.1.1", "2.2.2.2"):
+            assert (await client.put(url, json=body, headers={"X-Forwarded-For": buyer})).status_code == 200
+    # an untrusted proxy can not pick the address, its buyers share one bucket
+    transport = httpx.ASGITransport(app=proxied, client=("10.0.0.1", 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://shop") as client:
+        assert (await client.put(url, json=body, headers={"X-Forwarded-For": "3.3.3.3"})).status_code == 200
+    assert clients == ["1.1.1.1", "2.2.2.2", "10.0.0.1"]
@@ -0,0 +1,40 @@
+import pytest
+
+from ..metrics import Histogram, query_duration, query_errors, query_rows, timed_query
+
+
+def test_histogram_render():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a", count=2)
+    histogram.observe(5, "/a")
+
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a",le="1"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 6.05',
+        'latency_seconds_count{route="/a"} 4',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_timed_query():
+    @timed_query
+    async def get_things(fail: bool = False) -> list[int]:
+        if fail:
+            raise ValueError("no things")
+        return [1, 2, 3]
+
+    assert await get_things() == [1, 2, 3]
+    with pytest.raises(ValueError):
+        await get_things(fail=True)
+
+    counts, _ = query_duration.values[("get_things",)]
+    assert sum(counts) == 2
+    counts, total = query_rows.values[("get_things",)]
+    assert sum(counts) == 1
+    assert total[0] == 3
+    assert query_errors.values[("get_things",)] == 1
@@ -0,0 +1,160 @@
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from lnbits.db import Filters
+from lnbits.decorators import check_user_exists
+
+from .. import crud, views_api
+from ..models import ClientDataFilters, CreateClientData, CreateClientDataItem, CreateShop
+from .helpers import run_migrations
+
+LEGACY_ITEMS = {
+    "listed": json.dumps(
+        [
+            {"id": "mug", "name": "Mug", "quantity": 2, "price": 1500},
+            {"item_id": "cap", "name": "Cap", "price": 900},
+            {"quantity": 1},
+            "not an item",
+        ]
+    ),
+    # older clients sent a string that was encoded once more
+    "double_encoded": json.dumps(json.dumps([{"name": "Pin", "quantity": 3, "price": 100}])),
+    "empty_list": "[]",
+    "empty": "",
+    "malformed": '[{"name": "Mug"',
+    "not_a_list": '{"name": "Mug"}',
+}
+
+
+@pytest.mark.asyncio
+async def test_m008_backfills_order_items_from_the_legacy_json(empty_db):
+    await run_migrations(empty_db, until=7)
+    for client_data_id, items in {**LEGACY_ITEMS, "no_items": None}.items():
+        await empty_db.execute(
+            """
+            INSERT INTO webshop.client_data (id, shop_id, product, quantity, items, created_at)
+            VALUES (:id, 'shop', 'Mug', 1, :items, 1700000000)
+            """,
+            {"id": client_data_id, "items": items},
+        )
+    await run_migrations(empty_db, after=7)
+
+    rows = await empty_db.fetchall(
+        "SELECT client_data_id, item_id, name, quantity, price, created_at FROM webshop.order_items ORDER BY name"
+    )
+    assert [dict(row) for row in rows] == [
+        {
+            "client_data_id": "listed",
+            "item_id": "cap",
+            "name": "Cap",
+            "quantity": 1,
+            "price": 900,
+            "created_at": 1700000000,
+        },
+        {
+            "client_data_id": "listed",
+            "item_id": "mug",
+            "name": "Mug",
+            "quantity": 2,
+            "price": 1500,
+            "created_at": 1700000000,
+        },
+        {
+            "client_data_id": "double_encoded",
+            "item_id": None,
+            "name": "Pin",
+            "quantity": 3,
+            "price": 100,
+            "created_at": 1700000000,
+        },
+    ]
+    # the legacy column is left as it was
+    legacy = await empty_db.fetchone("SELECT items FROM webshop.client_data WHERE id = 'malformed'")
+    assert legacy["items"] == LEGACY_ITEMS["malformed"]
+
+
+@pytest.mark.asyncio
+async def test_m014_backfills_the_double_encoded_items_m008_skipped(empty_db):
+    await run_migrations(empty_db, until=13)
+    await empty_db.execute(
+        """
+        INSERT INTO webshop.client_data (id, shop_id, product, quantity, items, paid, created_at)
+        VALUES ('double_encoded', 'shop', 'Pin', 3, :items, true, 1700000000)
+        """,
+        {"items": LEGACY_ITEMS["double_encoded"]},
+    )
+    await run_migrations(empty_db, after=13)
+
+    assert [item.name for item in await crud.get_order_items("double_encoded")] == ["Pin"]
+    stats = await crud.get_shop_stats("shop")
+    assert [(product.name, product.quantity, product.revenue) for product in stats.top_products] == [("Pin", 3, 300)]
+
+
+@pytest.mark.asyncio
+async def test_orders_with_unreadable_legacy_items_are_still_listed(db):
+    shop = await crud.create_shop(
+        "user", CreateShop(name="Shop", description="", primary_color="#000", secondary_color="#fff", wallet="wallet")
+    )
+    for client_data_id, items in LEGACY_ITEMS.items():
+        await db.execute(
+            """
+            INSERT INTO webshop.client_data (id, shop_id, product, quantity, items, created_at, updated_at)
+            VALUES (:id, :shop_id, 'Mug', 1, :items, 1700000000, 1700000000)
+            """,
+            {"id": client_data_id, "shop_id": shop.id, "items": items},
+        )
+
+    # the legacy column is not read, whatever it holds
+    double_encoded = await crud.get_client_data_by_id("double_encoded")
+    assert double_encoded
+    assert double_encoded.items is None
+    assert await crud.get_client_data(shop.id, "listed")
+    page = await crud.get_client_data_paginated("user")
+    assert page.total == len(LEGACY_ITEMS)
+    filters = Filters(limit=10, sortby="created_at", direction="desc", model=ClientDataFilters)
+    cursor_page = await crud.get_client_data_cursor_page("user", filters)
+    assert len(cursor_page.data) == len(LEGACY_ITEMS)
+    assert len(await crud.get_client_data_rows(shop.id)) == len(LEGACY_ITEMS)
+
+
+def test_items_are_still_accepted_as_a_json_string():
+    data = CreateClientData(product="Mug", quantity=1, items='[{"item_id": "mug", "name": "Mug", "quantity": 2}]')
+    assert data.items == [CreateClientDataItem(item_id="mug", name="Mug", quantity=2)]
+    assert CreateClientData(product="Mug", quantity=1, items="").items is None
+    with pytest.raises(ValueError, match="JSON"):
+        CreateClientData(product="Mug", quantity=1, items="[{")
+
+
+@pytest.mark.asyncio
+async def test_order_items_are_written_read_and_deleted_with_their_order(db):
+    shop = await crud.create_shop(
+        "user", CreateShop(name="Shop", description="", primary_color="#000", secondary_color="#fff", wallet="wallet")
+    )
+    # more rows than one multi-row INSERT takes
+    items = [CreateClientDataItem(item_id=f"item_{i:03}", name=f"Item {i:03}", quantity=1, price=i) for i in range(250)]
+    order = await crud.create_client_data(shop.id, CreateClientData(product="Items", quantity=1, items=items))
+
+    app = FastAPI()
+    app.include_router(views_api.webshop_api_router)
+    user = SimpleNamespace(id="user")
+    app.dependency_overrides[check_user_exists] = lambda: user
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://shop") as client:
+        response = await client.get(f"/api/v1/client_data/{order.id}/items")
+        assert response.status_code == 200
+        assert [(item["item_id"], item["price"]) for item in response.json()] == [
+            (item.item_id, item.price) for item in items
+        ]
+
+        update = {"product": "Items", "quantity": 1, "shipped": True}
+        response = await client.put(f"/api/v1/client_data/{order.id}", json={**update, "items": []})
+        assert response.status_code == 400
+        assert (await client.put(f"/api/v1/client_data/{order.id}", json=update)).json()["shipped"]
+
+        user.id = "someone_else"
+        assert (await client.get(f"/api/v1/client_data/{order.id}/items")).status_code == 404
+
+    await crud.delete_client_data(shop.id, order.id)
+    assert await crud.get_order_items(order.id) == []
@@ -0,0 +1,52 @@
+import pytest
+
+from .. import pricing
+from ..models import CreateClientDataItem
+
+
+@pytest.fixture
+def inventory(monkeypatch):
+    items = [
+        {"id": "mug", "name": "Mug", "price": 1500, "tags": "kitchen", "updated_at": 1},
+        {"id": "cap", "name": "Cap", "price": 900, "tags": "clothes", "updated_at": 2},
+    ]
+    calls = []
+
+    async def fetch_items(inventory_id):
+        calls.append("full")
+        return items
+
+    async def fetch_changes(inventory_id, since):
+        calls.append(since)
+        return []
+
+    pricing.price_indexes.clear()
+    monkeypatch.setattr(pricing, "fetch_inventory_items", fetch_items)
+    monkeypatch.setattr(pricing, "fetch_inventory_changes", fetch_changes)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_prices_come_from_the_inventory(inventory, make_shop):
+    items = [
+        CreateClientDataItem(item_id="mug", name="Cheap mug", quantity=2),
+        CreateClientDataItem(item_id="cap", name="Cap", quantity=1, price=900),
+    ]
+    priced = await pricing.price_order_items(make_shop(), items)
+    assert [(item.name, item.price) for item in priced.items] == [("Mug", 1500), ("Cap", 900)]
+    await pricing.price_order_items(make_shop(), items)
+    assert inventory == ["full"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_changed_or_hidden_items_are_rejected(inventory, make_shop):
+    with pytest.raises(ValueError, match="not available"):
+        await pricing.price_order_items(make_shop(), [CreateClientDataItem(item_id="hat", name="Hat", quantity=1)])
+    with pytest.raises(ValueError, match="has changed"):
+        await pricing.price_order_items(
+            make_shop(), [CreateClientDataItem(item_id="mug", name="Mug", quantity=1, price=1)]
+        )
+    with pytest.raises(ValueError, match="not available"):
+        await pricing.price_order_items(
+            make_shop(allowed_tags="kitchen"), [CreateClientDataItem(item_id="cap", name="Cap", quantity=1)]
+        )
@@ -0,0 +1,22 @@
+import asyncio
+
+import pytest
+
+from .. import rates
+
+
+@pytest.mark.asyncio
+async def test_concurrent_quotes_share_one_rate_lookup(monkeypatch):
+    calls = []
+
+    async def btc_price(currency):
+        calls.append(currency)
+        await asyncio.sleep(0.01)
+        return 50_000.0
+
+    rates.rate_cache.clear()
+    monkeypatch.setattr(rates, "btc_price", btc_price)
+    quotes = await asyncio.gather(*(rates.fiat_amount_as_sats(5, "usd") for _ in range(20)))
+    assert quotes == [10_000] * 20
+    assert calls == ["USD"]
+    assert await rates.fiat_amount_as_sats(21, "sat") == 21
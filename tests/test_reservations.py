@@ -0,0 +1,108 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from .. import pricing, reservations, services
+from ..models import CreateClientData, CreateClientDataItem
+from ..reservations import StockReservations
+
+
+def _item(quantity: int = 1, item_id: str = "mug") -> CreateClientDataItem:
+    return CreateClientDataItem(item_id=item_id, name="Mug", quantity=quantity)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_checkouts_never_oversell(monkeypatch, make_shop):
+    shop = make_shop()
+    invoices: list[str] = []
+    deleted: list[str] = []
+
+    async def fetch_items(inventory_id):
+        return [{"id": "mug", "name": "Mug", "price": 1500, "quantity_in_stock": 10}]
+
+    async def create_client_data(shop_id, data, client_data_id, **kwargs):
+        await asyncio.sleep(random.random() / 100)
+        return SimpleNamespace(id=client_data_id)
+
+    async def create_invoice(**kwargs):
+        invoices.append(kwargs["extra"]["client_data_id"])
+        await asyncio.sleep(random.random() / 100)
+        if kwargs["extra"]["client_data_id"] == invoices[0]:
+            raise RuntimeError("funding source unavailable")
+        return SimpleNamespace(bolt11="lnbc1", checking_id="hash")
+
+    async def delete_client_data(shop_id, client_data_id):
+        deleted.append(client_data_id)
+
+    pricing.price_indexes.clear()
+    monkeypatch.setattr(services, "stock_reservations", StockReservations())
+    monkeypatch.setattr(pricing, "fetch_inventory_items", fetch_items)
+    monkeypatch.setattr(services, "create_client_data", create_client_data)
+    monkeypatch.setattr(services, "create_invoice", create_invoice)
+    monkeypatch.setattr(services, "delete_client_data", delete_client_data)
+
+    data = CreateClientData(product="Mug", quantity=1, items=[_item()])
+    results = await asyncio.gather(*(services._checkout(shop, data) for _ in range(500)), return_exceptions=True)
+    placed = [result for result in results if not isinstance(result, BaseException)]
+    errors = [str(result) for result in results if isinstance(result, BaseException)]
+
+    assert len(placed) == 9
+    assert errors.count("Mug is out of stock.") == 490
+    # the checkout whose invoice failed gave its unit back for the next one
+    assert len(deleted) == 1
+    placed.append(await services._checkout(shop, data))
+    assert services.stock_reservations.available("inventory", "mug", 10) == 0
+
+    # paid orders stay sold, unpaid ones are given back when they expire
+    services.stock_reservations.commit([placed[0].client_data_id])
+    monkeypatch.setattr(reservations, "monotonic", lambda: float("inf"))
+    services.stock_reservations.expire()
+    assert len(services.stock_reservations) == 0
+    assert services.stock_reservations.available("inventory", "mug", 10) == 9
+    # until the inventory reports a new stock figure
+    assert services.stock_reservations.available("inventory", "mug", 20) == 20
+
+
+def test_an_order_is_held_whole_or_not_at_all():
+    ledger = StockReservations()
+    ledger.reserve("order_1", "inventory", [_item(2)], {"mug": 3}, ttl=60)
+    with pytest.raises(ValueError, match="out of stock"):
+        ledger.reserve("order_2", "inventory", [_item(1, "cap"), _item(1), _item(1)], {"mug": 3, "cap": 5}, ttl=60)
+    assert ledger.available("inventory", "cap", 5) == 5
+    # untracked items are never held
+    ledger.reserve("order_3", "inventory", [_item(1, "pin"), _item(1)], {"mug": 3, "pin": None}, ttl=60)
+    assert ledger.available("inventory", "mug", 3) == 0
+    ledger.release("order_1")
+    assert ledger.available("inventory", "mug", 3) == 2
+
+
+@pytest.mark.asyncio
+async def test_stock_is_held_even_if_the_index_is_evicted_while_quoting(monkeypatch, make_shop):
+    async def fetch_items(inventory_id):
+        return [{"id": "mug", "name": "Mug", "price": 1500, "quantity_in_stock": 1}]
+
+    async def fiat_amount_as_sats(amount, currency):
+        # another inventory pushed this one out of the cache meanwhile
+        pricing.price_indexes.clear()
+        return int(amount)
+
+    async def create_client_data(shop_id, data, client_data_id, **kwargs):
+        return SimpleNamespace(id=client_data_id)
+
+    async def create_invoice(**kwargs):
+        return SimpleNamespace(bolt11="lnbc1", checking_id="hash")
+
+    pricing.price_indexes.clear()
+    monkeypatch.setattr(services, "stock_reservations", StockReservations())
+    monkeypatch.setattr(pricing, "fetch_inventory_items", fetch_items)
+    monkeypatch.setattr(services, "fiat_amount_as_sats", fiat_amount_as_sats)
+    monkeypatch.setattr(services, "create_client_data", create_client_data)
+    monkeypatch.setattr(services, "create_invoice", create_invoice)
+
+    data = CreateClientData(product="Mug", quantity=1, items=[_item()])
+    await services._checkout(make_shop(), data)
+    assert services.stock_reservations.available("inventory", "mug", 1) == 0
+    with pytest.raises(ValueError, match="out of stock"):
+        await services._checkout(make_shop(), data)
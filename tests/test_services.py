@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+from .. import services
+from ..models import ClientDataPaymentRequest, CreateClientData
+
+
+@pytest.mark.asyncio
+async def test_parallel_duplicate_checkouts_create_one_order(monkeypatch):
+    calls = []
+
+    async def payment_request_for_client_data(shop_id, data, client=None):
+        calls.append(shop_id)
+        await asyncio.sleep(0.01)
+        return ClientDataPaymentRequest(client_data_id=f"order_{len(calls)}", payment_request="lnbc1")
+
+    services.checkout_cache.clear()
+    monkeypatch.setattr(services, "payment_request_for_client_data", payment_request_for_client_data)
+    data = CreateClientData(product="Mug", quantity=1)
+    results = await asyncio.gather(
+        *(services.idempotent_payment_request_for_client_data("shop_0", data, "key_0") for _ in range(20))
+    )
+    assert calls == ["shop_0"]
+    assert {result.client_data_id for result in results} == {"order_1"}
+
+    # a retry later on is answered from the store as well
+    await services.idempotent_payment_request_for_client_data("shop_0", data, "key_0")
+    assert calls == ["shop_0"]
+
+    with pytest.raises(ValueError):
+        await services.idempotent_payment_request_for_client_data(
+            "shop_0", CreateClientData(product="Mug", quantity=2), "key_0"
+        )
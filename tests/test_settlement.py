@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+from .. import crud, services, tasks
+from ..events import order_events
+from ..models import CreateClientData, CreateClientDataItem, CreateShop
+
+
+async def _order(shop_id: str) -> str:
+    data = CreateClientData(product="Mug", quantity=1, items=[CreateClientDataItem(name="Mug", quantity=1, price=2)])
+    return (await crud.create_client_data(shop_id, data, amount=2, amount_sat=2)).id
+
+
+def _payment(client_data_id: str):
+    return SimpleNamespace(payment_hash=client_data_id, extra={"tag": "webshop", "client_data_id": client_data_id})
+
+
+@pytest.mark.asyncio
+async def test_duplicate_invoice_events_are_no_ops(db):
+    shop = await crud.create_shop(
+        "user", CreateShop(name="Shop", description="", primary_color="#000", secondary_color="#fff", wallet="wallet")
+    )
+    single, batched = await _order(shop.id), await _order(shop.id)
+    events = order_events.subscribe("user")
+    try:
+        assert await services.payment_received_for_client_data(_payment(single))
+        assert not await services.payment_received_for_client_data(_payment(single))
+        assert await services.payments_received_for_client_data([_payment(batched), _payment(batched)]) == [batched]
+        assert await services.payments_received_for_client_data([_payment(batched), _payment(single)]) == []
+        assert not await crud.update_client_data_paid(batched)
+
+        published = [events.get_nowait() for _ in range(events.qsize())]
+        assert [message.split("\n")[1] for message in published] == ["event: paid", "event: paid"]
+    finally:
+        order_events.unsubscribe("user", events)
+
+    stats = await crud.get_shop_stats(shop.id)
+    assert (stats.orders, stats.paid_orders, stats.revenue_sat) == (2, 2, 4)
+    assert stats.top_products[0].quantity == 2
+
+
+@pytest.mark.asyncio
+async def test_failing_follow_ups_of_one_order_spare_the_rest_of_its_batch(db, monkeypatch):
+    shop = await crud.create_shop(
+        "user", CreateShop(name="Shop", description="", primary_color="#000", secondary_color="#fff", wallet="wallet")
+    )
+    orders = [await _order(shop.id) for _ in range(3)]
+    resolved: list[str] = []
+    published: list[str] = []
+
+    async def update_stats(*args, **kwargs):
+        raise RuntimeError("database is locked")
+
+    def commit(client_data_ids):
+        if client_data_ids == [orders[0]]:
+            raise KeyError(orders[0])
+
+    async def publish_order_event(event_type, client_data):
+        if client_data.id == orders[1]:
+            raise RuntimeError("subscriber gone")
+        published.append(client_data.id)
+
+    monkeypatch.setattr(crud, "_update_stats", update_stats)
+    monkeypatch.setattr(services.stock_reservations, "commit", commit)
+    monkeypatch.setattr(services, "order_waiters", SimpleNamespace(resolve=resolved.extend))
+    monkeypatch.setattr(services, "publish_order_event", publish_order_event)
+    monkeypatch.setattr(tasks, "settlement_metrics", tasks.SettlementMetrics())
+
+    await tasks.on_invoices_paid([_payment(client_data_id) for client_data_id in orders])
+    # settled in one go, without falling back to settling the orders one by one
+    assert tasks.settlement_metrics.errors == 0
+    assert [order.paid for order in await crud.get_client_data_by_ids(orders)] == [True] * 3
+    assert resolved == orders
+    assert sorted(published) == sorted([orders[0], orders[2]])
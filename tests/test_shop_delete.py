@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from lnbits.decorators import check_admin, check_user_exists
+
+from .. import crud, views_api
+from ..models import CreateClientData, CreateClientDataItem, CreateShop
+
+TABLES = ("client_data", "order_items", *crud.STATS_TABLES)
+
+
+async def _shop_with_orders(orders: int) -> str:
+    shop = await crud.create_shop(
+        "user", CreateShop(name="Shop", description="", primary_color="#000", secondary_color="#fff", wallet="wallet")
+    )
+    data = CreateClientData(product="Mug", quantity=1, items=[CreateClientDataItem(name="Mug", quantity=1, price=5)])
+    for _ in range(orders):
+        client_data = await crud.create_client_data(shop.id, data, amount=5, amount_sat=5)
+        assert await crud.update_client_data_paid(client_data.id)
+    return shop.id
+
+
+async def _rows(db, shop_id: str) -> dict[str, int]:
+    counts = {}
+    for table in TABLES:
+        row = await db.fetchone(
+            f"SELECT COUNT(*) AS count FROM webshop.{table} WHERE shop_id = :shop_id", {"shop_id": shop_id}
+        )
+        counts[table] = row["count"]
+    return counts
+
+
+@pytest.mark.asyncio
+async def test_deleting_a_shop_clears_its_orders_and_the_purge_the_orphans(db, monkeypatch):
+    cleared, orphaned, kept = await _shop_with_orders(5), await _shop_with_orders(3), await _shop_with_orders(2)
+    kept_rows = await _rows(db, kept)
+    # an item whose order is gone, but whose shop is not
+    await db.execute(
+        """
+        INSERT INTO webshop.order_items (id, client_data_id, shop_id, name, quantity)
+        VALUES ('stray', 'gone', :shop_id, 'Mug', 1)
+        """,
+        {"shop_id": kept},
+    )
+    # several chunks per table
+    monkeypatch.setattr(crud, "DELETE_CHUNK_SIZE", 2)
+
+    app = FastAPI()
+    app.include_router(views_api.webshop_api_router)
+    app.dependency_overrides[check_user_exists] = lambda: SimpleNamespace(id="user")
+    app.dependency_overrides[check_admin] = lambda: SimpleNamespace(id="admin")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://shop") as client:
+        response = await client.delete(f"/api/v1/shop/{cleared}", params={"clear_client_data": True})
+        assert response.json()["message"] == "Shop Deleted with 5 client data"
+        assert await _rows(db, cleared) == dict.fromkeys(TABLES, 0)
+
+        # without clearing, the orders stay behind until the purge
+        await client.delete(f"/api/v1/shop/{orphaned}")
+        assert (await _rows(db, orphaned))["client_data"] == 3
+        response = await client.post("/api/v1/maintenance/purge")
+        assert response.json() == {"client_data": 3, "order_items": 4}
+        assert await _rows(db, orphaned) == dict.fromkeys(TABLES, 0)
+
+    assert await _rows(db, kept) == kept_rows
+    assert await crud.purge_orphaned_client_data() == (0, 0)
@@ -0,0 +1,58 @@
+import pytest
+
+from .. import crud, pricing, services
+from ..models import CreateClientData, CreateClientDataItem, CreateShop
+
+
+async def _order(shop_id: str, name: str, paid: bool) -> str:
+    data = CreateClientData(product=name, quantity=2, items=[CreateClientDataItem(name=name, quantity=2, price=5)])
+    client_data = await crud.create_client_data(shop_id, data, amount=10, amount_sat=20)
+    if paid:
+        assert await crud.update_client_data_paid(client_data.id)
+    return client_data.id
+
+
+@pytest.mark.asyncio
+async def test_deleted_orders_leave_the_stats_as_a_rebuild_would(db, monkeypatch):
+    shop = await crud.create_shop(
+        "user",
+        CreateShop(
+            name="Shop",
+            description="",
+            primary_color="#000",
+            secondary_color="#fff",
+            wallet="wallet",
+            inventory_id="inventory",
+        ),
+    )
+    kept = [await _order(shop.id, "Mug", paid=True), await _order(shop.id, "Cap", paid=False)]
+    single = [await _order(shop.id, "Mug", paid=True), await _order(shop.id, "Cap", paid=False)]
+    bulk = [await _order(shop.id, "Hat", paid=True), await _order(shop.id, "Mug", paid=False)]
+
+    for client_data_id in single:
+        await crud.delete_client_data(shop.id, client_data_id)
+    # orders of other users' shops are neither deleted nor uncounted
+    assert await crud.delete_client_data_bulk("someone_else", bulk) == 0
+    assert await crud.delete_client_data_bulk("user", bulk) == 2
+
+    # a checkout whose invoice fails removes its order again
+    async def fetch_items(inventory_id):
+        return [{"id": "mug", "name": "Mug", "price": 5}]
+
+    async def create_invoice(**kwargs):
+        raise RuntimeError("funding source unavailable")
+
+    pricing.price_indexes.clear()
+    monkeypatch.setattr(pricing, "fetch_inventory_items", fetch_items)
+    monkeypatch.setattr(services, "create_invoice", create_invoice)
+    data = CreateClientData(
+        product="Mug", quantity=1, items=[CreateClientDataItem(item_id="mug", name="Mug", quantity=1)]
+    )
+    with pytest.raises(RuntimeError):
+        await services._checkout(shop, data)
+
+    incremental = await crud.get_shop_stats(shop.id)
+    await crud.rebuild_shop_stats(shop.id)
+    assert await crud.get_shop_stats(shop.id) == incremental
+    assert (incremental.orders, incremental.paid_orders, incremental.revenue_sat) == (len(kept), 1, 20)
+    assert [(product.name, product.quantity) for product in incremental.top_products] == [("Mug", 2)]
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from .. import tasks
+
+
+@pytest.mark.asyncio
+async def test_fill_payment_batch_drains_queue_up_to_batch_size(monkeypatch):
+    monkeypatch.setattr(tasks, "SETTLEMENT_BATCH_SIZE", 3)
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(5):
+        queue.put_nowait(i)
+
+    batch = await tasks.fill_payment_batch(queue, [await queue.get()])
+    assert batch == [0, 1, 2]
+    assert queue.qsize() == 2
+
+
+@pytest.mark.asyncio
+async def test_fill_payment_batch_waits_for_the_window(monkeypatch):
+    monkeypatch.setattr(tasks, "SETTLEMENT_BATCH_WINDOW", 0.05)
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def late_payment():
+        await asyncio.sleep(0.01)
+        queue.put_nowait("late")
+
+    producer = asyncio.create_task(late_payment())
+    batch = await tasks.fill_payment_batch(queue, ["first"])
+    await producer
+    assert batch == ["first", "late"]
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_settled_one_by_one(monkeypatch):
+    settled = []
+
+    async def failing_batch(payments):
+        raise RuntimeError("database is locked")
+
+    async def settle(payment):
+        if payment.payment_hash == "bad":
+            raise ValueError("bad row")
+        settled.append(payment.payment_hash)
+        return True
+
+    monkeypatch.setattr(tasks, "settlement_metrics", tasks.SettlementMetrics())
+    monkeypatch.setattr(tasks, "payments_received_for_client_data", failing_batch)
+    monkeypatch.setattr(tasks, "payment_received_for_client_data", settle)
+    payments = [
+        SimpleNamespace(payment_hash=payment_hash, extra={"tag": "webshop", "client_data_id": payment_hash})
+        for payment_hash in ("a", "bad", "b")
+    ]
+
+    await tasks.on_invoices_paid(payments)
+    assert settled == ["a", "b"]
+    assert tasks.settlement_metrics.errors == 1
@@ -0,0 +1,89 @@
+import gzip
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from starlette.templating import Jinja2Templates
+
+from .. import views
+
+
+@pytest.fixture
+def public_page(monkeypatch, make_shop):
+    """A client of the public page of one shop, and the count of renders."""
+    shop = make_shop(updated_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    renders = []
+    render_public_page = views.render_public_page
+
+    async def get_shop_by_id(shop_id):
+        return shop if shop_id == shop.id else None
+
+    def counted_render(rendered_shop):
+        renders.append(rendered_shop.name)
+        return render_public_page(rendered_shop)
+
+    views.page_cache.clear()
+    templates = Jinja2Templates(directory=Path(views.__file__).parent / "templates")
+    monkeypatch.setattr(views, "webshop_renderer", lambda: templates)
+    monkeypatch.setattr(views, "get_shop_by_id", get_shop_by_id)
+    monkeypatch.setattr(views, "render_public_page", counted_render)
+    app = FastAPI()
+    app.include_router(views.webshop_generic_router)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://shop")
+    return SimpleNamespace(client=client, shop=shop, renders=renders)
+
+
+@pytest.mark.asyncio
+async def test_public_page_is_rendered_once_and_revalidated(public_page):
+    client = public_page.client
+    response = await client.get("/shop", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+    etag = response.headers["ETag"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"stale", {etag}'):
+        revalidated = await client.get("/shop", headers={"Accept-Encoding": "identity", "If-None-Match": if_none_match})
+        assert revalidated.status_code == 304
+        assert revalidated.headers["ETag"] == etag
+        assert not revalidated.content
+    stale = await client.get("/shop", headers={"Accept-Encoding": "identity", "If-None-Match": '"stale"'})
+    assert stale.status_code == 200
+    assert public_page.renders == ["Shop"]
+
+    assert (await client.get("/missing")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_public_page_is_served_precompressed(public_page):
+    client = public_page.client
+    identity = await client.get("/shop", headers={"Accept-Encoding": "identity"})
+    compressed = await client.get("/shop", headers={"Accept-Encoding": "gzip, br"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["ETag"] == identity.headers["ETag"][:-1] + '-gzip"'
+    # httpx decodes the body again
+    assert compressed.content == identity.content
+    assert len(public_page.renders) == 1
+
+    # brotli is preferred when installed
+    page = views.RenderedPage(etag='"e"', bodies={"identity": b"", "gzip": b"", "br": b""})
+    assert views._pick_coding(page, "gzip, br") == "br"
+    assert views._pick_coding(page, "gzip, br;q=0") == "gzip"
+    assert views._pick_coding(page, None) == "identity"
+    assert gzip.decompress(views.render_public_page(public_page.shop).bodies["gzip"]) == identity.content
+
+
+@pytest.mark.asyncio
+async def test_public_page_is_rendered_again_after_a_shop_update(public_page):
+    client = public_page.client
+    before = await client.get("/shop", headers={"Accept-Encoding": "identity"})
+    public_page.shop.name = "Renamed"
+    public_page.shop.updated_at += timedelta(seconds=1)
+    after = await client.get("/shop", headers={"Accept-Encoding": "identity", "If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200
+    assert after.headers["ETag"] != before.headers["ETag"]
+    assert b"Renamed" in after.content
+    assert public_page.renders == ["Shop", "Renamed"]
@@ -1,22 +1,61 @@
 # Description: Add your page endpoints here.
 
+import gzip
+from functools import lru_cache
+from hashlib import sha256
 from http import HTTPStatus
+from pathlib import Path
+from typing import NamedTuple
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import HTMLResponse
 from lnbits.core.models import User
 from lnbits.decorators import check_user_exists
 from lnbits.helpers import template_renderer
 
+from .cache import LRUCache
 from .crud import get_shop_by_id
+from .helpers import accepted_encodings, is_not_modified
+from .metrics import TimedRoute, operation_duration
+from .models import Shop
 
-webshop_generic_router = APIRouter()
+try:
+    import brotli  # type: ignore
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+webshop_generic_router = APIRouter(route_class=TimedRoute)
+
+PAGE_CACHE_TTL = 3600
+PAGE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+PAGE_PRECOMPRESS = True
+PAGE_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=300"
+
+STATIC_DIR = Path(__file__).parent / "static"
+PUBLIC_PAGE_ASSETS = ["css/public_page.css", "js/public_page.js"]
+
+
+class RenderedPage(NamedTuple):
+    etag: str
+    # body per content coding, "identity" is always present
+    bodies: dict[str, bytes]
+
+
+# rendered public pages keyed on (shop id, shop updated_at)
+page_cache = LRUCache(max_size=PAGE_CACHE_MAX_BYTES, ttl=PAGE_CACHE_TTL)
 
 
 def webshop_renderer():
     return template_renderer(["webshop/templates"])
 
 
+@lru_cache
+def static_asset_url(path: str) -> str:
+    """URL of a file served by `webshop_static_files`, versioned by its content hash."""
+    digest = sha256((STATIC_DIR / path).read_bytes()).hexdigest()[:12]
+    return f"/webshop/static/{path}?v={digest}"
+
+
 #######################################
 ##### ADD YOUR PAGE ENDPOINTS HERE ####
 #######################################
@@ -39,21 +78,55 @@ async def shop_public_page(req: Request, shop_id: str):
     if not shop:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Shop does not exist.")
 
-    public_page_name = getattr(shop, "name", "")
-    public_page_description = getattr(shop, "description", "")
+    key = (shop.id, shop.updated_at)
+    page = page_cache.get(key)
+    if page is None:
+        with operation_duration.time("render_public_page"):
+            page = render_public_page(shop)
+        page_cache.set(key, page, size=sum(len(body) for body in page.bodies.values()))
+
+    coding = _pick_coding(page, req.headers.get("accept-encoding"))
+    etag = page.etag if coding == "identity" else f'{page.etag[:-1]}-{coding}"'
+    headers = {"ETag": etag, "Cache-Control": PAGE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if is_not_modified(req.headers.get("if-none-match"), etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    if coding != "identity":
+        headers["Content-Encoding"] = coding
+    return HTMLResponse(content=page.bodies[coding], headers=headers)
+
+
+def render_public_page(shop: Shop) -> RenderedPage:
     shop_data = shop.dict()
     if shop_data.get("created_at"):
         shop_data["created_at"] = shop_data["created_at"].isoformat()
     if shop_data.get("updated_at"):
         shop_data["updated_at"] = shop_data["updated_at"].isoformat()
 
-    return webshop_renderer().TemplateResponse(
-        "webshop/public_page.html",
-        {
-            "request": req,
-            "shop_id": shop_id,
-            "shop": shop_data,
-            "public_page_name": public_page_name,
-            "public_page_description": public_page_description,
-        },
+    html = (
+        webshop_renderer()
+        .get_template("webshop/public_page.html")
+        .render(
+            {
+                "shop_id": shop.id,
+                "shop": shop_data,
+                "public_page_name": shop.name,
+                "public_page_description": shop.description,
+                "asset_urls": {path: static_asset_url(path) for path in PUBLIC_PAGE_ASSETS},
+            }
+        )
+        .encode()
     )
+    bodies = {"identity": html}
+    if PAGE_PRECOMPRESS:
+        bodies["gzip"] = gzip.compress(html, compresslevel=9)
+        if brotli:
+            bodies["br"] = brotli.compress(html)
+    return RenderedPage(etag=f'"{sha256(html).hexdigest()[:32]}"', bodies=bodies)
+
+
+def _pick_coding(page: RenderedPage, accept_encoding: str | None) -> str:
+    accepted = accepted_encodings(accept_encoding)
+    for coding in ("br", "gzip"):
+        if coding in accepted and coding in page.bodies:
+            return coding
+    return "identity"
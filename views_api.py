@@ -1,11 +1,15 @@
 # Description: This file contains the extensions API endpoints.
+from datetime import datetime, timezone
+from email.utils import format_datetime
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Query, Request, Response
 from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
 from lnbits.core.models import SimpleStatus, User
 from lnbits.db import Filters, Page
 from lnbits.decorators import (
+    check_admin,
     check_user_exists,
     parse_filters,
 )
@@ -15,32 +19,82 @@ from .crud import (
     create_client_data,
     create_shop,
     delete_client_data,
+    delete_client_data_bulk,
     delete_shop,
+    delete_shop_client_data,
     get_client_data_by_id,
+    get_client_data_cursor_page,
     get_client_data_paginated,
+    get_order_items,
     get_shop,
-    get_shop_ids_by_user,
+    get_shop_by_id,
+    get_shop_cursor_page,
     get_shop_paginated,
+    get_shop_stats,
+    purge_orphaned_client_data,
+    rebuild_shop_stats,
+    shop_cache,
     update_client_data,
+    update_client_data_shipped,
     update_shop,
 )
+from .events import ORDER_STATUS_MAX_WAIT, order_events, order_waiters
+from .export import ExportFormat, export_client_data
+from .helpers import is_not_modified
+from .limits import CheckoutRejectedError, checkout_admission
+from .metrics import (
+    TimedRoute,
+    cache_entries,
+    cache_requests,
+    checkouts,
+    checkouts_in_flight,
+    render_metrics,
+    settlement_errors,
+    settlement_payments,
+    settlement_queue_depth,
+    stock_reservations_held,
+)
 from .models import (
+    BulkClientDataResult,
+    BulkDeleteClientData,
+    BulkUpdateClientData,
     ClientData,
     ClientDataFilters,
     ClientDataPaymentRequest,  #
+    ClientDataStatus,
     CreateClientData,
     CreateShop,
+    CursorPage,
+    ExpiredOrdersResult,
+    OrderItem,
+    PurgeResult,
+    RebuildStatsResult,
     Shop,
     ShopFilters,
+    ShopStats,
 )
+from .pricing import price_indexes
+from .rates import rate_cache
+from .reservations import stock_reservations
 from .services import (
+    UNPAID_ORDER_MAX_AGE,
+    catalog_cache,
+    checkout_cache,
+    delete_expired_orders,
+    get_shop_catalog,
+    idempotent_payment_request_for_client_data,
+    invalidate_shop_catalog,
     payment_request_for_client_data,  #
+    publish_order_event,
+    wait_for_client_data_paid,
 )
+from .tasks import settlement_metrics
+from .views import page_cache
 
 shop_filters = parse_filters(ShopFilters)
 client_data_filters = parse_filters(ClientDataFilters)
 
-webshop_api_router = APIRouter()
+webshop_api_router = APIRouter(route_class=TimedRoute)
 
 
 ############################# Shop #############################
@@ -65,6 +119,7 @@ async def api_update_shop(
     if shop.user_id != user.id:
         raise HTTPException(HTTPStatus.FORBIDDEN, "You do not own this shop.")
     shop = await update_shop(Shop(**{**shop.dict(), **data.dict()}))
+    invalidate_shop_catalog(shop.id)
     return shop
 
 
@@ -74,13 +129,17 @@ async def api_update_shop(
     summary="get paginated list of shop",
     response_description="list of shop",
     openapi_extra=generate_filter_params_openapi(ShopFilters),
-    response_model=Page[Shop],
+    response_model=CursorPage[Shop] | Page[Shop],
 )
 async def api_get_shop_paginated(
     user: User = Depends(check_user_exists),
     filters: Filters = Depends(shop_filters),
-) -> Page[Shop]:
+    cursor: str | None = Query(None, description="Keyset pagination, empty for the first page"),
+    include_total: bool = Query(False, description="Count all rows, cursor pagination only"),
+) -> CursorPage[Shop] | Page[Shop]:
 
+    if cursor is not None:
+        return await get_shop_cursor_page(user.id, filters, cursor=cursor, include_total=include_total)
     return await get_shop_paginated(
         user_id=user.id,
         filters=filters,
@@ -119,13 +178,87 @@ async def api_delete_shop(
     user: User = Depends(check_user_exists),
 ) -> SimpleStatus:
 
+    shop = await get_shop(user.id, shop_id)
+    if not shop:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "Shop not found.")
+
     await delete_shop(user.id, shop_id)
+    invalidate_shop_catalog(shop_id)
     if clear_client_data is True:
-        # await delete all client data associated with this shop
-        pass
+        count = await delete_shop_client_data(shop_id)
+        return SimpleStatus(success=True, message=f"Shop Deleted with {count} client data")
     return SimpleStatus(success=True, message="Shop Deleted")
 
 
+@webshop_api_router.get(
+    "/api/v1/shop/{shop_id}/stats",
+    name="Shop Stats",
+    summary="Revenue, order count, paid ratio, daily rollups and top products of the shop.",
+    response_description="The stats of the shop or 404 if not found",
+    response_model=ShopStats,
+)
+async def api_get_shop_stats(
+    shop_id: str,
+    days: int = Query(30, ge=1, le=366),
+    user: User = Depends(check_user_exists),
+) -> ShopStats:
+
+    shop = await get_shop(user.id, shop_id)
+    if not shop:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "Shop not found.")
+
+    stats = await get_shop_stats(shop_id, days)
+    stats.checkouts = checkout_admission.shop_counters(shop_id)
+    return stats
+
+
+@webshop_api_router.post(
+    "/api/v1/shop/{shop_id}/stats/rebuild",
+    name="Rebuild Shop Stats",
+    summary="Recompute the stats of the shop from its orders.",
+    response_description="The recomputed stats of the shop.",
+    response_model=ShopStats,
+)
+async def api_rebuild_shop_stats(
+    shop_id: str,
+    user: User = Depends(check_user_exists),
+) -> ShopStats:
+
+    shop = await get_shop(user.id, shop_id)
+    if not shop:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "Shop not found.")
+
+    await rebuild_shop_stats(shop_id)
+    return await get_shop_stats(shop_id)
+
+
+@webshop_api_router.get(
+    "/api/v1/catalog/{shop_id}",
+    name="Shop Catalog",
+    summary="The inventory items visible in this shop. This is a public endpoint.",
+    response_description="list of inventory items, 304 if unchanged",
+)
+async def api_get_shop_catalog(req: Request, shop_id: str) -> Response:
+    shop = await get_shop_by_id(shop_id)
+    if not shop:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "Shop not found.")
+
+    catalog = await get_shop_catalog(shop)
+    headers = {
+        "ETag": catalog.etag,
+        "Last-Modified": format_datetime(catalog.last_modified, usegmt=True),
+        "Cache-Control": "public, no-cache",
+    }
+    if is_not_modified(
+        req.headers.get("if-none-match"),
+        catalog.etag,
+        req.headers.get("if-modified-since"),
+        catalog.last_modified.timestamp(),
+    ):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
+
+
 ############################# Client Data #############################
 @webshop_api_router.post(
     "/api/v1/client_data/{shop_id}",
@@ -145,6 +278,7 @@ async def api_create_client_data(
         raise HTTPException(HTTPStatus.NOT_FOUND, "Shop not found.")
 
     client_data = await create_client_data(shop_id, data)
+    await publish_order_event("created", client_data)
     return client_data
 
 
@@ -158,9 +292,22 @@ async def api_create_client_data(
 async def api_submit_public_client_data(
     shop_id: str,
     data: CreateClientData,
+    req: Request,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=255),
 ) -> ClientDataPaymentRequest | None:
 
-    return await payment_request_for_client_data(shop_id, data)
+    # the buyer's address as the rest of lnbits sees it: uvicorn takes it from
+    # X-Forwarded-For for the proxies in lnbits' forwarded_allow_ips. Behind a
+    # proxy missing from that list, all buyers share the proxy's rate limit.
+    client = req.client.host if req.client else ""
+    try:
+        if idempotency_key:
+            return await idempotent_payment_request_for_client_data(shop_id, data, idempotency_key, client)
+        return await payment_request_for_client_data(shop_id, data, client)
+    except CheckoutRejectedError as exc:
+        raise HTTPException(
+            HTTPStatus.TOO_MANY_REQUESTS, str(exc), headers={"Retry-After": str(exc.retry_after)}
+        ) from exc
 
 
 @webshop_api_router.put(
@@ -182,8 +329,11 @@ async def api_update_client_data(
     shop = await get_shop(user.id, client_data.shop_id)
     if not shop:
         raise HTTPException(HTTPStatus.NOT_FOUND, "Shop not found.")
+    # the items were priced and invoiced at checkout
+    if data.items is not None:
+        raise HTTPException(HTTPStatus.BAD_REQUEST, "The line items of an order can not be changed.")
 
-    client_data = await update_client_data(ClientData(**{**client_data.dict(), **data.dict()}))
+    client_data = await update_client_data(ClientData(**{**client_data.dict(), **data.dict(exclude={"items"})}))
     return client_data
 
 
@@ -193,27 +343,113 @@ async def api_update_client_data(
     summary="get paginated list of client_data",
     response_description="list of client_data",
     openapi_extra=generate_filter_params_openapi(ClientDataFilters),
-    response_model=Page[ClientData],
+    response_model=CursorPage[ClientData] | Page[ClientData],
 )
 async def api_get_client_data_paginated(
     user: User = Depends(check_user_exists),
     shop_id: str | None = None,
     filters: Filters = Depends(client_data_filters),
-) -> Page[ClientData]:
-
-    shop_ids = await get_shop_ids_by_user(user.id)
+    cursor: str | None = Query(None, description="Keyset pagination, empty for the first page"),
+    include_total: bool = Query(False, description="Count all rows, cursor pagination only"),
+) -> CursorPage[ClientData] | Page[ClientData]:
 
     if shop_id:
-        if shop_id not in shop_ids:
+        shop = await get_shop(user.id, shop_id)
+        if not shop:
             raise HTTPException(HTTPStatus.FORBIDDEN, "Not your shop.")
-        shop_ids = [shop_id]
 
+    if cursor is not None:
+        return await get_client_data_cursor_page(
+            user.id,
+            filters,
+            shop_id=shop_id,
+            cursor=cursor,
+            include_total=include_total,
+        )
     return await get_client_data_paginated(
-        shop_ids=shop_ids,
+        user_id=user.id,
+        shop_id=shop_id,
         filters=filters,
     )
 
 
+@webshop_api_router.get(
+    "/api/v1/client_data/export",
+    name="Export Client Data",
+    summary="Stream all client_data of the user as CSV or NDJSON",
+    response_description="CSV or newline delimited JSON, one order per line",
+    response_class=StreamingResponse,
+)
+async def api_export_client_data(
+    user: User = Depends(check_user_exists),
+    shop_id: str | None = None,
+    fmt: ExportFormat = Query("csv", alias="format"),
+) -> StreamingResponse:
+
+    if shop_id:
+        shop = await get_shop(user.id, shop_id)
+        if not shop:
+            raise HTTPException(HTTPStatus.FORBIDDEN, "Not your shop.")
+
+    filename = f"orders_{datetime.now(timezone.utc):%Y-%m-%d}.{fmt}"
+    return StreamingResponse(
+        export_client_data(user.id, shop_id=shop_id, fmt=fmt),
+        media_type="text/csv" if fmt == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@webshop_api_router.get(
+    "/api/v1/client_data/events",
+    name="Client Data Events",
+    summary="Server-sent events for orders of the user's shops being created or paid.",
+    response_description="An event stream, resumable with the Last-Event-ID header",
+    response_class=StreamingResponse,
+)
+async def api_client_data_events(
+    user: User = Depends(check_user_exists),
+    last_event_id: str | None = Header(None, alias="Last-Event-ID"),
+) -> StreamingResponse:
+
+    return StreamingResponse(
+        order_events.stream(user.id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@webshop_api_router.patch(
+    "/api/v1/client_data/bulk",
+    name="Bulk Update Client Data",
+    summary="Mark many client_data shipped or not shipped at once.",
+    response_description="The number of updated client data.",
+    response_model=BulkClientDataResult,
+)
+async def api_bulk_update_client_data(
+    data: BulkUpdateClientData,
+    user: User = Depends(check_user_exists),
+) -> BulkClientDataResult:
+
+    count = await update_client_data_shipped(user.id, data.ids, data.shipped)
+    return BulkClientDataResult(count=count)
+
+
+@webshop_api_router.delete(
+    "/api/v1/client_data/bulk",
+    name="Bulk Delete Client Data",
+    summary="Delete many client_data at once.",
+    response_description="The number of deleted client data.",
+    response_model=BulkClientDataResult,
+)
+async def api_bulk_delete_client_data(
+    data: BulkDeleteClientData,
+    user: User = Depends(check_user_exists),
+) -> BulkClientDataResult:
+
+    count = await delete_client_data_bulk(user.id, data.ids)
+    return BulkClientDataResult(count=count)
+
+
 @webshop_api_router.get(
     "/api/v1/client_data/{client_data_id}",
     name="Get Client Data",
@@ -236,6 +472,53 @@ async def api_get_client_data(
     return client_data
 
 
+@webshop_api_router.get(
+    "/api/v1/client_data/{client_data_id}/items",
+    name="Get Client Data Items",
+    summary="Get the line items of the client data with this id.",
+    response_description="The line items of the order.",
+    response_model=list[OrderItem],
+)
+async def api_get_client_data_items(
+    client_data_id: str,
+    user: User = Depends(check_user_exists),
+) -> list[OrderItem]:
+
+    client_data = await get_client_data_by_id(client_data_id)
+    if not client_data:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "ClientData not found.")
+    shop = await get_shop(user.id, client_data.shop_id)
+    if not shop:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "Shop deleted for this Client Data.")
+
+    return await get_order_items(client_data_id)
+
+
+@webshop_api_router.get(
+    "/api/v1/client_data/{client_data_id}/status",
+    name="Client Data Status",
+    summary="Whether the order is paid, waiting up to `wait` seconds for it to be. This is a public endpoint.",
+    response_description="The paid state of the order.",
+    response_model=ClientDataStatus,
+)
+async def api_get_client_data_status(
+    client_data_id: str,
+    wait: int = Query(0, ge=0, le=ORDER_STATUS_MAX_WAIT),
+) -> ClientDataStatus:
+
+    if wait and order_waiters.is_full(client_data_id):
+        raise HTTPException(
+            HTTPStatus.SERVICE_UNAVAILABLE,
+            "Too many orders being watched, try again later.",
+            headers={"Retry-After": "5"},
+        )
+    paid = await wait_for_client_data_paid(client_data_id, wait)
+    if paid is None:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "ClientData not found.")
+
+    return ClientDataStatus(id=client_data_id, paid=paid)
+
+
 @webshop_api_router.delete(
     "/api/v1/client_data/{client_data_id}",
     name="Delete Client Data",
@@ -257,3 +540,77 @@ async def api_delete_client_data(
 
     await delete_client_data(shop.id, client_data_id)
     return SimpleStatus(success=True, message="Client Data Deleted")
+
+
+############################# Maintenance #############################
+@webshop_api_router.post(
+    "/api/v1/maintenance/purge",
+    name="Purge Orphaned Client Data",
+    summary="Delete the client_data and items left behind by deleted shops.",
+    response_description="The number of deleted rows.",
+    response_model=PurgeResult,
+    dependencies=[Depends(check_admin)],
+)
+async def api_purge_orphaned_client_data() -> PurgeResult:
+    client_data, order_items = await purge_orphaned_client_data()
+    return PurgeResult(client_data=client_data, order_items=order_items)
+
+
+@webshop_api_router.post(
+    "/api/v1/maintenance/expired",
+    name="Delete Expired Client Data",
+    summary="Delete the unpaid client_data older than max_age seconds, at least the invoice expiry.",
+    response_description="The number of deleted client_data.",
+    response_model=ExpiredOrdersResult,
+    dependencies=[Depends(check_admin)],
+)
+async def api_delete_expired_client_data(
+    max_age: int = Query(UNPAID_ORDER_MAX_AGE, ge=0),
+) -> ExpiredOrdersResult:
+    return ExpiredOrdersResult(client_data=await delete_expired_orders(max_age))
+
+
+@webshop_api_router.post(
+    "/api/v1/maintenance/stats/rebuild",
+    name="Rebuild Stats",
+    summary="Recompute the stats of every shop from the orders.",
+    response_description="The number of shops with stats.",
+    response_model=RebuildStatsResult,
+    dependencies=[Depends(check_admin)],
+)
+async def api_rebuild_stats() -> RebuildStatsResult:
+    return RebuildStatsResult(shops=await rebuild_shop_stats())
+
+
+@webshop_api_router.get(
+    "/api/v1/metrics",
+    name="Metrics",
+    summary="Latencies, settlement, admission and cache metrics in the Prometheus text format.",
+    response_class=Response,
+    dependencies=[Depends(check_admin)],
+)
+async def api_metrics() -> Response:
+    settlement = settlement_metrics.snapshot()
+    settlement_queue_depth.set(settlement["queue_depth"])
+    settlement_payments.set(settlement["payments"])
+    settlement_errors.set(settlement["errors"])
+    totals = checkout_admission.totals()
+    checkouts.set(totals.admitted, "admitted")
+    checkouts.set(totals.rate_limited, "rate_limited")
+    checkouts.set(totals.overloaded, "overloaded")
+    checkouts_in_flight.set(totals.in_flight)
+    stock_reservations.expire()
+    stock_reservations_held.set(len(stock_reservations))
+    caches = {
+        "shop": shop_cache,
+        "catalog": catalog_cache,
+        "checkout": checkout_cache,
+        "page": page_cache,
+        "price_index": price_indexes,
+        "rate": rate_cache,
+    }
+    for name, cache in caches.items():
+        cache_entries.set(len(cache), name)
+        cache_requests.set(cache.hits, name, "hit")
+        cache_requests.set(cache.misses, name, "miss")
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")